@@ -1,9 +1,9 @@
 import os
-import bcrypt
 from datetime import datetime, timedelta
 from typing import Optional
 
-from jose import JWTError, jwt
+# bcrypt и jose импортируются внутри функций: они нужны только при первом
+# логине/запросе, а не при старте процесса
 
 SECRET_KEY = os.getenv("JWT_SECRET", "keitering-super-secret-2024-key")
 ALGORITHM = "HS256"
@@ -12,6 +12,7 @@ ACCESS_TOKEN_EXPIRE_DAYS = 7
 
 def hash_password(password: str) -> str:
     """Хэшируем пароль через bcrypt напрямую (совместимо с Python 3.14)"""
+    import bcrypt
     salt = bcrypt.gensalt()
     hashed = bcrypt.hashpw(password.encode("utf-8"), salt)
     return hashed.decode("utf-8")
@@ -19,16 +20,19 @@ def hash_password(password: str) -> str:
 
 def verify_password(plain: str, hashed: str) -> bool:
     """Проверяем пароль"""
+    import bcrypt
     return bcrypt.checkpw(plain.encode("utf-8"), hashed.encode("utf-8"))
 
 
 def create_access_token(user_id: int, email: str) -> str:
+    from jose import jwt
     expire = datetime.utcnow() + timedelta(days=ACCESS_TOKEN_EXPIRE_DAYS)
     payload = {"sub": str(user_id), "email": email, "exp": expire}
     return jwt.encode(payload, SECRET_KEY, algorithm=ALGORITHM)
 
 
 def decode_token(token: str) -> Optional[dict]:
+    from jose import JWTError, jwt
     try:
         return jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
     except JWTError:
@@ -0,0 +1,206 @@
+import hashlib
+import threading
+import zlib
+from collections import OrderedDict
+from typing import Dict, Iterable
+
+from sqlalchemy import select, text
+from sqlalchemy.dialects.sqlite import insert
+
+from .database import LetterBody
+
+# ─────────────────────────────────────────────
+# Хранилище текстов писем: адресация по содержимому + сжатие
+#
+# Текст письма хранится один раз в letter_bodies под своим sha256; компания,
+# сообщение чата и outbox ссылаются на него хэшем. Письма одного шаблона
+# отличаются парой слов, поэтому zlib работает с заранее заданным словарём
+# (zdict) из типовых фраз — короткое письмо сжимается в десятки байт.
+# Распаковка — только когда текст действительно нужен: показ, отправка.
+# ─────────────────────────────────────────────
+
+# Первый байт блоба — версия формата. Словарь версии нельзя менять: им сжаты
+# уже сохранённые письма. Новый словарь — новая версия.
+_FORMAT_ZDICT_V1 = 1
+_ZDICT_V1 = """Добрый день, компания , к вам обращается компания «Сибирский кедр».
+
+Мы производим натуральную эко-продукцию из Сибири и хотим предложить вам сотрудничество при организации ваших мероприятий и фуршетов.
+
+Наши популярные позиции:
+- Кедровые орехи очищенные (500г) (1200 руб.)
+- Кедровое масло холодного отжима (250мл) (950 руб.)
+- Варенье из сосновых шишек (300г) (450 руб.)
+- Мармелад с кедровым орехом Ассорти (350 руб.)
+- Кедровый грильяж в шоколаде (550 руб.)
+
+Полный ассортимент вы можете найти на нашем сайте siberia.eco, а также в приложенном PDF-каталоге.
+Более подробная информация и полный ассортимент находятся в приложенном PDF-файле.
+
+Будем рады обсудить специальные оптовые условия для вашей компании. Ответьте на это письмо, если предложение вам интересно.
+Будем рады созвониться и обсудить возможное сотрудничество.
+
+С уважением,
+Команда Сибирского кедра""".encode("utf-8")
+
+_CACHE_SIZE = 256             # распакованных текстов в памяти (тексты неизменяемы)
+_cache: "OrderedDict[str, str]" = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def body_hash(body: str) -> str:
+    return hashlib.sha256(body.encode("utf-8")).hexdigest()
+
+
+def compress(body: str) -> bytes:
+    packer = zlib.compressobj(9, zdict=_ZDICT_V1)
+    return bytes([_FORMAT_ZDICT_V1]) + packer.compress(body.encode("utf-8")) + packer.flush()
+
+
+def decompress(data: bytes) -> str:
+    if data[0] != _FORMAT_ZDICT_V1:
+        raise ValueError(f"Неизвестный формат текста письма: {data[0]}")
+    unpacker = zlib.decompressobj(zdict=_ZDICT_V1)
+    return (unpacker.decompress(data[1:]) + unpacker.flush()).decode("utf-8")
+
+
+def put(db, body: str) -> str:
+    """Сохраняет текст (если такого ещё нет) и возвращает его хэш. db — Session
+    или Connection; запись попадает в текущую транзакцию. Пустой текст — ""."""
+    if not body:
+        return ""
+    digest = body_hash(body)
+    data = compress(body)
+    db.execute(
+        insert(LetterBody)
+        .values(hash=digest, data=data, size=len(body))
+        .on_conflict_do_nothing(index_elements=["hash"])
+    )
+    return digest
+
+
+def get_many(db, hashes: Iterable[str]) -> Dict[str, str]:
+    """Тексты по хэшам одним запросом: {хэш: текст}."""
+    result: Dict[str, str] = {}
+    missing = []
+    with _cache_lock:
+        for digest in set(hashes):
+            if not digest:
+                continue
+            if digest in _cache:
+                _cache.move_to_end(digest)
+                result[digest] = _cache[digest]
+            else:
+                missing.append(digest)
+    if missing:
+        rows = db.execute(select(LetterBody.hash, LetterBody.data).where(LetterBody.hash.in_(missing))).all()
+        loaded = {digest: decompress(data) for digest, data in rows}
+        result.update(loaded)
+        with _cache_lock:
+            _cache.update(loaded)
+            while len(_cache) > _CACHE_SIZE:
+                _cache.popitem(last=False)
+    return result
+
+
+def get(db, digest: str) -> str:
+    if not digest:
+        return ""
+    return get_many(db, [digest]).get(digest, "")
+
+
+# ── Перенос старых данных ──
+
+_LETTER_PREFIX = "📧 **Тема:** "
+_BATCH = 1000
+
+
+def _columns(conn, table: str) -> set:
+    return {row[1] for row in conn.execute(text(f"PRAGMA table_info({table})"))}
+
+
+def _move_column(conn, table: str, legacy: str, ref: str) -> int:
+    """Тексты из старой колонки legacy — в хранилище, ссылка — в ref."""
+    if legacy not in _columns(conn, table):
+        return 0
+    moved = 0
+    while True:
+        rows = conn.execute(text(
+            f"SELECT id, {legacy} FROM {table} WHERE {legacy} IS NOT NULL AND {legacy} != '' LIMIT {_BATCH}"
+        )).all()
+        if not rows:
+            return moved
+        conn.execute(
+            text(f"UPDATE {table} SET {ref} = :ref, {legacy} = NULL WHERE id = :id"),
+            [{"id": row_id, "ref": put(conn, body)} for row_id, body in rows],
+        )
+        moved += len(rows)
+
+
+def _split_letter_messages(conn) -> int:
+    """Сообщения чата с письмом («📧 Тема + текст») — заголовок остаётся в
+    text (его индексирует полнотекстовый поиск), текст письма — в хранилище."""
+    moved = 0
+    last_id = 0
+    while True:
+        rows = conn.execute(text(
+            "SELECT id, text FROM chat_messages WHERE id > :last AND (body_hash IS NULL OR body_hash = '') "
+            "AND direction = 'outgoing' AND substr(text, 1, :n) = :prefix ORDER BY id LIMIT :batch"
+        ), {"last": last_id, "n": len(_LETTER_PREFIX), "prefix": _LETTER_PREFIX, "batch": _BATCH}).all()
+        if not rows:
+            return moved
+        last_id = rows[-1][0]
+        updates = []
+        for row_id, message in rows:
+            header, sep, body = message.partition("\n\n")
+            if sep and body:
+                updates.append({"id": row_id, "text": header, "ref": put(conn, body)})
+        if updates:
+            conn.execute(text("UPDATE chat_messages SET text = :text, body_hash = :ref WHERE id = :id"), updates)
+        moved += len(updates)
+
+
+# Перенос однократный: отметка версии в schema_migrations, чтобы не
+# сканировать таблицы на каждом старте
+_MIGRATION = "letter_bodies_v1"
+_MIGRATIONS_DDL = "CREATE TABLE IF NOT EXISTS schema_migrations (name TEXT PRIMARY KEY, applied_at TEXT NOT NULL)"
+
+
+def migrate_legacy_bodies(engine) -> int:
+    """Переносит тексты писем из старых колонок в хранилище. Выполняется
+    один раз на БД; возвращает число перенесённых текстов."""
+    with engine.begin() as conn:
+        conn.execute(text(_MIGRATIONS_DDL))
+        applied = conn.execute(
+            text("SELECT 1 FROM schema_migrations WHERE name = :name"), {"name": _MIGRATION},
+        ).first()
+        if applied:
+            return 0
+        moved = _move_column(conn, "companies", "email_body", "email_body_hash")
+        moved += _move_column(conn, "outbox", "body", "body_hash")
+        moved += _split_letter_messages(conn)
+        # OR IGNORE: два воркера могли стартовать одновременно — перенос
+        # идемпотентен, отметка одна
+        conn.execute(text(
+            "INSERT OR IGNORE INTO schema_migrations (name, applied_at) "
+            "VALUES (:name, strftime('%Y-%m-%d %H:%M:%f', 'now'))"
+        ), {"name": _MIGRATION})
+    if moved:
+        print(f"[Bodies] В хранилище писем перенесено текстов: {moved}. "
+              f"Место в keitering.db освободит VACUUM")
+    return moved
+
+
+def collect_orphans(engine) -> int:
+    """Удаляет тексты, на которые больше никто не ссылается. Полный проход
+    по ссылкам под блокировкой записи — поэтому не при старте, а вручную
+    (maintenance.py gc-bodies)."""
+    with engine.begin() as conn:
+        orphans = conn.execute(text(
+            "DELETE FROM letter_bodies WHERE hash NOT IN ("
+            "SELECT email_body_hash FROM companies WHERE email_body_hash IS NOT NULL "
+            "UNION SELECT body_hash FROM chat_messages WHERE body_hash IS NOT NULL "
+            "UNION SELECT body_hash FROM outbox WHERE body_hash IS NOT NULL)"
+        )).rowcount
+    if orphans:
+        print(f"[Bodies] Удалено текстов без ссылок: {orphans}")
+    return orphans
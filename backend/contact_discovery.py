@@ -0,0 +1,183 @@
+import re
+from html.parser import HTMLParser
+from typing import List, Tuple
+from urllib.parse import urljoin, urlsplit, unquote
+
+# Сколько страниц-кандидатов реально загружать после ранжирования
+MAX_CONTACT_PAGES = 2
+# Ограничение на количество ссылок/URL, которые разбираем с одной страницы
+_MAX_LINKS = 500
+
+# Токены в тексте ссылки или в URL и их вес
+_STRONG_TOKENS = (
+    "контакт", "contact", "kontakt", "kontakty", "связаться", "svyaz", "обратная связь",
+)
+_MEDIUM_TOKENS = (
+    "о компании", "о нас", "about", "o-kompanii", "o-nas", "о-компании", "company",
+    "реквизит", "rekvizit", "requisites", "где купить", "адрес", "address", "офис", "office",
+)
+# Разделы, где контактов почти никогда нет
+_NOISE_TOKENS = (
+    "news", "новост", "blog", "блог", "article", "стать", "catalog", "каталог",
+    "product", "товар", "cart", "корзин", "login", "вход", "tag", "page=",
+)
+_SKIP_EXTENSIONS = (
+    ".pdf", ".jpg", ".jpeg", ".png", ".gif", ".svg", ".webp", ".zip", ".rar",
+    ".doc", ".docx", ".xls", ".xlsx", ".mp4", ".css", ".js",
+)
+_LOC_REGEX = re.compile(r"<loc>\s*([^<\s]+)\s*</loc>", re.IGNORECASE)
+
+# Российские номера: +7 / 8, код из 3–5 цифр, всего 10 цифр после +7
+_PHONE_REGEX = re.compile(r"(?<![\d+])((?:\+7|8)[\s\-\u00a0]*\(?\d{3,5}\)?(?:[\s\-\u00a0]*\d){5,7})(?!\d)")
+# Длина кода видна, только если он в скобках или отделён от номера:
+# «(3822) 12-34-56», «8 3822 12 34 56». Слитно («84951234567») — код из 3 цифр
+_PHONE_CODE_REGEX = re.compile(r"(?:\+7|8)[\s\-\u00a0]*(?:\((\d{3,5})\)|(\d{3,5})[\s\-\u00a0])")
+_TEL_HREF_REGEX = re.compile(r"""href\s*=\s*["']tel:([^"']+)["']""", re.IGNORECASE)
+# Адрес из разметки schema.org (JSON-LD или microdata)
+_JSONLD_ADDRESS_REGEX = re.compile(r'"(streetAddress|addressLocality)"\s*:\s*"([^"]{2,150})"')
+_ITEMPROP_ADDRESS_REGEX = re.compile(
+    r"""itemprop\s*=\s*["'](streetAddress|addressLocality)["'][^>]*>([^<]{2,150})<""", re.IGNORECASE,
+)
+# Адрес в тексте: «г. Томск, ул. Ленина, 15» / «Москва, пр-т Мира, д. 3»
+_TEXT_ADDRESS_REGEX = re.compile(
+    r"(?:(?:г\.|город)\s*)?[А-ЯЁ][а-яё\-]{2,30},\s*"
+    r"(?:ул\.|улица|пр-т|просп\.|проспект|пер\.|переулок|ш\.|шоссе|наб\.|набережная|б-р|бульвар|пл\.|площадь)"
+    r"\s*[А-ЯЁа-яё0-9][^<>\n;]{1,60}?\d+[а-яА-Я]?(?:/\d+)?"
+)
+_TAG_REGEX = re.compile(r"<[^>]+>")
+
+
+class _LinkParser(HTMLParser):
+    """Собирает пары (href, текст ссылки) из HTML."""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.links: List[Tuple[str, str]] = []
+        self._href = None
+        self._text: List[str] = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag != "a" or len(self.links) >= _MAX_LINKS:
+            return
+        attrs = dict(attrs)
+        self._href = attrs.get("href")
+        self._text = [attrs.get("title") or ""]
+
+    def handle_data(self, data):
+        if self._href is not None:
+            self._text.append(data)
+
+    def handle_endtag(self, tag):
+        if tag == "a" and self._href is not None:
+            self.links.append((self._href, " ".join(" ".join(self._text).split())))
+            self._href = None
+
+
+def _host(url: str) -> str:
+    host = urlsplit(url).netloc.lower().split(":", 1)[0]
+    return host[4:] if host.startswith("www.") else host
+
+
+def extract_links(html: str, base_url: str) -> List[Tuple[str, str]]:
+    """Абсолютные ссылки на страницы того же сайта: [(url, текст ссылки)]."""
+    parser = _LinkParser()
+    try:
+        parser.feed(html)
+        parser.close()
+    except Exception:
+        pass  # Битый HTML — берём то, что успели разобрать
+    base_host = _host(base_url)
+    links = []
+    for href, text in parser.links:
+        href = (href or "").strip()
+        if not href or href.startswith(("#", "mailto:", "tel:", "javascript:")):
+            continue
+        url = urljoin(base_url, href).split("#", 1)[0]
+        if url.startswith(("http://", "https://")) and _host(url) == base_host:
+            links.append((url, text))
+    return links
+
+
+def score_candidate(url: str, text: str = "") -> int:
+    """Оценка «похожести» страницы на контактную. 0 — не кандидат."""
+    parts = urlsplit(url)
+    path = unquote(parts.path).lower()
+    if path.endswith(_SKIP_EXTENSIONS) or path in ("", "/"):
+        return 0
+    haystack = f"{text.lower()} {path.replace('-', ' ').replace('_', ' ')} {path}"
+    score = 0
+    if any(t in haystack for t in _STRONG_TOKENS):
+        score += 10
+    if any(t in haystack for t in _MEDIUM_TOKENS):
+        score += 4
+    if score == 0:
+        return 0
+    if any(t in haystack for t in _NOISE_TOKENS):
+        score -= 5
+    if parts.query:
+        score -= 2
+    # Короткий путь (/contacts) надёжнее глубокого (/a/b/c/contacts)
+    score -= max(path.strip("/").count("/"), 0)
+    return max(score, 0)
+
+
+def rank_contact_pages(links: List[Tuple[str, str]], exclude: str = "", limit: int = MAX_CONTACT_PAGES) -> List[str]:
+    """Лучшие кандидаты на контактную страницу, по убыванию оценки."""
+    best = {}
+    exclude = exclude.rstrip("/")
+    for url, text in links:
+        key = url.rstrip("/")
+        if key == exclude:
+            continue
+        score = score_candidate(url, text)
+        if score > best.get(key, (0, ""))[0]:
+            best[key] = (score, url)
+    ranked = sorted(best.values(), key=lambda item: (-item[0], len(item[1])))
+    return [url for _, url in ranked[:limit]]
+
+
+def parse_sitemap(xml: str) -> List[str]:
+    """URL из sitemap.xml (и из индекса sitemap — ссылки на дочерние файлы)."""
+    return _LOC_REGEX.findall(xml)[:_MAX_LINKS * 10]
+
+
+def _code_length(raw: str) -> int:
+    match = _PHONE_CODE_REGEX.match(raw.strip())
+    return len(match.group(1) or match.group(2)) if match else 3
+
+
+def _format_phone(raw: str) -> str:
+    code_len = _code_length(raw)
+    digits = re.sub(r"\D", "", raw)
+    if len(digits) == 11 and digits[0] in "78":
+        digits = digits[1:]
+    if len(digits) != 10:
+        return ""
+    code, rest = digits[:code_len], digits[code_len:]
+    head = len(rest) - 4
+    return f"+7 ({code}) {rest[:head]}-{rest[head:head + 2]}-{rest[head + 2:]}"
+
+
+def extract_phones(html: str) -> List[str]:
+    """Телефоны со страницы в виде «+7 (495) 123-45-67»: сначала ссылки tel:,
+    затем номера в тексте."""
+    found = _TEL_HREF_REGEX.findall(html) + _PHONE_REGEX.findall(_TAG_REGEX.sub(" ", html))
+    phones = []
+    for raw in found:
+        phone = _format_phone(raw)
+        if phone and phone not in phones:
+            phones.append(phone)
+    return phones
+
+
+def extract_address(html: str) -> str:
+    """Адрес организации: из разметки schema.org, иначе первый похожий на
+    адрес фрагмент текста. "" — не нашли."""
+    for regex in (_JSONLD_ADDRESS_REGEX, _ITEMPROP_ADDRESS_REGEX):
+        parts = dict((key, " ".join(value.split())) for key, value in regex.findall(html))
+        if parts.get("streetAddress"):
+            locality = parts.get("addressLocality", "")
+            street = parts["streetAddress"]
+            return f"{locality}, {street}" if locality and locality not in street else street
+    match = _TEXT_ADDRESS_REGEX.search(" ".join(_TAG_REGEX.sub(" ", html).split()))
+    return match.group(0).strip() if match else ""
@@ -0,0 +1,343 @@
+import os
+import json
+import time
+import uuid
+import asyncio
+import sqlite3
+import threading
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+# ─────────────────────────────────────────────
+# Общее состояние воркеров: TTL-кэш, счётчики, блокировки, семафоры
+#
+# Поиск, парсинг и отправка держат кэши и лимиты здесь, а не в глобальных
+# переменных модулей. Бэкенд выбирается через COORDINATION_BACKEND:
+#   memory — в памяти процесса (по умолчанию, один воркер uvicorn);
+#   sqlite — файл SQLite в режиме WAL, общий для всех воркеров на машине.
+# Значения кэша должны сериализоваться в JSON.
+# ─────────────────────────────────────────────
+
+_DEFAULT_SQLITE_PATH = Path(__file__).parent.parent / "coordination.sqlite3"
+_POLL_INTERVAL = 0.05          # сек: первый опрос занятой блокировки (sqlite)
+_MAX_POLL_INTERVAL = 1.0       # сек: до скольких растёт пауза между опросами
+_MEMORY_CACHE_SIZE = 10000
+_PURGE_EVERY = 500             # записей между чистками просроченного в sqlite
+
+
+class MemoryBackend:
+    """Всё в словарях процесса; ожидание блокировок — через asyncio.Event."""
+
+    name = "memory"
+
+    def __init__(self, cache_size: int = _MEMORY_CACHE_SIZE):
+        self._cache: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self._cache_size = cache_size
+        self._counters: Dict[str, Tuple[float, int]] = {}
+        self._locks: Dict[str, Tuple[float, str]] = {}
+        self._slots: Dict[str, Dict[str, float]] = {}
+        self._released: Dict[str, asyncio.Event] = {}
+
+    async def get(self, key: str) -> Any:
+        item = self._cache.get(key)
+        if item is None:
+            return None
+        if item[0] < time.time():
+            del self._cache[key]
+            return None
+        self._cache.move_to_end(key)
+        return item[1]
+
+    async def set(self, key: str, value: Any, ttl: float):
+        self._cache[key] = (time.time() + ttl, value)
+        self._cache.move_to_end(key)
+        while len(self._cache) > self._cache_size:
+            self._cache.popitem(last=False)
+
+    async def delete(self, key: str):
+        self._cache.pop(key, None)
+
+    async def incr(self, key: str, amount: int = 1, ttl: Optional[float] = None) -> int:
+        now = time.time()
+        expires, value = self._counters.get(key, (0.0, 0))
+        if expires and expires < now:
+            expires, value = 0.0, 0
+        if not expires:
+            expires = now + ttl if ttl else float("inf")
+        value += amount
+        self._counters[key] = (expires, value)
+        return value
+
+    async def try_lock(self, name: str, ttl: float) -> Optional[str]:
+        now = time.time()
+        held = self._locks.get(name)
+        if held and held[0] >= now:
+            return None
+        token = uuid.uuid4().hex
+        self._locks[name] = (now + ttl, token)
+        return token
+
+    async def unlock(self, name: str, token: str):
+        held = self._locks.get(name)
+        if held and held[1] == token:
+            del self._locks[name]
+        self._notify(name)
+
+    async def try_acquire_slot(self, name: str, limit: int, ttl: float) -> Optional[str]:
+        now = time.time()
+        slots = self._slots.setdefault(name, {})
+        for token in [t for t, expires in slots.items() if expires < now]:
+            del slots[token]
+        if len(slots) >= limit:
+            return None
+        token = uuid.uuid4().hex
+        slots[token] = now + ttl
+        return token
+
+    async def release_slot(self, name: str, token: str):
+        self._slots.get(name, {}).pop(token, None)
+        self._notify(name)
+
+    def _notify(self, name: str):
+        event = self._released.pop(name, None)
+        if event is not None:
+            event.set()
+
+    async def wait_released(self, name: str, timeout: float):
+        event = self._released.setdefault(name, asyncio.Event())
+        try:
+            await asyncio.wait_for(event.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+
+_SQLITE_SCHEMA = [
+    "CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)",
+    "CREATE TABLE IF NOT EXISTS counters (key TEXT PRIMARY KEY, value INTEGER NOT NULL, expires_at REAL NOT NULL)",
+    "CREATE TABLE IF NOT EXISTS locks (name TEXT PRIMARY KEY, token TEXT NOT NULL, expires_at REAL NOT NULL)",
+    "CREATE TABLE IF NOT EXISTS slots (name TEXT NOT NULL, token TEXT NOT NULL, expires_at REAL NOT NULL, "
+    "PRIMARY KEY (name, token))",
+]
+
+
+class SQLiteBackend:
+    """Файл SQLite (WAL), общий для процессов одной машины. Каждая операция —
+    короткая транзакция в потоке; чтение-изменение-запись — под BEGIN IMMEDIATE."""
+
+    name = "sqlite"
+
+    def __init__(self, path: Optional[Path] = None):
+        self.path = path or Path(os.getenv("COORDINATION_DB", str(_DEFAULT_SQLITE_PATH)))
+        self._local = threading.local()
+        self._writes = 0
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.path, isolation_level=None, timeout=5)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            for stmt in _SQLITE_SCHEMA:
+                conn.execute(stmt)
+            self._local.conn = conn
+        return conn
+
+    def _write(self, fn: Callable[[sqlite3.Connection, float], Any]) -> Any:
+        conn = self._conn()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            result = fn(conn, now)
+            self._writes += 1
+            if self._writes % _PURGE_EVERY == 0:
+                for table in ("cache", "counters", "locks", "slots"):
+                    conn.execute(f"DELETE FROM {table} WHERE expires_at < ?", (now,))
+            conn.execute("COMMIT")
+            return result
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _run(self, fn: Callable[[sqlite3.Connection, float], Any]):
+        return asyncio.to_thread(self._write, fn)
+
+    async def get(self, key: str) -> Any:
+        def op(conn, now):
+            row = conn.execute(
+                "SELECT value FROM cache WHERE key = ? AND expires_at >= ?", (key, now),
+            ).fetchone()
+            return row[0] if row else None
+        raw = await asyncio.to_thread(lambda: op(self._conn(), time.time()))
+        return json.loads(raw) if raw is not None else None
+
+    async def set(self, key: str, value: Any, ttl: float):
+        raw = json.dumps(value, ensure_ascii=False)
+        await self._run(lambda conn, now: conn.execute(
+            "INSERT OR REPLACE INTO cache (key, value, expires_at) VALUES (?, ?, ?)", (key, raw, now + ttl),
+        ))
+
+    async def delete(self, key: str):
+        await self._run(lambda conn, now: conn.execute("DELETE FROM cache WHERE key = ?", (key,)))
+
+    async def incr(self, key: str, amount: int = 1, ttl: Optional[float] = None) -> int:
+        def op(conn, now):
+            row = conn.execute("SELECT value, expires_at FROM counters WHERE key = ?", (key,)).fetchone()
+            if row is None or row[1] < now:
+                value, expires = amount, (now + ttl if ttl else float("inf"))
+            else:
+                value, expires = row[0] + amount, row[1]
+            conn.execute(
+                "INSERT OR REPLACE INTO counters (key, value, expires_at) VALUES (?, ?, ?)", (key, value, expires),
+            )
+            return value
+        return await self._run(op)
+
+    async def try_lock(self, name: str, ttl: float) -> Optional[str]:
+        token = uuid.uuid4().hex
+
+        def op(conn, now):
+            conn.execute("DELETE FROM locks WHERE name = ? AND expires_at < ?", (name, now))
+            cur = conn.execute(
+                "INSERT OR IGNORE INTO locks (name, token, expires_at) VALUES (?, ?, ?)", (name, token, now + ttl),
+            )
+            return token if cur.rowcount else None
+        return await self._run(op)
+
+    async def unlock(self, name: str, token: str):
+        await self._run(lambda conn, now: conn.execute(
+            "DELETE FROM locks WHERE name = ? AND token = ?", (name, token),
+        ))
+
+    async def try_acquire_slot(self, name: str, limit: int, ttl: float) -> Optional[str]:
+        token = uuid.uuid4().hex
+
+        def op(conn, now):
+            conn.execute("DELETE FROM slots WHERE name = ? AND expires_at < ?", (name, now))
+            (taken,) = conn.execute("SELECT COUNT(*) FROM slots WHERE name = ?", (name,)).fetchone()
+            if taken >= limit:
+                return None
+            conn.execute("INSERT INTO slots (name, token, expires_at) VALUES (?, ?, ?)", (name, token, now + ttl))
+            return token
+        return await self._run(op)
+
+    async def release_slot(self, name: str, token: str):
+        await self._run(lambda conn, now: conn.execute(
+            "DELETE FROM slots WHERE name = ? AND token = ?", (name, token),
+        ))
+
+    def _holders(self, name: str):
+        """Кто сейчас держит блокировку и слоты name — только чтение, без
+        BEGIN IMMEDIATE, чтобы ожидание не мешало записям других процессов."""
+        return self._conn().execute(
+            "SELECT (SELECT token FROM locks WHERE name = ?1 AND expires_at >= ?2), "
+            "(SELECT group_concat(token) FROM slots WHERE name = ?1 AND expires_at >= ?2)",
+            (name, time.time()),
+        ).fetchone()
+
+    async def wait_released(self, name: str, timeout: float):
+        # Освобождение в другом процессе не увидеть иначе, чем опросом.
+        # Опрашиваем чтением с растущей паузой и возвращаемся, когда набор
+        # владельцев сменился, — тогда вызывающий снова пробует взять
+        deadline = time.monotonic() + timeout
+        holders = await asyncio.to_thread(self._holders, name)
+        interval = _POLL_INTERVAL
+        while True:
+            left = deadline - time.monotonic()
+            if left <= 0:
+                return
+            await asyncio.sleep(min(interval, left))
+            if await asyncio.to_thread(self._holders, name) != holders:
+                return
+            interval = min(interval * 2, _MAX_POLL_INTERVAL)
+
+
+_backend = None
+
+
+def get_backend():
+    """Бэкенд по COORDINATION_BACKEND; создаётся при первом обращении, когда
+    Credentials.env уже загружен."""
+    global _backend
+    if _backend is None:
+        kind = os.getenv("COORDINATION_BACKEND", "memory").lower()
+        if kind == "sqlite":
+            _backend = SQLiteBackend()
+        else:
+            if kind != "memory":
+                print(f"[WARN] Неизвестный COORDINATION_BACKEND={kind}, используется memory")
+            _backend = MemoryBackend()
+        print(f"[Coordination] Бэкенд: {_backend.name}")
+    return _backend
+
+
+def set_backend(backend):
+    """Подменить бэкенд (скрипты, проверка нескольких воркеров)."""
+    global _backend
+    _backend = backend
+
+
+# ── Примитивы поверх бэкенда ──
+
+@asynccontextmanager
+async def lock(name: str, ttl: float = 60, wait: bool = True):
+    """Блокировка с арендой ttl сек. wait=False — не ждать: внутри блока
+    получаем False, если её уже держит кто-то другой."""
+    backend = get_backend()
+    token = await backend.try_lock(name, ttl)
+    while token is None and wait:
+        await backend.wait_released(name, ttl)
+        token = await backend.try_lock(name, ttl)
+    try:
+        yield token is not None
+    finally:
+        if token is not None:
+            await backend.unlock(name, token)
+
+
+@asynccontextmanager
+async def semaphore(name: str, limit: int, ttl: float = 300):
+    """Не больше limit одновременных владельцев на все воркеры. Слот сам
+    освобождается через ttl сек, если процесс-владелец упал."""
+    backend = get_backend()
+    token = await backend.try_acquire_slot(name, limit, ttl)
+    while token is None:
+        await backend.wait_released(name, ttl)
+        token = await backend.try_acquire_slot(name, limit, ttl)
+    try:
+        yield
+    finally:
+        await backend.release_slot(name, token)
+
+
+async def cached(key: str, ttl: float, loader: Callable[[], Awaitable[Any]], load_ttl: float = 120) -> Any:
+    """Значение из кэша или loader(). Одновременные промахи по одному ключу
+    (в том числе из разных воркеров) загружают значение один раз."""
+    backend = get_backend()
+    value = await backend.get(key)
+    if value is not None:
+        return value
+    async with lock(f"load:{key}", ttl=load_ttl):
+        value = await backend.get(key)
+        if value is not None:
+            return value
+        value = await loader()
+        if value is not None:
+            await backend.set(key, value, ttl)
+        return value
+
+
+async def throttle(key: str, limit: int, window: float):
+    """Ждёт, пока в текущем окне window сек не останется места: не больше
+    limit вызовов на окно для всех воркеров."""
+    if limit <= 0:
+        return
+    backend = get_backend()
+    while True:
+        now = time.time()
+        slot = int(now // window)
+        if await backend.incr(f"rate:{key}:{slot}", ttl=window * 2) <= limit:
+            return
+        await asyncio.sleep((slot + 1) * window - now)
@@ -1,11 +1,11 @@
 import os
-from sqlalchemy import create_engine, Column, Integer, String, Text, DateTime, ForeignKey, Boolean
-from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker, relationship
+from sqlalchemy import create_engine, Column, Integer, String, Text, DateTime, ForeignKey, Boolean, Float, Index, LargeBinary, inspect, text
+from sqlalchemy.orm import sessionmaker, relationship, declarative_base
 from datetime import datetime
 from pathlib import Path
 
-DB_PATH = Path(__file__).parent.parent / "keitering.db"
+# DATABASE_PATH — другой файл БД (тесты, второй экземпляр приложения)
+DB_PATH = Path(os.getenv("DATABASE_PATH", str(Path(__file__).parent.parent / "keitering.db")))
 DATABASE_URL = f"sqlite:///{DB_PATH}"
 
 engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
@@ -41,11 +41,18 @@ class Company(Base):
     # Статусы: new → email_sent → replied → in_progress | interested | rejected | closed
     status = Column(String(50), default="new")
     email_subject = Column(String(500), default="")
-    email_body = Column(Text, default="")
+    email_body_hash = Column(String(64), default="")  # текст письма — в letter_bodies (body_store)
     reply_text = Column(Text, default="")
     created_at = Column(DateTime, default=datetime.utcnow)
     email_sent_at = Column(DateTime, nullable=True)
     replied_at = Column(DateTime, nullable=True)
+    # Проверка доставляемости email: deliverable | undeliverable | unknown ("" — не проверяли)
+    email_verdict = Column(String(20), default="")
+    email_verdict_reason = Column(String(50), default="")
+    email_checked_at = Column(DateTime, nullable=True)
+    # Фоновое дообогащение контактов (enrichment): число попыток и время последней
+    enrich_attempts = Column(Integer, default=0)
+    enriched_at = Column(DateTime, nullable=True)
 
     owner = relationship("User", back_populates="companies")
     messages = relationship("ChatMessage", back_populates="company", order_by="ChatMessage.created_at")
@@ -59,13 +66,105 @@ class ChatMessage(Base):
     direction = Column(String(20), nullable=False)  # "outgoing" | "incoming"
     author = Column(String(255), default="")        # имя отправителя
     text = Column(Text, nullable=False)
+    body_hash = Column(String(64), default="")      # письмо: в text — тема, текст — в letter_bodies
     created_at = Column(DateTime, default=datetime.utcnow)
 
     company = relationship("Company", back_populates="messages")
 
+    # Переписка читается страницами по компании в порядке времени
+    __table_args__ = (Index("ix_chat_messages_company_created", "company_id", "created_at"),)
+
+
+class OutboxMessage(Base):
+    """Письмо, которое не удалось отправить сразу: очередь повторов."""
+    __tablename__ = "outbox"
+
+    id = Column(Integer, primary_key=True, index=True)
+    owner_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    company_id = Column(Integer, ForeignKey("companies.id"), nullable=False, index=True)
+    to_email = Column(String(255), nullable=False)
+    from_email = Column(String(255), default="")
+    author = Column(String(255), default="")        # имя отправителя для чата
+    subject = Column(String(500), default="")
+    body_hash = Column(String(64), default="")      # текст — в letter_bodies
+    attachment_path = Column(String(500), default="")
+    # Статусы: pending → sending → sent | dead
+    state = Column(String(20), default="pending")
+    attempts = Column(Integer, default=0)
+    next_attempt_at = Column(DateTime, default=datetime.utcnow)
+    last_error = Column(String(500), default="")
+    created_at = Column(DateTime, default=datetime.utcnow)
+    sent_at = Column(DateTime, nullable=True)
+
+    __table_args__ = (Index("ix_outbox_state_next_attempt", "state", "next_attempt_at"),)
+
+
+class LetterBody(Base):
+    """Сжатый текст письма, адресуемый sha256 содержимого (см. body_store)."""
+    __tablename__ = "letter_bodies"
+
+    hash = Column(String(64), primary_key=True)
+    data = Column(LargeBinary, nullable=False)
+    size = Column(Integer, default=0)               # длина текста в символах
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+
+class HostProfile(Base):
+    """История парсинга сайта: по ней планируется следующий обход хоста."""
+    __tablename__ = "host_profiles"
+
+    host = Column(String(255), primary_key=True)
+    visits = Column(Integer, default=0)
+    productive_visits = Column(Integer, default=0)   # визиты, на которых нашёлся email
+    empty_streak = Column(Integer, default=0)        # визитов подряд без email
+    emails_found = Column(Integer, default=0)
+    pages_fetched = Column(Integer, default=0)
+    email_path = Column(String(500), default="")     # путь страницы, где email нашёлся в прошлый раз
+    avg_latency = Column(Float, default=0.0)         # сек на страницу, скользящее среднее
+    last_visit_at = Column(DateTime, nullable=True)
+
+
+def _add_missing_columns():
+    """create_all не меняет существующие таблицы — новые колонки моделей
+    добавляем в старую БД через ALTER TABLE ADD COLUMN."""
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {c["name"] for c in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                ddl = f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column.type.compile(engine.dialect)}"
+                default = column.default.arg if column.default is not None and column.default.is_scalar else None
+                if isinstance(default, str):
+                    ddl += " DEFAULT '" + default.replace("'", "''") + "'"
+                elif isinstance(default, (int, float)):
+                    ddl += f" DEFAULT {default}"
+                conn.execute(text(ddl))
+                print(f"[DB] Добавлена колонка {table.name}.{column.name}")
+
+
+def _create_missing_indexes():
+    """create_all создаёт индексы только вместе с новой таблицей —
+    индексы, добавленные в модели позже, доводим до старой БД отдельно."""
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
+
 
 def create_tables():
+    from .fulltext import create_fulltext_index
+    from .funnel import create_funnel_tables
+    from .body_store import migrate_legacy_bodies
+
     Base.metadata.create_all(bind=engine)
+    _add_missing_columns()
+    _create_missing_indexes()
+    create_fulltext_index(engine)
+    create_funnel_tables(engine)
+    migrate_legacy_bodies(engine)
 
 
 def get_db():
@@ -0,0 +1,364 @@
+import os
+import re
+import time
+import random
+import socket
+import struct
+import asyncio
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# ─────────────────────────────────────────────
+# Проверка доставляемости адреса до рассылки:
+# синтаксис → MX (или A/AAAA как неявный MX) → опционально SMTP RCPT.
+#
+# DNS-клиент минимальный, на asyncio UDP, без внешних пакетов. Адрес резолвера
+# берётся из DNS_RESOLVER ("host:port", IPv6 — "[::1]:53"), поэтому модуль
+# проверяется против локального stub-резолвера.
+# ─────────────────────────────────────────────
+
+DELIVERABLE = "deliverable"
+UNDELIVERABLE = "undeliverable"
+UNKNOWN = "unknown"          # DNS/SMTP не ответили — решить нельзя, проверим позже
+
+SMTP_PROBE = os.getenv("VERIFY_SMTP_PROBE", "false").lower() == "true"
+_SMTP_PROBE_HELO = os.getenv("VERIFY_SMTP_HELO", "leadhunter.local")
+_SMTP_PROBE_TIMEOUT = 10
+_DNS_TIMEOUT = 2.0
+_DNS_ATTEMPTS = 2
+_MIN_TTL = 30                # Не кэшируем короче — защита от TTL=0
+_MAX_TTL = 24 * 3600
+_NEGATIVE_TTL = 900          # Если в ответе нет SOA
+_CACHE_SIZE = 10000
+_VERIFY_CONCURRENCY = 20
+_RESOLV_CONF = "/etc/resolv.conf"
+
+_SYNTAX_REGEX = re.compile(r"^[A-Za-z0-9.!#$%&'*+/=?^_`{|}~\-]{1,64}@([A-Za-z0-9\-Ѐ-ӿ]{1,63}\.)+[A-Za-zЀ-ӿ]{2,63}$")
+
+# Типы записей и коды ответа DNS
+QTYPE_A = 1
+QTYPE_SOA = 6
+QTYPE_MX = 15
+QTYPE_AAAA = 28
+RCODE_NOERROR = 0
+RCODE_SERVFAIL = 2
+RCODE_NXDOMAIN = 3
+
+
+class DnsAnswer:
+    """Результат DNS-запроса: код ответа, записи и срок жизни в кэше."""
+
+    def __init__(self, rcode: int, records: list, ttl: int):
+        self.rcode = rcode
+        self.records = records
+        self.ttl = ttl
+
+
+def parse_nameserver(value: str, port: int = 53) -> Tuple[str, int]:
+    """Адрес резолвера: «1.2.3.4», «1.2.3.4:5353», «::1», «[::1]:5353»,
+    «fe80::1%eth0». IPv6 с портом — только в квадратных скобках."""
+    value = value.strip()
+    if value.startswith("["):
+        host, _, rest = value[1:].partition("]")
+        return host, int(rest.lstrip(":") or port)
+    if value.count(":") == 1:
+        host, _, custom = value.partition(":")
+        return host, int(custom or port)
+    return value, port
+
+
+def _default_nameserver() -> Tuple[str, int]:
+    configured = os.getenv("DNS_RESOLVER", "")
+    if configured:
+        return parse_nameserver(configured)
+    try:
+        with open(_RESOLV_CONF, encoding="utf-8") as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) >= 2 and parts[0] == "nameserver":
+                    return parse_nameserver(parts[1])
+    except OSError:
+        pass  # Windows или контейнер без resolv.conf
+    return "8.8.8.8", 53
+
+
+# ─────────────────────────────────────────────
+# Формат сообщений DNS (RFC 1035)
+# ─────────────────────────────────────────────
+
+def _build_query(qid: int, name: str, qtype: int) -> bytes:
+    header = struct.pack("!HHHHHH", qid, 0x0100, 1, 0, 0, 0)   # RD=1, один вопрос
+    labels = name.rstrip(".").encode("idna").split(b".")
+    qname = b"".join(bytes([len(label)]) + label for label in labels) + b"\0"
+    return header + qname + struct.pack("!HH", qtype, 1)
+
+
+def _read_name(data: bytes, offset: int) -> Tuple[str, int]:
+    """Имя с поддержкой сжатия (указатели 0xC0). Возвращает (имя, смещение после)."""
+    labels = []
+    end = None
+    for _ in range(128):
+        length = data[offset]
+        if length & 0xC0 == 0xC0:
+            if end is None:
+                end = offset + 2
+            offset = ((length & 0x3F) << 8) | data[offset + 1]
+            continue
+        offset += 1
+        if length == 0:
+            return ".".join(labels), (end if end is not None else offset)
+        labels.append(data[offset:offset + length].decode("ascii", "replace"))
+        offset += length
+    raise ValueError("DNS: цикл в сжатых именах")
+
+
+def _parse_response(data: bytes, qid: int) -> DnsAnswer:
+    """Разбор ответа; битый пакет (обрезанный, с неверными длинами) — ValueError."""
+    try:
+        return _parse_packet(data, qid)
+    except (struct.error, IndexError) as e:
+        raise ValueError(f"DNS: битый ответ ({e})") from e
+
+
+def _parse_packet(data: bytes, qid: int) -> DnsAnswer:
+    rid, flags, qdcount, ancount, nscount, _ = struct.unpack("!HHHHHH", data[:12])
+    if rid != qid:
+        raise ValueError("DNS: чужой ответ")
+    rcode = flags & 0x0F
+    offset = 12
+    for _ in range(qdcount):
+        _, offset = _read_name(data, offset)
+        offset += 4
+
+    records = []
+    ttls = []
+    negative_ttl = None
+    for index in range(ancount + nscount):
+        _, offset = _read_name(data, offset)
+        rtype, _, ttl, rdlength = struct.unpack("!HHIH", data[offset:offset + 10])
+        offset += 10
+        rdata = offset
+        offset += rdlength
+        if index < ancount:
+            if rtype == QTYPE_MX:
+                preference = struct.unpack("!H", data[rdata:rdata + 2])[0]
+                records.append((preference, _read_name(data, rdata + 2)[0]))
+                ttls.append(ttl)
+            elif rtype == QTYPE_A:
+                records.append(socket.inet_ntoa(data[rdata:rdata + 4]))
+                ttls.append(ttl)
+            elif rtype == QTYPE_AAAA:
+                records.append(socket.inet_ntop(socket.AF_INET6, data[rdata:rdata + 16]))
+                ttls.append(ttl)
+        elif rtype == QTYPE_SOA:
+            # Отрицательный TTL = min(TTL записи SOA, поле MINIMUM) — RFC 2308
+            _, pos = _read_name(data, rdata)
+            _, pos = _read_name(data, pos)
+            minimum = struct.unpack("!IIIII", data[pos:pos + 20])[4]
+            negative_ttl = min(ttl, minimum)
+
+    if records:
+        ttl = min(ttls)
+    elif negative_ttl is not None:
+        ttl = negative_ttl
+    else:
+        ttl = _NEGATIVE_TTL
+    return DnsAnswer(rcode, records, min(max(ttl, _MIN_TTL), _MAX_TTL))
+
+
+class _DnsProtocol(asyncio.DatagramProtocol):
+    def __init__(self, future: asyncio.Future):
+        self.future = future
+
+    def datagram_received(self, data, addr):
+        if not self.future.done():
+            self.future.set_result(data)
+
+    def error_received(self, exc):
+        if not self.future.done():
+            self.future.set_exception(exc)
+
+
+class Resolver:
+    """Асинхронный резолвер с общим кэшем.
+
+    Кэш учитывает TTL записей, отрицательные ответы (NXDOMAIN, нет записей)
+    кэшируются по SOA. Одинаковые одновременные запросы схлопываются в один.
+    """
+
+    def __init__(self, nameserver: Optional[Tuple[str, int]] = None, timeout: float = _DNS_TIMEOUT):
+        self.nameserver = nameserver or _default_nameserver()
+        self.timeout = timeout
+        self._cache: "OrderedDict[Tuple[str, int], Tuple[float, DnsAnswer]]" = OrderedDict()
+        self._inflight: Dict[Tuple[str, int], asyncio.Future] = {}
+
+    async def lookup(self, name: str, qtype: int) -> DnsAnswer:
+        key = (name.lower().rstrip("."), qtype)
+        cached = self._cache.get(key)
+        if cached and cached[0] > time.monotonic():
+            self._cache.move_to_end(key)
+            return cached[1]
+
+        pending = self._inflight.get(key)
+        if pending is not None:
+            return await asyncio.shield(pending)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            answer = await self._query(key[0], qtype)
+            # SERVFAIL — проблема резолвера, а не домена: не кэшируем
+            if answer.rcode != RCODE_SERVFAIL:
+                self._cache[key] = (time.monotonic() + answer.ttl, answer)
+                if len(self._cache) > _CACHE_SIZE:
+                    self._cache.popitem(last=False)
+            future.set_result(answer)
+            return answer
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()  # Помечаем как полученное, если никто не ждал
+            raise
+        finally:
+            self._inflight.pop(key, None)
+
+    async def _query(self, name: str, qtype: int) -> DnsAnswer:
+        loop = asyncio.get_running_loop()
+        last_error: Exception = asyncio.TimeoutError()
+        for _ in range(_DNS_ATTEMPTS):
+            qid = random.randint(0, 0xFFFF)
+            future = loop.create_future()
+            transport, _ = await loop.create_datagram_endpoint(
+                lambda: _DnsProtocol(future), remote_addr=self.nameserver,
+            )
+            try:
+                transport.sendto(_build_query(qid, name, qtype))
+                data = await asyncio.wait_for(future, self.timeout)
+                return _parse_response(data, qid)
+            except (asyncio.TimeoutError, OSError, ValueError) as e:
+                last_error = e
+            finally:
+                transport.close()
+        raise last_error
+
+
+_resolver: Optional[Resolver] = None
+
+
+def get_resolver() -> Resolver:
+    """Общий резолвер процесса (и его кэш)."""
+    global _resolver
+    if _resolver is None:
+        _resolver = Resolver()
+    return _resolver
+
+
+# ─────────────────────────────────────────────
+# SMTP RCPT-проба (по умолчанию выключена: порт 25 часто закрыт провайдером)
+# ─────────────────────────────────────────────
+
+async def _smtp_reply(reader) -> int:
+    while True:
+        line = await reader.readline()
+        if not line:
+            raise ConnectionError("SMTP: соединение закрыто")
+        if line[3:4] != b"-":
+            return int(line[:3])
+
+
+async def _smtp_probe(mx_host: str, email: str) -> Tuple[str, str]:
+    writer = None
+    try:
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(mx_host, 25), _SMTP_PROBE_TIMEOUT)
+
+        async def command(line: str) -> int:
+            writer.write(line.encode("ascii", "ignore") + b"\r\n")
+            await writer.drain()
+            return await asyncio.wait_for(_smtp_reply(reader), _SMTP_PROBE_TIMEOUT)
+
+        if await asyncio.wait_for(_smtp_reply(reader), _SMTP_PROBE_TIMEOUT) != 220:
+            return UNKNOWN, "smtp_greeting"
+        if await command(f"EHLO {_SMTP_PROBE_HELO}") != 250:
+            return UNKNOWN, "smtp_ehlo"
+        if await command("MAIL FROM:<>") != 250:
+            return UNKNOWN, "smtp_mail_from"
+        code = await command(f"RCPT TO:<{email}>")
+        await command("QUIT")
+        if code in (250, 251):
+            return DELIVERABLE, "smtp_rcpt"
+        if code in (550, 551, 553):
+            return UNDELIVERABLE, f"smtp_{code}"
+        return UNKNOWN, f"smtp_{code}"
+    except Exception:
+        return UNKNOWN, "smtp_unreachable"
+    finally:
+        if writer is not None:
+            writer.close()
+
+
+# ─────────────────────────────────────────────
+# Вердикт по адресу
+# ─────────────────────────────────────────────
+
+def normalize_email(email: str) -> str:
+    """Адрес в виде для хранения и дедупликации: без пробелов, в нижнем
+    регистре. Один и тот же для импорта, поиска и проверки."""
+    return (email or "").strip().lower()
+
+
+def valid_syntax(email: str) -> bool:
+    """Адрес синтаксически допустим (без сетевых проверок)."""
+    return bool(_SYNTAX_REGEX.match((email or "").strip()))
+
+
+async def verify_email(email: str, resolver: Optional[Resolver] = None,
+                       smtp_probe: Optional[bool] = None) -> Tuple[str, str]:
+    """Проверяет адрес: (вердикт, причина)."""
+    email = (email or "").strip()
+    if not valid_syntax(email):
+        return UNDELIVERABLE, "syntax"
+    resolver = resolver or get_resolver()
+    domain = email.rsplit("@", 1)[1].lower()
+
+    try:
+        mx = await resolver.lookup(domain, QTYPE_MX)
+        if mx.rcode == RCODE_NXDOMAIN:
+            return UNDELIVERABLE, "nxdomain"
+        if mx.rcode != RCODE_NOERROR:
+            return UNKNOWN, f"dns_rcode_{mx.rcode}"
+        hosts = [host for _, host in sorted(mx.records) if host not in ("", ".")]
+        if mx.records and not hosts:
+            return UNDELIVERABLE, "null_mx"      # RFC 7505: домен не принимает почту
+        reason = "mx"
+        if not hosts:
+            # Нет MX — письмо уйдёт на A/AAAA самого домена (неявный MX)
+            for qtype in (QTYPE_A, QTYPE_AAAA):
+                if (await resolver.lookup(domain, qtype)).records:
+                    hosts, reason = [domain], "implicit_mx"
+                    break
+        if not hosts:
+            return UNDELIVERABLE, "no_mx"
+    except (asyncio.TimeoutError, OSError):
+        return UNKNOWN, "dns_timeout"
+    except ValueError:
+        # Битый ответ или имя, которое нельзя запросить (в т.ч. UnicodeError)
+        return UNKNOWN, "dns_error"
+
+    if SMTP_PROBE if smtp_probe is None else smtp_probe:
+        return await _smtp_probe(hosts[0], email)
+    return DELIVERABLE, reason
+
+
+async def verify_many(emails: Iterable[str], resolver: Optional[Resolver] = None,
+                      concurrency: int = _VERIFY_CONCURRENCY) -> Dict[str, Tuple[str, str]]:
+    """Параллельная проверка набора адресов: {email: (вердикт, причина)}."""
+    unique: List[str] = list(dict.fromkeys(e.strip() for e in emails if e))
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(email: str):
+        async with semaphore:
+            return email, await verify_email(email, resolver)
+
+    return dict(await asyncio.gather(*(one(e) for e in unique)))
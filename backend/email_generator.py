@@ -1,14 +1,18 @@
 import os
 import json
 import re
+import time
+import asyncio
 from pathlib import Path
-from openai import OpenAI
 from dotenv import load_dotenv
 
+from .resilience import dependency
+
 # Абсолютный путь к Credentials.env в корне проекта
 ENV_PATH = Path(__file__).parent.parent / "Credentials.env"
 load_dotenv(ENV_PATH)
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY", "")
+_OPENAI_TIMEOUT = 60  # Таймаут, пока нет замеров задержки OpenAI
 
 # Мок-продукты Сибирского кедра
 PRODUCTS = [
@@ -24,7 +28,16 @@ async def generate_email(company_name: str, category: str) -> dict:
     if not OPENAI_API_KEY:
         return _generate_mock_email(company_name)
 
-    client = OpenAI(api_key=OPENAI_API_KEY)
+    # Своя зависимость: gpt-4o на письмо отвечает намного дольше, чем извлечение
+    # в search_agent (openai:extract), — таймаут и breaker у них раздельные
+    openai_dep = dependency("openai:letters", _OPENAI_TIMEOUT)
+    if not openai_dep.breaker.allow():
+        # OpenAI лежит — не ждём таймаута на каждом письме рассылки
+        return _generate_mock_email(company_name)
+
+    from openai import OpenAI  # SDK тяжёлый — грузим при первом письме, а не при старте
+
+    client = OpenAI(api_key=OPENAI_API_KEY, timeout=openai_dep.timeout(), max_retries=0)
     
     # Берем 3 случайных продукта
     import random
@@ -51,12 +64,19 @@ async def generate_email(company_name: str, category: str) -> dict:
 """
 
     try:
-        resp = client.chat.completions.create(
-            model="gpt-4o",
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0.7,
-            max_tokens=1000,
-        )
+        started = time.monotonic()
+        try:
+            resp = await asyncio.to_thread(
+                client.chat.completions.create,
+                model="gpt-4o",
+                messages=[{"role": "user", "content": prompt}],
+                temperature=0.7,
+                max_tokens=1000,
+            )
+        except Exception:
+            openai_dep.record_failure()
+            raise
+        openai_dep.record_success(started)
         text = resp.choices[0].message.content.strip()
         text = re.sub(r"```json\s*", "", text)
         text = re.sub(r"```\s*", "", text)
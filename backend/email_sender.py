@@ -1,20 +1,33 @@
 import os
 import asyncio
-import re
 import random
+import smtplib
+from email.message import EmailMessage
 from pathlib import Path
-from datetime import datetime
 from dotenv import load_dotenv
 
+from . import coordination
+from .deliverability import valid_syntax
+from .mail_log import mail_log
+
 # Абсолютный путь к Credentials.env в корне проекта
 ENV_PATH = Path(__file__).parent.parent / "Credentials.env"
 load_dotenv(ENV_PATH)
 DEMO_MODE = os.getenv("DEMO_MODE", "true").lower() == "true"
 GMAIL_USER = os.getenv("GMAIL_USER", "")
 GMAIL_APP_PASSWORD = os.getenv("GMAIL_APP_PASSWORD", "")
+SMTP_HOST = os.getenv("SMTP_HOST", "smtp.gmail.com")
+SMTP_PORT = int(os.getenv("SMTP_PORT", "465"))   # SMTP поверх SSL
+_SMTP_TIMEOUT = 30
+# Лимит писем в минуту с одного ящика — общий для всех воркеров (0 — без лимита)
+SEND_RATE_PER_MINUTE = int(os.getenv("SEND_RATE_PER_MINUTE", "60"))
 
 SENT_EMAILS_DIR = Path(__file__).parent.parent / "static" / "sent_emails"
-os.makedirs(SENT_EMAILS_DIR, exist_ok=True)
+
+
+def init_storage():
+    """Создаёт каталог лога демо-писем (вызывается из lifespan приложения)."""
+    os.makedirs(SENT_EMAILS_DIR, exist_ok=True)
 
 # Симуляция ответов (для демо)
 MOCK_REPLIES = [
@@ -26,35 +39,77 @@ MOCK_REPLIES = [
     "К сожалению, сейчас нам это не актуально.",
 ]
 
-def _safe_filename(email: str) -> str:
-    """Санирует email для использования в имени файла — убирает слэши и спецсимволы"""
-    return re.sub(r'[\\/:*?"<>|]', '_', email)
+class PermanentSendError(Exception):
+    """Адрес отвергнут окончательно (например, SMTP 5xx) — повторять бессмысленно."""
 
-async def send_email(to_email: str, subject: str, body: str, attachment_path: str = None, from_email: str = "") -> bool:
-    """Отправка письма или симуляция отправки (DEMO_MODE)"""
+
+async def send_email(to_email: str, subject: str, body: str, attachment_path: str = None, from_email: str = "",
+                     owner_id: int = 0) -> bool:
+    """Отправка письма или симуляция отправки (DEMO_MODE).
+
+    Адрес, который не примут никогда (битый синтаксис, SMTP 5xx на получателя
+    или на само письмо), — PermanentSendError. Остальные ошибки (сеть, 4xx,
+    авторизация) пробрасываются как есть: их повторит outbox."""
+    if not valid_syntax(to_email):
+        raise PermanentSendError(f"Некорректный адрес: {to_email}")
     if DEMO_MODE or not (GMAIL_USER and GMAIL_APP_PASSWORD):
-        return await _simulate_send(to_email, subject, body, attachment_path, from_email)
+        return await _simulate_send(to_email, subject, body, attachment_path, from_email, owner_id)
     else:
+        await coordination.throttle(f"send:{from_email or GMAIL_USER}", SEND_RATE_PER_MINUTE, 60)
         print(f"[SMTP] Отправка реального письма от {from_email} на {to_email}")
+        await asyncio.to_thread(_smtp_send, to_email, subject, body, attachment_path, from_email)
         return True
 
-async def _simulate_send(to_email: str, subject: str, body: str, attachment_path: str, from_email: str = "") -> bool:
-    """Симуляция отправки: сохраняем в файл лога"""
+
+def _build_message(to_email: str, subject: str, body: str, attachment_path: str, from_email: str) -> EmailMessage:
+    msg = EmailMessage()
+    msg["From"] = from_email or GMAIL_USER
+    msg["To"] = to_email
+    msg["Subject"] = subject
+    if from_email and from_email != GMAIL_USER:
+        msg["Reply-To"] = from_email
+    msg.set_content(body)
+    if attachment_path and os.path.exists(attachment_path):
+        with open(attachment_path, "rb") as f:
+            msg.add_attachment(f.read(), maintype="application", subtype="pdf",
+                               filename=os.path.basename(attachment_path))
+    return msg
+
+
+def _smtp_reason(code: int, reason) -> str:
+    if isinstance(reason, bytes):
+        reason = reason.decode("utf-8", "replace")
+    return f"SMTP {code}: {reason}"
+
+
+def _smtp_send(to_email: str, subject: str, body: str, attachment_path: str, from_email: str):
+    """Отправка через SMTP (синхронно — вызывается в потоке)."""
+    msg = _build_message(to_email, subject, body, attachment_path, from_email)
+    try:
+        with smtplib.SMTP_SSL(SMTP_HOST, SMTP_PORT, timeout=_SMTP_TIMEOUT) as smtp:
+            smtp.login(GMAIL_USER, GMAIL_APP_PASSWORD)
+            # Конверт — от ящика, под которым авторизовались
+            smtp.send_message(msg, from_addr=GMAIL_USER, to_addrs=[to_email])
+    except smtplib.SMTPRecipientsRefused as e:
+        code, reason = next(iter(e.recipients.values()))
+        if code >= 500:
+            raise PermanentSendError(_smtp_reason(code, reason)) from e
+        raise
+    except smtplib.SMTPDataError as e:
+        # 5xx на DATA — письмо отвергнуто (спам-фильтр, размер, политика)
+        if e.smtp_code >= 500:
+            raise PermanentSendError(_smtp_reason(e.smtp_code, e.smtp_error)) from e
+        raise
+
+
+async def _simulate_send(to_email: str, subject: str, body: str, attachment_path: str, from_email: str = "",
+                         owner_id: int = 0) -> bool:
+    """Симуляция отправки: пишем письмо в журнал (пачками, без блокировки event loop)"""
     await asyncio.sleep(0.5)  # Имитация сетевой задержки
 
-    safe_email = _safe_filename(to_email)
-    timestamp = datetime.utcnow().strftime("%Y%m%d_%H%M%S")
-    log_file = os.path.join(SENT_EMAILS_DIR, f"{safe_email}_{timestamp}.txt")
-    with open(log_file, "w", encoding="utf-8") as f:
-        f.write(f"FROM: {from_email}\n")
-        f.write(f"TO: {to_email}\n")
-        f.write(f"SUBJECT: {subject}\n")
-        if attachment_path:
-            f.write(f"ATTACHMENT: {attachment_path}\n")
-        f.write("\n---\n")
-        f.write(body)
-
-    print(f"[DEMO] Письмо от {from_email} для {to_email} сохранено в {log_file}")
+    mail_log.append(to_email, subject, body, attachment=attachment_path or "", from_email=from_email,
+                    owner_id=owner_id)
+    print(f"[DEMO] Письмо от {from_email} для {to_email} записано в журнал")
     return True
 
 def generate_mock_reply() -> str:
@@ -0,0 +1,199 @@
+import os
+import asyncio
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+from urllib.parse import urlsplit
+
+from sqlalchemy import and_, case, func, or_
+
+from .database import SessionLocal, Company
+from .search_agent import scrape_contacts
+from . import coordination, events, outbox
+
+# ─────────────────────────────────────────────
+# Фоновое дообогащение лидов
+#
+# Интерактивный поиск парсит не больше _MAX_SCRAPE_PAGES сайтов за один
+# проход, поэтому часть компаний остаётся с подставленным info@<хост> или
+# без телефона/адреса. Воркер с низким приоритетом находит такие строки,
+# обходит сайт глубже (больше страниц, sitemap) и дописывает найденное
+# прямо в компанию. Строку «забирает» атомарный UPDATE, как в outbox, так
+# что несколько воркеров uvicorn не обходят один сайт дважды.
+# ─────────────────────────────────────────────
+
+MAX_ATTEMPTS = 3
+_RETRY_AFTER = timedelta(days=3)   # повторная попытка, если в прошлый раз не всё нашлось
+_BATCH_SIZE = 10
+_POLL_INTERVAL = 60                # сек между проверками, когда работы нет
+_BATCH_PAUSE = 5                   # сек между пачками: не отнимаем сеть у интерактивного поиска
+_CONCURRENCY = 2                   # одновременно обходимых сайтов на все воркеры
+_DEEP_PAGES = 6                    # кандидатов в контакты на сайт (в поиске — 2)
+WORKER_ENABLED = os.getenv("ENRICH_WORKER", "true").lower() == "true"
+
+
+def _site_host(website: str) -> str:
+    """Хост сайта без схемы, пути и www.; сайт бывает записан и без схемы."""
+    return urlsplit(website if "//" in website else f"//{website}").netloc.lower().removeprefix("www.")
+
+
+def fallback_email(website: Optional[str]) -> str:
+    """Адрес-заглушка для компании, у которой email не нашёлся."""
+    return f"info@{_site_host(website or '') or 'unknown.com'}"
+
+
+def _needs_email(comp: Company) -> bool:
+    # Письмо уже ушло — адрес не меняем, чтобы не разойтись с перепиской
+    if comp.status != "new":
+        return False
+    email = (comp.email or "").strip()
+    return not email or email == fallback_email(comp.website) or email.endswith("@unknown.com")
+
+
+def _empty(column):
+    return or_(column.is_(None), column == "")
+
+
+def _sql_host(website):
+    """_site_host средствами SQLite: без схемы, пути и www."""
+    site = func.lower(website)
+    start = func.instr(site, "//")
+    rest = case((start > 0, func.substr(site, start + 2)), else_=site)
+    slash = func.instr(rest, "/")
+    host = case((slash > 0, func.substr(rest, 1, slash - 1)), else_=rest)
+    return case((host.like("www.%"), func.substr(host, 5)), else_=host)
+
+
+# Настоящий info@ с заполненными телефоном и адресом не трогаем: адрес
+# считается ненайденным, только если совпадает с заглушкой fallback_email.
+# Точная проверка — в _needs_email
+_INCOMPLETE = or_(
+    and_(Company.status == "new", or_(
+        _empty(Company.email),
+        Company.email == "info@" + _sql_host(Company.website),
+        Company.email.like("%@unknown.com"),
+    )),
+    _empty(Company.phone),
+    _empty(Company.address),
+)
+
+
+def _claim(db, limit: int) -> List[int]:
+    """Забирает компании для обхода: отметка enriched_at сразу выводит их из
+    выборки для других воркеров на _RETRY_AFTER."""
+    now = datetime.utcnow()
+    ready = and_(
+        Company.website.isnot(None), Company.website != "",
+        _INCOMPLETE,
+        or_(Company.enrich_attempts.is_(None), Company.enrich_attempts < MAX_ATTEMPTS),
+        or_(Company.enriched_at.is_(None), Company.enriched_at < now - _RETRY_AFTER),
+    )
+    # Сначала ни разу не обходившиеся, из них — самые свежие
+    candidates = db.query(Company.id).filter(ready).order_by(
+        Company.enriched_at.isnot(None), Company.id.desc(),
+    ).limit(limit).all()
+    claimed = []
+    for (company_id,) in candidates:
+        updated = db.query(Company).filter(Company.id == company_id, ready).update({
+            Company.enrich_attempts: func.coalesce(Company.enrich_attempts, 0) + 1,
+            Company.enriched_at: now,
+        }, synchronize_session=False)
+        if updated:
+            claimed.append(company_id)
+    db.commit()
+    return claimed
+
+
+def _pick_email(emails: List[str], current: str, website: str) -> str:
+    """Текущий адрес, если сайт его подтвердил; иначе адрес на домене сайта;
+    иначе первый найденный."""
+    if current in emails:
+        return current
+    host = _site_host(website)
+    same_domain = [e for e in emails if host and e.endswith("@" + host)]
+    return (same_domain or emails)[0]
+
+
+def _apply(company_id: int, found: Dict) -> Optional[tuple]:
+    """Дописывает найденное в компанию. (owner_id, изменения) или None."""
+    db = SessionLocal()
+    try:
+        comp = db.get(Company, company_id)
+        if comp is None:
+            return None
+        changes = {}
+        # Письмо в очереди outbox уйдёт на адрес, записанный в очередь: менять
+        # адрес компании под ним нельзя, иначе чат и журнал разойдутся с отправкой
+        if found["emails"] and _needs_email(comp) and comp.id not in outbox.queued_company_ids(
+            db, comp.owner_id, states=("pending", "sending", "dead"),
+        ):
+            email = _pick_email(found["emails"], (comp.email or "").strip(), comp.website or "")
+            taken = db.query(Company.id).filter(
+                Company.owner_id == comp.owner_id, Company.email == email, Company.id != comp.id,
+            ).first()
+            if email != comp.email and taken is None:
+                comp.email = email
+                # Вердикт относился к старому адресу
+                comp.email_verdict = ""
+                comp.email_verdict_reason = ""
+                comp.email_checked_at = None
+                changes.update(email=email, email_verdict="")
+        if found["phones"] and not comp.phone:
+            comp.phone = found["phones"][0]
+            changes["phone"] = comp.phone
+        if found["address"] and not comp.address:
+            comp.address = found["address"]
+            changes["address"] = comp.address
+        if changes:
+            db.commit()
+        return comp.owner_id, changes
+    finally:
+        db.close()
+
+
+async def _enrich(company_id: int):
+    db = SessionLocal()
+    try:
+        comp = db.get(Company, company_id)
+        website = comp.website if comp is not None else ""
+    finally:
+        db.close()
+    if not website:
+        return
+    url = website if "//" in website else f"https://{website}"
+    try:
+        async with coordination.semaphore("enrich", _CONCURRENCY):
+            found = await scrape_contacts(url, max_pages=_DEEP_PAGES)
+        result = _apply(company_id, found)
+    except Exception as e:
+        print(f"[Enrich] #{company_id} {website}: {type(e).__name__}: {e}")
+        return
+    if result and result[1]:
+        owner_id, changes = result
+        print(f"[Enrich] #{company_id} {website}: {', '.join(changes)}")
+        events.company_changed(owner_id, company_id, **changes)
+
+
+async def process_batch(limit: int = _BATCH_SIZE) -> int:
+    """Одна итерация воркера. Возвращает число взятых в работу компаний."""
+    db = SessionLocal()
+    try:
+        claimed = _claim(db, limit)
+    finally:
+        db.close()
+    if claimed:
+        await asyncio.gather(*(_enrich(company_id) for company_id in claimed))
+    return len(claimed)
+
+
+async def run_worker():
+    """Фоновый цикл (запускается из lifespan приложения)."""
+    print("[Enrich] Воркер дообогащения лидов запущен")
+    while True:
+        try:
+            processed = await process_batch()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"[Enrich] Ошибка воркера: {e}")
+            processed = 0
+        await asyncio.sleep(_BATCH_PAUSE if processed >= _BATCH_SIZE else _POLL_INTERVAL)
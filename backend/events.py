@@ -0,0 +1,99 @@
+import asyncio
+import threading
+from typing import Dict, Optional, Set
+
+# ─────────────────────────────────────────────
+# Push-события для UI: небольшие дельты вместо перезагрузки /companies.
+#
+# У каждого открытого WebSocket своя очередь; publish() раскладывает событие
+# по очередям пользователя. Вызывать можно и из event loop, и из потоков
+# threadpool (синхронные эндпоинты FastAPI) — доставка через call_soon_threadsafe.
+# ─────────────────────────────────────────────
+
+_QUEUE_SIZE = 500             # Отстающему клиенту шлём resync вместо бесконечной очереди
+
+
+class EventBus:
+    def __init__(self):
+        self._subscribers: Dict[int, Set[asyncio.Queue]] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._lock = threading.Lock()
+
+    def subscribe(self, user_id: int) -> asyncio.Queue:
+        """Новая очередь событий пользователя (вызывается из event loop)."""
+        self._loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue(maxsize=_QUEUE_SIZE)
+        with self._lock:
+            self._subscribers.setdefault(user_id, set()).add(queue)
+        return queue
+
+    def unsubscribe(self, user_id: int, queue: asyncio.Queue):
+        with self._lock:
+            queues = self._subscribers.get(user_id)
+            if queues is not None:
+                queues.discard(queue)
+                if not queues:
+                    del self._subscribers[user_id]
+
+    def _deliver(self, user_id: int, event: dict):
+        with self._lock:
+            queues = list(self._subscribers.get(user_id, ()))
+        for queue in queues:
+            try:
+                queue.put_nowait(event)
+            except asyncio.QueueFull:
+                # Клиент не успевает — сбрасываем очередь, пусть перечитает всё
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait({"type": "resync"})
+
+    def publish(self, user_id: int, event: dict):
+        with self._lock:
+            if user_id not in self._subscribers:
+                return
+        loop = self._loop
+        if loop is None or loop.is_closed():
+            return
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            self._deliver(user_id, event)
+        else:
+            loop.call_soon_threadsafe(self._deliver, user_id, event)
+
+
+bus = EventBus()
+
+
+# ── Типы событий ──
+
+def message_dict(m, body: str = "") -> dict:
+    """Сообщение чата в том виде, в каком его отдаёт API. У письма в m.text
+    только тема, текст (body) хранится отдельно — см. body_store."""
+    return {
+        "id": m.id,
+        "direction": m.direction,
+        "author": m.author,
+        "text": f"{m.text}\n\n{body}" if body else m.text,
+        "created_at": m.created_at.isoformat(),
+    }
+
+
+def company_created(user_id: int, company: dict):
+    bus.publish(user_id, {"type": "company_created", "company": company})
+
+
+def company_changed(user_id: int, company_id: int, **changes):
+    """Изменились отдельные поля компании (статус, письмо, счётчик сообщений...)."""
+    bus.publish(user_id, {"type": "company_changed", "company_id": company_id, "changes": changes})
+
+
+def message_appended(user_id: int, company_id: int, message: dict):
+    bus.publish(user_id, {"type": "message_appended", "company_id": company_id, "message": message})
+
+
+def resync(user_id: int):
+    """Изменений слишком много для дельт (импорт) — клиенту перечитать всё."""
+    bus.publish(user_id, {"type": "resync"})
@@ -0,0 +1,138 @@
+import re
+from typing import List, Tuple
+
+from sqlalchemy import text
+
+# ─────────────────────────────────────────────
+# Полнотекстовый поиск по компаниям и переписке (SQLite FTS5)
+#
+# Индексы — external content таблицы FTS5 поверх companies и chat_messages.
+# Синхронизацию держат триггеры SQLite, поэтому индекс обновляется в той же
+# транзакции, что и сама запись, в том числе при массовых UPDATE.
+# ─────────────────────────────────────────────
+
+_TOKENIZER = "unicode61 remove_diacritics 2"
+_TOKEN_REGEX = re.compile(r"\w+", re.UNICODE)
+_MAX_QUERY_TOKENS = 8
+
+# (FTS-таблица, таблица-источник, индексируемые колонки)
+_INDEXES = [
+    ("companies_fts", "companies", ["name", "description", "address", "category"]),
+    ("chat_messages_fts", "chat_messages", ["text"]),
+]
+
+fts_available = False
+
+
+def _ddl(fts: str, source: str, columns: List[str]) -> List[str]:
+    cols = ", ".join(columns)
+    new_vals = ", ".join(f"new.{c}" for c in columns)
+    old_vals = ", ".join(f"old.{c}" for c in columns)
+    return [
+        f"CREATE VIRTUAL TABLE {fts} USING fts5({cols}, content='{source}', "
+        f"content_rowid='id', tokenize='{_TOKENIZER}')",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {source} BEGIN "
+        f"INSERT INTO {fts}(rowid, {cols}) VALUES (new.id, {new_vals}); END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {source} BEGIN "
+        f"INSERT INTO {fts}({fts}, rowid, {cols}) VALUES ('delete', old.id, {old_vals}); END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE OF {cols} ON {source} BEGIN "
+        f"INSERT INTO {fts}({fts}, rowid, {cols}) VALUES ('delete', old.id, {old_vals}); "
+        f"INSERT INTO {fts}(rowid, {cols}) VALUES (new.id, {new_vals}); END",
+    ]
+
+
+def create_fulltext_index(engine):
+    """Создаёт FTS5-индексы и триггеры; при первом создании индексирует
+    уже существующие строки. Без FTS5 в сборке SQLite поиск отключается.
+    Всё — одной транзакцией: при ошибке не остаётся половины индексов."""
+    global fts_available
+    try:
+        with engine.begin() as conn:
+            # pysqlite сам открывает транзакцию только перед DML — без явного
+            # BEGIN DDL выполнился бы в autocommit и не откатился
+            conn.exec_driver_sql("BEGIN")
+            for fts, source, columns in _INDEXES:
+                exists = conn.execute(
+                    text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+                    {"name": fts},
+                ).first()
+                statements = _ddl(fts, source, columns)
+                if not exists:
+                    conn.execute(text(statements[0]))
+                for stmt in statements[1:]:
+                    conn.execute(text(stmt))
+                if not exists:
+                    conn.execute(text(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')"))
+                    print(f"[FTS] Индекс {fts} построен")
+        fts_available = True
+    except Exception as e:
+        print(f"[WARN] FTS5 недоступен, локальный поиск отключён: {e}")
+        fts_available = False
+
+
+def build_match_query(query: str) -> str:
+    """Пользовательский ввод → безопасное выражение MATCH.
+
+    Каждое слово берётся в кавычки (операторы FTS5 не интерпретируются)
+    и ищется по префиксу: «кейтер томск» найдёт «Кейтеринг в Томске».
+    """
+    tokens = _TOKEN_REGEX.findall(query.lower())[:_MAX_QUERY_TOKENS]
+    return " ".join(f'"{t}"*' for t in tokens)
+
+
+# bm25 разных FTS-таблиц несравнимы (своя статистика слов в каждой), поэтому
+# score — bm25, делённый на лучший bm25 своего источника: 1 — лучшее совпадение
+# среди компаний и лучшее среди сообщений, дальше по убыванию.
+_SEARCH_SQL = text("""
+    WITH company_hits AS (
+        SELECT c.id AS id, c.name AS title,
+               snippet(companies_fts, -1, '**', '**', '…', 12) AS snippet,
+               bm25(companies_fts, 10.0, 2.0, 1.0, 3.0) AS rank
+        FROM companies_fts JOIN companies c ON c.id = companies_fts.rowid
+        WHERE companies_fts MATCH :match AND c.owner_id = :owner_id
+    ), message_hits AS (
+        SELECT m.id AS id, c.id AS company_id, c.name AS title,
+               snippet(chat_messages_fts, 0, '**', '**', '…', 16) AS snippet,
+               bm25(chat_messages_fts) AS rank
+        FROM chat_messages_fts
+        JOIN chat_messages m ON m.id = chat_messages_fts.rowid
+        JOIN companies c ON c.id = m.company_id
+        WHERE chat_messages_fts MATCH :match AND c.owner_id = :owner_id
+    )
+    SELECT kind, id, company_id, title, snippet, score FROM (
+        SELECT 'company' AS kind, id, id AS company_id, title, snippet,
+               rank / NULLIF(MIN(rank) OVER (), 0) AS score
+        FROM company_hits
+        UNION ALL
+        SELECT 'message' AS kind, id, company_id, title, snippet,
+               rank / NULLIF(MIN(rank) OVER (), 0) AS score
+        FROM message_hits
+    )
+    ORDER BY score DESC, kind, id
+    LIMIT :limit OFFSET :offset
+""")
+
+
+def search(db, owner_id: int, query: str, limit: int = 20, offset: int = 0) -> Tuple[List[dict], bool]:
+    """Ранжированный поиск по компаниям и сообщениям пользователя.
+
+    Возвращает (результаты, есть_ли_ещё). score от 0 до 1, больше — лучше.
+    """
+    match = build_match_query(query)
+    if not match:
+        return [], False
+    rows = db.execute(_SEARCH_SQL, {
+        "match": match, "owner_id": owner_id, "limit": limit + 1, "offset": offset,
+    }).all()
+    results = [
+        {
+            "kind": r.kind,
+            "id": r.id,
+            "company_id": r.company_id,
+            "title": r.title,
+            "snippet": r.snippet,
+            "score": round(r.score or 0.0, 4),
+        }
+        for r in rows[:limit]
+    ]
+    return results, len(rows) > limit
@@ -0,0 +1,131 @@
+from typing import Dict
+
+from sqlalchemy import text
+
+# ─────────────────────────────────────────────
+# Материализованные счётчики воронки: (владелец, статус, категория) → число
+#
+# Таблицу company_stats ведут триггеры SQLite на companies, поэтому счётчик
+# меняется в той же транзакции, что и сама компания, — при любом пути записи:
+# одиночная смена статуса, массовый UPDATE, рассылка, воркер outbox.
+# Дашборд читает несколько строк вместо всего списка компаний.
+#
+# Так же триггерами ведётся история статусов (company_status_events):
+# строка на каждый переход, для выгрузки лидов с их историей.
+# ─────────────────────────────────────────────
+
+_TABLE = "company_stats"
+STATUS_EVENTS = "company_status_events"
+_NOW = "strftime('%Y-%m-%d %H:%M:%f', 'now')"
+
+# Ключ строки счётчика для new./old. строки companies
+_KEY = "COALESCE({row}.owner_id, 0), COALESCE({row}.status, ''), COALESCE({row}.category, '')"
+
+
+def _bump(row: str, delta: int) -> str:
+    return (
+        f"INSERT INTO {_TABLE}(owner_id, status, category, count) VALUES ({_KEY.format(row=row)}, {delta}) "
+        f"ON CONFLICT(owner_id, status, category) DO UPDATE SET count = count + ({delta});"
+    )
+
+
+_DDL = [
+    f"""CREATE TABLE {_TABLE} (
+        owner_id INTEGER NOT NULL,
+        status TEXT NOT NULL,
+        category TEXT NOT NULL,
+        count INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (owner_id, status, category)
+    )""",
+    f"CREATE TRIGGER IF NOT EXISTS {_TABLE}_ai AFTER INSERT ON companies BEGIN {_bump('new', 1)} END",
+    f"CREATE TRIGGER IF NOT EXISTS {_TABLE}_ad AFTER DELETE ON companies BEGIN {_bump('old', -1)} END",
+    f"CREATE TRIGGER IF NOT EXISTS {_TABLE}_au AFTER UPDATE OF owner_id, status, category ON companies "
+    f"WHEN ({_KEY.format(row='new')}) IS NOT ({_KEY.format(row='old')}) "
+    f"BEGIN {_bump('old', -1)} {_bump('new', 1)} END",
+]
+
+_COUNTERS_BACKFILL = [
+    f"INSERT INTO {_TABLE}(owner_id, status, category, count) "
+    f"SELECT COALESCE(owner_id, 0), COALESCE(status, ''), COALESCE(category, ''), COUNT(*) "
+    f"FROM companies GROUP BY 1, 2, 3",
+]
+
+_EVENTS_DDL = [
+    f"""CREATE TABLE {STATUS_EVENTS} (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        company_id INTEGER NOT NULL,
+        status TEXT NOT NULL,
+        changed_at TEXT NOT NULL
+    )""",
+    f"CREATE INDEX IF NOT EXISTS ix_{STATUS_EVENTS}_company ON {STATUS_EVENTS} (company_id, id)",
+    f"CREATE TRIGGER IF NOT EXISTS {STATUS_EVENTS}_ai AFTER INSERT ON companies BEGIN "
+    f"INSERT INTO {STATUS_EVENTS}(company_id, status, changed_at) "
+    f"VALUES (new.id, COALESCE(new.status, ''), {_NOW}); END",
+    f"CREATE TRIGGER IF NOT EXISTS {STATUS_EVENTS}_au AFTER UPDATE OF status ON companies "
+    f"WHEN new.status IS NOT old.status BEGIN "
+    f"INSERT INTO {STATUS_EVENTS}(company_id, status, changed_at) "
+    f"VALUES (new.id, COALESCE(new.status, ''), {_NOW}); END",
+    f"CREATE TRIGGER IF NOT EXISTS {STATUS_EVENTS}_ad AFTER DELETE ON companies BEGIN "
+    f"DELETE FROM {STATUS_EVENTS} WHERE company_id = old.id; END",
+]
+
+# Для компаний, созданных до появления истории, восстанавливаем её по
+# имеющимся отметкам времени; текущий статус — последним шагом.
+_EVENTS_BACKFILL = [
+    f"INSERT INTO {STATUS_EVENTS}(company_id, status, changed_at) "
+    f"SELECT id, 'new', COALESCE(created_at, {_NOW}) FROM companies",
+    f"INSERT INTO {STATUS_EVENTS}(company_id, status, changed_at) "
+    f"SELECT id, 'email_sent', email_sent_at FROM companies WHERE email_sent_at IS NOT NULL",
+    f"INSERT INTO {STATUS_EVENTS}(company_id, status, changed_at) "
+    f"SELECT id, 'replied', replied_at FROM companies WHERE replied_at IS NOT NULL",
+    f"INSERT INTO {STATUS_EVENTS}(company_id, status, changed_at) "
+    f"SELECT id, status, COALESCE(replied_at, email_sent_at, created_at, {_NOW}) FROM companies "
+    f"WHERE status NOT IN ('new', 'email_sent', 'replied')",
+]
+
+
+def _table_exists(conn, name: str) -> bool:
+    return conn.execute(
+        text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+        {"name": name},
+    ).first() is not None
+
+
+def create_funnel_tables(engine):
+    """Создаёт счётчики воронки и историю статусов с их триггерами; при
+    первом создании заполняет таблицы по уже существующим компаниям."""
+    with engine.begin() as conn:
+        for table, ddl, backfill in (
+            (_TABLE, _DDL, _COUNTERS_BACKFILL),
+            (STATUS_EVENTS, _EVENTS_DDL, _EVENTS_BACKFILL),
+        ):
+            exists = _table_exists(conn, table)
+            if not exists:
+                conn.execute(text(ddl[0]))
+            for stmt in ddl[1:]:
+                conn.execute(text(stmt))
+            if exists:
+                continue
+            for stmt in backfill:
+                conn.execute(text(stmt))
+            print(f"[Funnel] Таблица {table} построена")
+
+
+def stats(db, owner_id: int) -> Dict:
+    """Воронка пользователя: всего, по статусам и по категориям."""
+    rows = db.execute(
+        text(f"SELECT status, category, count FROM {_TABLE} WHERE owner_id = :owner_id AND count > 0"),
+        {"owner_id": owner_id},
+    ).all()
+    by_status: Dict[str, int] = {}
+    by_category: Dict[str, Dict] = {}
+    for status, category, count in rows:
+        by_status[status] = by_status.get(status, 0) + count
+        entry = by_category.setdefault(category, {"category": category, "total": 0, "by_status": {}})
+        entry["total"] += count
+        entry["by_status"][status] = count
+    return {
+        "total": sum(by_status.values()),
+        "by_status": by_status,
+        "by_category": sorted(by_category.values(), key=lambda e: -e["total"]),
+    }
@@ -0,0 +1,202 @@
+import asyncio
+import sqlite3
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import List, Optional
+
+from .body_store import body_hash, compress, decompress
+
+# ─────────────────────────────────────────────
+# Журнал демо-писем: append-only SQLite с индексами по владельцу и получателю.
+#
+# Запись не блокирует event loop: append() кладёт строку в очередь,
+# фоновая задача пачками пишет её в БД в отдельном потоке (один INSERT
+# executemany и один COMMIT на пачку). Чтение — тоже в потоке.
+# Тексты писем, как и в основной БД, хранятся сжатыми и по одному разу
+# (таблица bodies, ключ — sha256 текста).
+# ─────────────────────────────────────────────
+
+LOG_PATH = Path(__file__).parent.parent / "static" / "sent_emails" / "sent_log.sqlite3"
+_BATCH_SIZE = 500
+_FLUSH_INTERVAL = 0.5         # сек: сколько ждём добора пачки после первой записи
+
+_SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS sent_mail (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        sent_at TEXT NOT NULL,
+        from_email TEXT NOT NULL DEFAULT '',
+        to_email TEXT NOT NULL,
+        subject TEXT NOT NULL DEFAULT '',
+        attachment TEXT NOT NULL DEFAULT '',
+        body TEXT NOT NULL DEFAULT ''
+    )""",
+    "CREATE TABLE IF NOT EXISTS bodies (hash TEXT PRIMARY KEY, data BLOB NOT NULL)",
+]
+# Колонки, которых не было в журнале старых версий
+_ADDED_COLUMNS = [
+    ("body_hash", "TEXT NOT NULL DEFAULT ''"),   # тексты лежали прямо в sent_mail.body
+    ("owner_id", "INTEGER NOT NULL DEFAULT 0"),  # 0 — записи до разделения по владельцу
+]
+_INDEXES = [
+    "CREATE INDEX IF NOT EXISTS ix_sent_mail_to ON sent_mail (to_email, id)",
+    # Журнал читается только владельцем: from_email пользователь выбирает
+    # сам и он не уникален, поэтому фильтр — по id пользователя
+    "CREATE INDEX IF NOT EXISTS ix_sent_mail_owner ON sent_mail (owner_id, id)",
+]
+
+
+class MailLog:
+    def __init__(self, path: Path = LOG_PATH):
+        self.path = path
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._conn: Optional[sqlite3.Connection] = None
+        self._schema_path: Optional[Path] = None     # для какого файла схема уже доведена
+        self._schema_lock = threading.Lock()
+
+    # ── запись ──
+
+    def _connect(self) -> sqlite3.Connection:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(self.path, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        if self._schema_path != self.path:
+            for stmt in _SCHEMA:
+                conn.execute(stmt)
+            existing = {row[1] for row in conn.execute("PRAGMA table_info(sent_mail)")}
+            for column, ddl in _ADDED_COLUMNS:
+                if column not in existing:
+                    conn.execute(f"ALTER TABLE sent_mail ADD COLUMN {column} {ddl}")
+            for stmt in _INDEXES:
+                conn.execute(stmt)
+            conn.commit()
+            self._schema_path = self.path
+        return conn
+
+    def _ensure_schema(self):
+        """Схема доводится один раз на файл — журнал старой версии мог ещё
+        ни разу не открываться на запись."""
+        if self._schema_path == self.path:
+            return
+        with self._schema_lock:
+            if self._schema_path != self.path:
+                self._connect().close()
+
+    def _write_batch(self, rows: List[tuple]):
+        if self._conn is None:
+            self._conn = self._connect()
+        bodies = {body_hash(row[-1]): row[-1] for row in rows if row[-1]}
+        with self._conn:
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO bodies (hash, data) VALUES (?, ?)",
+                [(digest, compress(body)) for digest, body in bodies.items()],
+            )
+            self._conn.executemany(
+                "INSERT INTO sent_mail (sent_at, owner_id, from_email, to_email, subject, attachment, body_hash) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [(*row[:-1], body_hash(row[-1]) if row[-1] else "") for row in rows],
+            )
+
+    async def _flusher(self):
+        while True:
+            rows = [await self._queue.get()]
+            # Собираем пачку: всё, что накопилось, плюс короткое ожидание добора
+            deadline = asyncio.get_running_loop().time() + _FLUSH_INTERVAL
+            while len(rows) < _BATCH_SIZE:
+                timeout = deadline - asyncio.get_running_loop().time()
+                if timeout <= 0:
+                    break
+                try:
+                    rows.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            try:
+                await asyncio.to_thread(self._write_batch, rows)
+            except Exception as e:
+                print(f"[MailLog] Ошибка записи {len(rows)} писем: {e}")
+            finally:
+                for _ in rows:
+                    self._queue.task_done()
+
+    def _ensure_started(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # Новый event loop (перезапуск приложения, скрипт) — новая очередь
+            self._loop, self._queue, self._task = loop, asyncio.Queue(), None
+        if self._task is None or self._task.done():
+            self._task = loop.create_task(self._flusher())
+
+    def append(self, to_email: str, subject: str, body: str, attachment: str = "", from_email: str = "",
+               owner_id: int = 0):
+        """Добавляет письмо в журнал. Не ждёт диска: запись уходит в фоновую пачку."""
+        self._ensure_started()
+        sent_at = datetime.utcnow().isoformat(timespec="milliseconds")
+        self._queue.put_nowait((
+            sent_at, owner_id or 0, from_email or "", to_email, subject or "", attachment or "", body or "",
+        ))
+
+    async def flush(self):
+        """Дождаться записи всего, что уже в очереди."""
+        if self._queue is not None and self._task is not None and not self._task.done():
+            await self._queue.join()
+
+    async def close(self):
+        await self.flush()
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        self._loop = self._queue = None
+        if self._conn is not None:
+            conn, self._conn = self._conn, None
+            await asyncio.to_thread(conn.close)
+
+    # ── чтение ──
+
+    def _read(self, owner_id: Optional[int], recipient: Optional[str], limit: int,
+              before_id: Optional[int]) -> List[dict]:
+        if not self.path.exists():
+            return []
+        clauses, params = [], []
+        if owner_id is not None:
+            clauses.append("s.owner_id = ?")
+            params.append(owner_id)
+        if recipient:
+            clauses.append("s.to_email = ?")
+            params.append(recipient)
+        if before_id:
+            clauses.append("s.id < ?")
+            params.append(before_id)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        self._ensure_schema()
+        # Своё соединение только на чтение: идёт параллельно с записью пачек (WAL)
+        conn = sqlite3.connect(f"{self.path.as_uri()}?mode=ro", uri=True)
+        try:
+            conn.row_factory = sqlite3.Row
+            rows = conn.execute(
+                f"SELECT s.id, s.sent_at, s.from_email, s.to_email, s.subject, s.attachment, s.body, "
+                f"b.data AS packed FROM sent_mail s LEFT JOIN bodies b ON b.hash = s.body_hash "
+                f"{where} ORDER BY s.id DESC LIMIT ?",
+                (*params, limit),
+            ).fetchall()
+        finally:
+            conn.close()
+        entries = []
+        for r in rows:
+            entry = dict(r)
+            packed = entry.pop("packed")
+            if packed is not None:
+                entry["body"] = decompress(packed)
+            entries.append(entry)
+        return entries
+
+    async def read(self, owner_id: Optional[int] = None, recipient: Optional[str] = None,
+                   limit: int = 50, before_id: Optional[int] = None) -> List[dict]:
+        """Последние письма владельца (новые первыми), с курсором before_id.
+        owner_id=None — журнал целиком (скрипты)."""
+        return await asyncio.to_thread(self._read, owner_id, recipient, limit, before_id)
+
+
+mail_log = MailLog()
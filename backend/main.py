@@ -1,21 +1,48 @@
 import os
-from fastapi import FastAPI, Depends, HTTPException, Header
+import json
+import asyncio
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Depends, HTTPException, Header, WebSocket, WebSocketDisconnect, UploadFile, File, Form
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, StreamingResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
+from sqlalchemy import func, or_, and_, insert
 from sqlalchemy.orm import Session
 from datetime import datetime
-from pydantic import BaseModel, EmailStr
+from pydantic import BaseModel
 from typing import List, Optional
 
-from .database import engine, Base, get_db, Company, User, ChatMessage, create_tables
-from .search_agent import search_companies
+from .database import engine, Base, get_db, Company, User, ChatMessage, OutboxMessage, create_tables, SessionLocal
+from .search_agent import search_companies, harvest_companies, log_key_status
 from .email_generator import generate_email
-from .email_sender import send_email, generate_mock_reply
+from .email_sender import send_email, generate_mock_reply, PermanentSendError
+from .mail_log import mail_log
 from .pdf_generator import generate_catalog_pdf
+from . import email_sender, pdf_generator, fulltext, deliverability, outbox, events, funnel, transfer, coordination, enrichment, body_store
 from .auth import hash_password, verify_password, create_access_token, decode_token
+from . import resilience
+from .profiler import profiler, ProfilerMiddleware
 
-app = FastAPI(title="Keitering Sales Agent")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Все побочные эффекты старта — здесь, а не при импорте модулей:
+    # импорт backend.main остаётся быстрым и ничего не пишет на диск
+    log_key_status()
+    create_tables()
+    email_sender.init_storage()
+    pdf_generator.init_storage()
+    workers = []
+    if outbox.WORKER_ENABLED:
+        workers.append(asyncio.create_task(outbox.run_worker()))
+    if enrichment.WORKER_ENABLED:
+        workers.append(asyncio.create_task(enrichment.run_worker()))
+    yield
+    for worker in workers:
+        worker.cancel()
+    await mail_log.close()
+
+
+app = FastAPI(title="Keitering Sales Agent", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -24,8 +51,7 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
-
-create_tables()
+app.add_middleware(ProfilerMiddleware)
 
 # Раздаём фронтенд
 _FRONTEND_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "frontend")
@@ -35,6 +61,12 @@ app.mount("/static", StaticFiles(directory=_FRONTEND_DIR), name="static")
 def serve_index():
     return FileResponse(os.path.join(_FRONTEND_DIR, "index.html"))
 
+
+@app.get("/health")
+def health():
+    """Состояние внешних зависимостей: circuit breakers и текущие таймауты."""
+    return resilience.snapshot()
+
 # ─────────────────────────────────────────────
 # Pydantic схемы
 # ─────────────────────────────────────────────
@@ -52,13 +84,28 @@ class LoginRequest(BaseModel):
 class SearchRequest(BaseModel):
     category: str
 
+class HarvestRequest(BaseModel):
+    category: str
+    max_queries: int = 12     # бюджет запросов к Tavily
+
+VALID_STATUSES = ["new", "email_sent", "replied", "in_progress", "interested", "rejected", "closed"]
+
 class UpdateStatusRequest(BaseModel):
     status: str
 
+class BulkRequest(BaseModel):
+    ids: List[int]
+    operation: str                # "status" | "send"
+    status: Optional[str] = None  # для operation="status"
+    resend: bool = False          # для operation="send": писать и тем, кто уже не new
+
 class ChatMessageRequest(BaseModel):
     text: str
     direction: str = "outgoing"   # "outgoing" | "incoming"
 
+class ProfilerSettingsRequest(BaseModel):
+    threshold_ms: int             # 0 — профилировать только по заголовку X-Profile
+
 # ─────────────────────────────────────────────
 # Утилита: извлечь текущего пользователя из JWT
 # ─────────────────────────────────────────────
@@ -75,6 +122,44 @@ def get_current_user(authorization: str = Header(None), db: Session = Depends(ge
         raise HTTPException(status_code=401, detail="Пользователь не найден")
     return user
 
+# ─────────────────────────────────────────────
+# Push-события для UI (WebSocket)
+# ─────────────────────────────────────────────
+
+@app.websocket("/ws")
+async def events_socket(websocket: WebSocket, token: str = ""):
+    """Канал push-событий пользователя: company_created, company_changed,
+    message_appended, resync. Токен — тот же JWT, в query-параметре."""
+    payload = decode_token(token)
+    if not payload:
+        await websocket.close(code=4401)
+        return
+    user_id = int(payload["sub"])
+    # Подписка до accept: событие сразу после рукопожатия не потеряется
+    queue = events.bus.subscribe(user_id)
+    receiver = None
+    try:
+        await websocket.accept()
+        # Клиент ничего не шлёт, но чтение нужно, чтобы заметить отключение
+        receiver = asyncio.create_task(websocket.receive_text())
+        while True:
+            getter = asyncio.create_task(queue.get())
+            done, _ = await asyncio.wait({getter, receiver}, return_when=asyncio.FIRST_COMPLETED)
+            if getter in done:
+                await websocket.send_json(getter.result())
+            else:
+                getter.cancel()
+            if receiver in done:
+                receiver.result()  # WebSocketDisconnect, если клиент ушёл
+                receiver = asyncio.create_task(websocket.receive_text())
+    except (WebSocketDisconnect, RuntimeError):
+        pass
+    finally:
+        if receiver is not None:
+            receiver.cancel()
+        events.bus.unsubscribe(user_id, queue)
+
+
 # ─────────────────────────────────────────────
 # Авторизация
 # ─────────────────────────────────────────────
@@ -113,7 +198,7 @@ def me(current_user: User = Depends(get_current_user)):
 # Компании
 # ─────────────────────────────────────────────
 
-def _company_dict(c: Company):
+def _company_dict(c: Company, messages_count: int = 0):
     return {
         "id": c.id,
         "owner_id": c.owner_id,
@@ -126,14 +211,44 @@ def _company_dict(c: Company):
         "description": c.description,
         "status": c.status,
         "email_subject": c.email_subject,
-        "email_body": c.email_body,
+        "has_email_body": bool(c.email_body_hash),  # сам текст — GET /company/{id}/letter
         "reply_text": c.reply_text,
         "created_at": c.created_at.isoformat() if c.created_at else None,
         "email_sent_at": c.email_sent_at.isoformat() if c.email_sent_at else None,
-        "messages_count": len(c.messages),
+        "email_verdict": c.email_verdict or "",
+        "messages_count": messages_count,
     }
 
 
+def _has_real_email(comp: Company) -> bool:
+    """Быстрый отсев явно поддельных адресов (без сетевых проверок)."""
+    email_val = (comp.email or "").strip()
+    return (
+        "@" in email_val
+        and "unknown.com" not in email_val
+        and "example.com" not in email_val
+        and len(email_val) > 5
+    )
+
+
+async def _verify_companies(companies: List[Company]) -> int:
+    """Проверяет доставляемость email у компаний, которые ещё не проверялись
+    (или чей прошлый результат — unknown). Все адреса — параллельно.
+    Вердикт сохраняется в Company; возвращает число проверенных."""
+    pending = [
+        c for c in companies
+        if _has_real_email(c) and c.email_verdict not in (deliverability.DELIVERABLE, deliverability.UNDELIVERABLE)
+    ]
+    if not pending:
+        return 0
+    verdicts = await deliverability.verify_many(c.email for c in pending)
+    now = datetime.utcnow()
+    for c in pending:
+        c.email_verdict, c.email_verdict_reason = verdicts[c.email.strip()]
+        c.email_checked_at = now
+    return len(pending)
+
+
 @app.get("/companies")
 def get_companies(
     status: Optional[str] = None,
@@ -143,7 +258,171 @@ def get_companies(
     q = db.query(Company).filter(Company.owner_id == current_user.id)
     if status:
         q = q.filter(Company.status == status)
-    return [_company_dict(c) for c in q.order_by(Company.id.desc()).all()]
+    companies = q.order_by(Company.id.desc()).all()
+    # Счётчики сообщений одним GROUP BY, а не загрузкой переписки каждой компании
+    counts = dict(
+        db.query(ChatMessage.company_id, func.count(ChatMessage.id))
+        .join(Company, Company.id == ChatMessage.company_id)
+        .filter(Company.owner_id == current_user.id)
+        .group_by(ChatMessage.company_id)
+        .all()
+    )
+    return [_company_dict(c, counts.get(c.id, 0)) for c in companies]
+
+
+@app.get("/stats")
+def get_stats(
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    """Счётчики воронки (по статусам и категориям) без загрузки компаний."""
+    return funnel.stats(db, current_user.id)
+
+
+def _save_new_companies(db: Session, owner_id: int, category: str, results: List[dict]) -> List[Company]:
+    """Добавляет в БД компании, которых у пользователя ещё нет."""
+    added = [Company(**_company_fields(owner_id, category, r)) for r in _new_results(db, owner_id, results)]
+    db.add_all(added)
+    return added
+
+
+def _company_fields(owner_id: int, category: str, r: dict) -> dict:
+    return dict(
+        owner_id=owner_id,
+        name=r.get("name"),
+        category=r.get("category") or category,
+        website=r.get("website"),
+        email=r.get("email") or enrichment.fallback_email(r.get("website")),
+        phone=r.get("phone"),
+        address=r.get("address"),
+        description=r.get("description"),
+        status="new",
+    )
+
+
+def _new_results(db: Session, owner_id: int, results: List[dict]) -> List[dict]:
+    """Отсеивает компании, которые у пользователя уже есть.
+
+    Дубликат — совпадение по email, иначе по названию. Существующие записи
+    ищутся двумя запросами на всю пачку, а не отдельным SELECT на компанию.
+    Email приводится к виду normalize_email — так же, как при импорте.
+    """
+    for r in results:
+        if r.get("email"):
+            r["email"] = deliverability.normalize_email(r["email"])
+    emails = {r["email"] for r in results if r.get("email")}
+    names = {r["name"] for r in results if r.get("name")}
+    known_emails = set()
+    known_names = set()
+    if emails:
+        # lower() — для компаний, сохранённых до нормализации адресов
+        known_emails = {e for (e,) in db.query(func.lower(Company.email)).filter(
+            Company.owner_id == owner_id, func.lower(Company.email).in_(emails),
+        )}
+    if names:
+        known_names = {n for (n,) in db.query(Company.name).filter(
+            Company.owner_id == owner_id, Company.name.in_(names),
+        )}
+
+    fresh = []
+    for r in results:
+        if not r.get("name"):
+            continue
+        if (r.get("email") and r["email"] in known_emails) or r["name"] in known_names:
+            continue
+        fresh.append(r)
+        # Дубликаты внутри одной пачки тоже отсекаем
+        if r.get("email"):
+            known_emails.add(r["email"])
+        known_names.add(r["name"])
+    return fresh
+
+
+@app.get("/companies/export")
+def export_companies(
+    format: str = "csv",
+    status: Optional[str] = None,
+    category: Optional[str] = None,
+    current_user: User = Depends(get_current_user),
+):
+    """Выгрузка компаний с историей статусов (CSV или XLSX) потоком:
+    строки читаются из БД пачками и сразу уходят клиенту."""
+    if format not in ("csv", "xlsx"):
+        raise HTTPException(status_code=400, detail="Формат: csv или xlsx")
+    owner_id = current_user.id
+
+    def stream():
+        db = SessionLocal()
+        try:
+            batches = transfer.export_batches(db, owner_id, status=status, category=category)
+            if format == "csv":
+                for chunk in transfer.export_csv(batches):
+                    yield chunk.encode("utf-8")
+            else:
+                yield from transfer.export_xlsx(batches)
+        finally:
+            db.close()
+
+    filename = f"leads-{datetime.utcnow():%Y%m%d-%H%M}.{format}"
+    return StreamingResponse(
+        stream(),
+        media_type=transfer.content_type(format),
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+
+@app.post("/companies/import")
+def import_companies(
+    file: UploadFile = File(...),
+    category: str = Form("Импорт"),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    """Загрузка лидов из CSV/XLSX. Файл читается построчно, строки идут
+    пачками через ту же дедупликацию, что и поиск; commit на пачку."""
+    processed = 0
+    added = 0
+    try:
+        for batch in transfer.batched(transfer.read_rows(file.file, file.filename or "")):
+            processed += len(batch)
+            fresh = [_company_fields(current_user.id, category, r) for r in _new_results(db, current_user.id, batch)]
+            if fresh:
+                # Объекты ORM не нужны — один executemany INSERT на пачку
+                db.execute(insert(Company), fresh)
+            db.commit()
+            added += len(fresh)
+    except transfer.ImportFormatError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    finally:
+        if added:
+            # Новых компаний может быть тысячи — вместо дельт просим UI перечитать список
+            events.resync(current_user.id)
+    return {
+        "message": f"Импортировано {added} из {processed} строк",
+        "processed": processed,
+        "added": added,
+        "skipped": processed - added,
+    }
+
+
+_SEARCH_MAX_OFFSET = 1000     # глубже листать поиск смысла нет, а OFFSET дорог
+
+
+@app.get("/search-local")
+def search_local(
+    q: str,
+    limit: int = 20,
+    offset: int = 0,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    """Полнотекстовый поиск по своим компаниям и переписке (SQLite FTS5)."""
+    if not fulltext.fts_available:
+        raise HTTPException(status_code=503, detail="Полнотекстовый поиск недоступен")
+    limit = min(max(limit, 1), 100)
+    offset = min(max(offset, 0), _SEARCH_MAX_OFFSET)
+    results, has_more = fulltext.search(db, current_user.id, q, limit=limit, offset=offset)
+    return {"results": results, "limit": limit, "offset": offset, "has_more": has_more}
 
 
 @app.post("/search")
@@ -153,37 +432,54 @@ async def start_search(
     current_user: User = Depends(get_current_user),
 ):
     results = await search_companies(req.category, max_results=8)
-    added = []
-    for r in results:
-        existing = None
-        if r.get("email"):
-            existing = db.query(Company).filter(
-                Company.email == r["email"],
-                Company.owner_id == current_user.id,
-            ).first()
-        if not existing:
-            existing = db.query(Company).filter(
-                Company.name == r["name"],
-                Company.owner_id == current_user.id,
-            ).first()
-        if not existing:
-            c = Company(
-                owner_id=current_user.id,
-                name=r.get("name"),
-                category=req.category,
-                website=r.get("website"),
-                email=r.get("email") or f"info@{r.get('website','unknown.com').replace('https://','').split('/')[0]}",
-                phone=r.get("phone"),
-                address=r.get("address"),
-                description=r.get("description"),
-                status="new",
-            )
-            db.add(c)
-            added.append(c)
+    added = _save_new_companies(db, current_user.id, req.category, results)
     db.commit()
+    for c in added:
+        events.company_created(current_user.id, _company_dict(c))
     return {"message": f"Найдено и добавлено {len(added)} новых компаний.", "total_found": len(results)}
 
 
+@app.post("/search/harvest")
+async def start_harvest(
+    req: HarvestRequest,
+    current_user: User = Depends(get_current_user),
+):
+    """Массовый сбор: несколько вариантов запроса параллельно.
+
+    Ответ — NDJSON-поток: по строке на каждую пачку новых компаний
+    и итоговая строка {"type": "done", ...}.
+    """
+    owner_id = current_user.id
+    max_queries = min(max(req.max_queries, 1), 30)
+
+    async def stream():
+        db = SessionLocal()
+        total_found = 0
+        total_added = 0
+        try:
+            async for batch in harvest_companies(req.category, max_queries=max_queries):
+                total_found += len(batch)
+                added = _save_new_companies(db, owner_id, req.category, batch)
+                db.commit()
+                total_added += len(added)
+                if added:
+                    companies = [_company_dict(c) for c in added]
+                    for company in companies:
+                        events.company_created(owner_id, company)
+                    payload = {"type": "companies", "companies": companies}
+                    yield json.dumps(payload, ensure_ascii=False) + "\n"
+            yield json.dumps({
+                "type": "done",
+                "message": f"Найдено и добавлено {total_added} новых компаний.",
+                "added": total_added,
+                "total_found": total_found,
+            }, ensure_ascii=False) + "\n"
+        finally:
+            db.close()
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+
 @app.post("/generate-email/{company_id}")
 async def preview_email(
     company_id: int,
@@ -194,12 +490,67 @@ async def preview_email(
     if not comp:
         raise HTTPException(status_code=404, detail="Компания не найдена")
     email_data = await generate_email(comp.name, comp.category)
-    comp.email_subject = email_data["subject"]
-    comp.email_body = email_data["body"]
+    _set_letter(db, comp, email_data)
     db.commit()
+    events.company_changed(current_user.id, comp.id, email_subject=comp.email_subject, has_email_body=True)
     return email_data
 
 
+@app.get("/company/{company_id}/letter")
+def get_letter(
+    company_id: int,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    """Текст письма компании — распаковывается только здесь, при показе."""
+    comp = db.query(Company).filter(Company.id == company_id, Company.owner_id == current_user.id).first()
+    if not comp:
+        raise HTTPException(status_code=404, detail="Компания не найдена")
+    return {"subject": comp.email_subject or "", "body": body_store.get(db, comp.email_body_hash)}
+
+
+def _set_letter(db: Session, comp: Company, email_data: dict):
+    comp.email_subject = email_data["subject"]
+    comp.email_body_hash = body_store.put(db, email_data["body"])
+
+
+async def _letter_body(db: Session, comp: Company) -> str:
+    """Текст письма компании; если его ещё нет — генерируем и сохраняем."""
+    if comp.email_body_hash:
+        return body_store.get(db, comp.email_body_hash)
+    email_data = await generate_email(comp.name, comp.category)
+    _set_letter(db, comp, email_data)
+    # Запись текста открывает транзакцию на запись: без commit она висела бы
+    # всю отправку, и параллельные записи падали бы с «database is locked»
+    db.commit()
+    return email_data["body"]
+
+
+_SEND_CONCURRENCY = 5          # одновременных генераций/отправок в массовой рассылке
+_BULK_MAX_IDS = 500
+_SEND_LOCK_TTL = 300           # сек: аренда блокировки отправки письма компании
+
+
+def _send_lock(comp: Company):
+    """Блокировка «письмо этой компании сейчас отправляется» — общая для
+    всех воркеров, чтобы двойной клик или две рассылки не дали дубль."""
+    return coordination.lock(f"send:{comp.id}", ttl=_SEND_LOCK_TTL, wait=False)
+
+
+async def _try_send(comp: Company, user: User, body: str, pdf_path: str):
+    """Одна попытка отправки: (успех, текст ошибки, ошибка постоянная)."""
+    try:
+        success = await send_email(
+            comp.email.strip(), comp.email_subject, body, pdf_path,
+            from_email=user.send_email, owner_id=user.id,
+        )
+        return success, "" if success else "send_email вернул False", False
+    except PermanentSendError as e:
+        return False, str(e) or "permanent", True
+    except Exception as e:
+        return False, f"{type(e).__name__}: {e}", False
+
+
 @app.post("/send-email/{company_id}")
 async def send_to_company(
     company_id: int,
@@ -209,32 +560,28 @@ async def send_to_company(
     comp = db.query(Company).filter(Company.id == company_id, Company.owner_id == current_user.id).first()
     if not comp:
         raise HTTPException(status_code=404, detail="Компания не найдена")
-    if not comp.email_body:
-        email_data = await generate_email(comp.name, comp.category)
-        comp.email_subject = email_data["subject"]
-        comp.email_body = email_data["body"]
+    body = await _letter_body(db, comp)
 
-    pdf_path = generate_catalog_pdf()
-    # Используем send_email пользователя как отправителя
-    success = await send_email(
-        comp.email, comp.email_subject, comp.email_body, pdf_path,
-        from_email=current_user.send_email
-    )
-    if success:
-        comp.status = "email_sent"
-        comp.email_sent_at = datetime.utcnow()
-        # Сохраняем письмо в чат как исходящее сообщение
-        msg = ChatMessage(
-            company_id=comp.id,
-            direction="outgoing",
-            author=current_user.name,
-            text=f"📧 **Тема:** {comp.email_subject}\n\n{comp.email_body}",
-        )
-        db.add(msg)
-        db.commit()
-        return {"message": "Письмо успешно отправлено"}
-    else:
-        raise HTTPException(status_code=500, detail="Ошибка при отправке письма")
+    if comp.id in outbox.queued_company_ids(db, current_user.id):
+        raise HTTPException(status_code=409, detail="Письмо уже в очереди повторной отправки")
+
+    async with _send_lock(comp) as acquired:
+        if not acquired:
+            raise HTTPException(status_code=409, detail="Письмо этой компании уже отправляется")
+        pdf_path = generate_catalog_pdf()
+        # Используем send_email пользователя как отправителя
+        success, error, permanent = await _try_send(comp, current_user, body, pdf_path)
+        if success:
+            # Сохраняем письмо в чат как исходящее сообщение
+            msg = outbox.record_delivery(db, comp, current_user.name, comp.email_subject, comp.email_body_hash)
+            db.commit()
+            outbox.publish_delivery(current_user.id, comp, msg, body)
+            return {"message": "Письмо успешно отправлено"}
+        else:
+            outbox.enqueue(db, comp, current_user, pdf_path, error, permanent=permanent)
+            db.commit()
+            detail = "Адрес отвергнут получателем" if permanent else "Ошибка при отправке письма, поставлено в очередь повтора"
+            raise HTTPException(status_code=500, detail=detail)
 
 
 @app.post("/send-all")
@@ -246,58 +593,270 @@ async def send_to_all(
         Company.owner_id == current_user.id,
         Company.status == "new",
     ).all()
+    # Письма, ждущие повтора в outbox, отправит воркер — не дублируем их.
+    # Отвергнутые адреса (dead letter) тоже пропускаем до ручного повтора
+    queued = outbox.queued_company_ids(db, current_user.id, states=("pending", "sending", "dead"))
+    companies = [c for c in companies if c.id not in queued]
     if not companies:
         return {"message": "Нет новых компаний для рассылки"}
 
-    pdf_path = generate_catalog_pdf()
-    sent_count = 0
-    skipped_no_email = 0
-    failed_count = 0
+    counts = await _send_batch(db, current_user, companies)
+    return {"message": _send_summary(counts), **counts}
+
 
+async def _send_batch(db: Session, user: User, companies: List[Company], resend: bool = False) -> dict:
+    """Рассылка по списку компаний: проверка адресов, генерация и отправка
+    параллельно (не больше _SEND_CONCURRENCY сразу), каждый результат
+    фиксируется сразу. resend — писать и компаниям не в статусе new.
+    Возвращает счётчики по исходам."""
+    # Проверка доставляемости всей рассылки до отправки (каждый адрес — один раз)
+    await _verify_companies(companies)
+    db.commit()
+
+    counts = {
+        "sent": 0, "no_email": 0, "undeliverable": 0, "queued": 0, "dead": 0,
+        "sending": 0, "already_sent": 0, "failed": 0,
+    }
+    candidates = []
     for comp in companies:
         # Пропускаем компании без реального email или с явно поддельным
-        email_val = (comp.email or "").strip()
-        has_real_email = (
-            "@" in email_val
-            and "unknown.com" not in email_val
-            and "example.com" not in email_val
-            and len(email_val) > 5
-        )
-        if not has_real_email:
-            skipped_no_email += 1
-            continue
+        if not _has_real_email(comp):
+            counts["no_email"] += 1
+        elif comp.email_verdict == deliverability.UNDELIVERABLE:
+            counts["undeliverable"] += 1
+        else:
+            candidates.append(comp)
+    if not candidates:
+        return counts
+    await _send_each(db, user, candidates, counts, resend=resend)
+    return counts
 
-        # Генерируем письмо если ещё не сгенерировано
-        if not comp.email_body:
-            email_data = await generate_email(comp.name, comp.category)
-            comp.email_subject = email_data["subject"]
-            comp.email_body = email_data["body"]
 
-        success = await send_email(
-            email_val, comp.email_subject, comp.email_body, pdf_path,
-            from_email=current_user.send_email
-        )
-        if success:
-            comp.status = "email_sent"
-            comp.email_sent_at = datetime.utcnow()
-            db.add(ChatMessage(
-                company_id=comp.id,
-                direction="outgoing",
-                author=current_user.name,
-                text=f"📧 **Тема:** {comp.email_subject}\n\n{comp.email_body}",
-            ))
-            sent_count += 1
-        else:
-            failed_count += 1
+def _unsent(db: Session, user: User, comp: Company, sent_at, resend: bool) -> bool:
+    """Компании за время ожидания никто не отправил письмо и не поставил
+    его в очередь outbox."""
+    db.refresh(comp)
+    return (
+        comp.id not in outbox.queued_company_ids(db, user.id)
+        and comp.email_sent_at == sent_at
+        and (resend or comp.status == "new")
+    )
+
+
+async def _send_each(db: Session, user: User, targets: List[Company], counts: dict, resend: bool = False):
+    """Генерация и отправка писем; блокировка компании берётся на время её
+    письма, так что её аренда не истекает в длинной рассылке."""
+    pdf_path = generate_catalog_pdf()
+    semaphore = asyncio.Semaphore(_SEND_CONCURRENCY)
+    sent_at = {c.id: c.email_sent_at for c in targets}
 
+    async def send_one(comp: Company):
+        async with semaphore, _send_lock(comp) as acquired:
+            if not acquired:
+                counts["sending"] += 1
+                return
+            # Список выбран до блокировки: параллельная рассылка (в том числе
+            # в другом воркере) могла успеть отправить письмо и отпустить её
+            if not _unsent(db, user, comp, sent_at[comp.id], resend):
+                counts["already_sent"] += 1
+                return
+            # Генерируем письмо если ещё не сгенерировано
+            body = await _letter_body(db, comp)
+            success, error, permanent = await _try_send(comp, user, body, pdf_path)
+            # Результат фиксируем сразу и до снятия блокировки, без await между
+            # записью и commit: ошибка или отмена соседних отправок не теряет
+            # уже ушедшие письма
+            if success:
+                msg = outbox.record_delivery(db, comp, user.name, comp.email_subject, comp.email_body_hash)
+                db.commit()
+                outbox.publish_delivery(user.id, comp, msg, body)
+                counts["sent"] += 1
+            else:
+                # Неудачное письмо не теряется: повторит воркер outbox
+                outbox.enqueue(db, comp, user, pdf_path, error, permanent=permanent)
+                db.commit()
+                counts["dead" if permanent else "queued"] += 1
+
+    results = await asyncio.gather(*(send_one(c) for c in targets), return_exceptions=True)
+    for comp, result in zip(targets, results):
+        if isinstance(result, Exception):
+            # Письмо не сгенерировалось или не записалось — компания остаётся
+            # new и попадёт в следующую рассылку
+            db.rollback()
+            counts["failed"] += 1
+            print(f"[Send] Ошибка рассылки компании {comp.id}: {type(result).__name__}: {result}")
+
+
+def _send_summary(counts: dict) -> str:
+    parts = [f"Отправлено: {counts['sent']}"]
+    if counts["no_email"]:
+        parts.append(f"без email: {counts['no_email']}")
+    if counts["undeliverable"]:
+        parts.append(f"недоставляемых адресов: {counts['undeliverable']}")
+    if counts["queued"]:
+        parts.append(f"в очереди на повтор: {counts['queued']}")
+    if counts["dead"]:
+        parts.append(f"отвергнуто получателем: {counts['dead']}")
+    if counts["sending"]:
+        parts.append(f"уже отправляются: {counts['sending']}")
+    if counts["already_sent"]:
+        parts.append(f"уже отправлены: {counts['already_sent']}")
+    if counts["failed"]:
+        parts.append(f"ошибок: {counts['failed']}")
+    return " | ".join(parts)
+
+
+@app.post("/companies/bulk")
+async def bulk_operation(
+    req: BulkRequest,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    """Массовая операция над выбранными компаниями.
+
+    operation="status" — смена статуса одним UPDATE, operation="send" —
+    рассылка письма каждой компании (как /send-email, но параллельно);
+    компании не в статусе new пропускаются (skipped), если не задан resend.
+    Чужие и несуществующие id не ломают запрос, а возвращаются в not_found.
+    """
+    ids = list(dict.fromkeys(req.ids))
+    if not ids:
+        raise HTTPException(status_code=400, detail="Не выбрано ни одной компании")
+    if len(ids) > _BULK_MAX_IDS:
+        raise HTTPException(status_code=400, detail=f"Не больше {_BULK_MAX_IDS} компаний за раз")
+    if req.operation not in ("status", "send"):
+        raise HTTPException(status_code=400, detail="Неизвестная операция")
+    if req.operation == "status" and req.status not in VALID_STATUSES:
+        raise HTTPException(status_code=400, detail="Неверный статус")
+
+    # Права проверяем одним запросом на весь список
+    owned_filter = (Company.owner_id == current_user.id, Company.id.in_(ids))
+
+    if req.operation == "status":
+        owned = {company_id for (company_id,) in db.query(Company.id).filter(*owned_filter)}
+        if owned:
+            db.query(Company).filter(Company.id.in_(owned)).update(
+                {Company.status: req.status}, synchronize_session=False,
+            )
+            db.commit()
+        for company_id in owned:
+            events.company_changed(current_user.id, company_id, status=req.status)
+        return {
+            "message": f"Статус изменён у {len(owned)} компаний",
+            "updated": len(owned),
+            "not_found": [i for i in ids if i not in owned],
+        }
+
+    companies = db.query(Company).filter(*owned_filter).all()
+    owned = {c.id for c in companies}
+    # Письма, уже ждущие повтора, не дублируем (как 409 в /send-email)
+    queued = outbox.queued_company_ids(db, current_user.id)
+    already_queued = [c.id for c in companies if c.id in queued]
+    companies = [c for c in companies if c.id not in queued]
+    # Повторное письмо тем, кто уже ответил или в работе, — только явно
+    skipped = [] if req.resend else [c.id for c in companies if c.status != "new"]
+    companies = [c for c in companies if c.id not in skipped]
+    counts = await _send_batch(db, current_user, companies, resend=req.resend)
+    message = _send_summary(counts)
+    if already_queued:
+        message += f" | уже в очереди: {len(already_queued)}"
+    if skipped:
+        message += f" | пропущено (не новые): {len(skipped)}"
+    return {
+        "message": message,
+        **counts,
+        "already_queued": already_queued,
+        "skipped": skipped,
+        "not_found": [i for i in ids if i not in owned],
+    }
+
+
+@app.get("/sent-log")
+async def get_sent_log(
+    recipient: Optional[str] = None,
+    limit: int = 50,
+    before_id: Optional[int] = None,
+    current_user: User = Depends(get_current_user),
+):
+    """Журнал демо-писем пользователя (новые первыми), курсор — before_id."""
+    limit = min(max(limit, 1), 200)
+    entries = await mail_log.read(
+        owner_id=current_user.id, recipient=recipient, limit=limit, before_id=before_id,
+    )
+    next_before_id = entries[-1]["id"] if len(entries) == limit else None
+    return {"entries": entries, "next_before_id": next_before_id}
+
+
+# ─────────────────────────────────────────────
+# Очередь повторной отправки
+# ─────────────────────────────────────────────
+
+def _outbox_dict(m: OutboxMessage):
+    return {
+        "id": m.id,
+        "company_id": m.company_id,
+        "to_email": m.to_email,
+        "subject": m.subject,
+        "state": m.state,
+        "attempts": m.attempts,
+        "next_attempt_at": m.next_attempt_at.isoformat() if m.next_attempt_at else None,
+        "last_error": m.last_error,
+        "created_at": m.created_at.isoformat() if m.created_at else None,
+        "sent_at": m.sent_at.isoformat() if m.sent_at else None,
+    }
+
+
+@app.get("/outbox")
+def get_outbox(
+    state: Optional[str] = None,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    q = db.query(OutboxMessage).filter(OutboxMessage.owner_id == current_user.id)
+    if state:
+        q = q.filter(OutboxMessage.state == state)
+    return [_outbox_dict(m) for m in q.order_by(OutboxMessage.id.desc()).limit(500)]
+
+
+@app.post("/outbox/{message_id}/retry")
+def retry_outbox_message(
+    message_id: int,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    """Возвращает письмо из dead letter (или ускоряет ожидающее) в очередь."""
+    msg = db.query(OutboxMessage).filter(
+        OutboxMessage.id == message_id, OutboxMessage.owner_id == current_user.id,
+    ).first()
+    if not msg:
+        raise HTTPException(status_code=404, detail="Письмо не найдено")
+    if msg.state not in ("dead", "pending"):
+        raise HTTPException(status_code=400, detail="Письмо уже отправляется или отправлено")
+    if msg.state == "dead":
+        msg.attempts = 0
+    msg.state = "pending"
+    msg.next_attempt_at = datetime.utcnow()
     db.commit()
+    return {"message": "Письмо поставлено в очередь", "outbox": _outbox_dict(msg)}
+
 
-    parts = [f"Отправлено: {sent_count}"]
-    if skipped_no_email:
-        parts.append(f"без email: {skipped_no_email}")
-    if failed_count:
-        parts.append(f"ошибка отправки: {failed_count}")
-    return {"message": " | ".join(parts)}
+@app.post("/verify-emails")
+async def verify_emails(
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    """Предварительная проверка доставляемости всех новых компаний."""
+    companies = db.query(Company).filter(
+        Company.owner_id == current_user.id,
+        Company.status == "new",
+    ).all()
+    checked = await _verify_companies(companies)
+    db.commit()
+    counts = {}
+    for c in companies:
+        verdict = c.email_verdict or "not_checked"
+        counts[verdict] = counts.get(verdict, 0) + 1
+    return {"checked": checked, "verdicts": counts}
 
 
 @app.put("/company/{company_id}/status")
@@ -307,14 +866,14 @@ async def update_status(
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user),
 ):
-    valid = ["new", "email_sent", "replied", "in_progress", "interested", "rejected", "closed"]
-    if req.status not in valid:
+    if req.status not in VALID_STATUSES:
         raise HTTPException(status_code=400, detail="Неверный статус")
     comp = db.query(Company).filter(Company.id == company_id, Company.owner_id == current_user.id).first()
     if not comp:
         raise HTTPException(status_code=404, detail="Компания не найдена")
     comp.status = req.status
     db.commit()
+    events.company_changed(current_user.id, comp.id, status=comp.status)
     return {"message": f"Статус изменён на {req.status}"}
 
 # ─────────────────────────────────────────────
@@ -324,22 +883,60 @@ async def update_status(
 @app.get("/company/{company_id}/messages")
 def get_messages(
     company_id: int,
+    limit: int = 50,
+    before_id: Optional[int] = None,
+    after_id: Optional[int] = None,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user),
 ):
-    comp = db.query(Company).filter(Company.id == company_id, Company.owner_id == current_user.id).first()
+    """Переписка страницами, новые сообщения первыми.
+
+    before_id — следующая страница более старых сообщений (курсор из
+    next_before_id), after_id — только сообщения новее указанного, для
+    догрузки после обрыва связи. has_more — есть ли ещё в том же направлении.
+    """
+    comp = db.query(Company.id).filter(Company.id == company_id, Company.owner_id == current_user.id).first()
     if not comp:
         raise HTTPException(status_code=404, detail="Компания не найдена")
-    return [
-        {
-            "id": m.id,
-            "direction": m.direction,
-            "author": m.author,
-            "text": m.text,
-            "created_at": m.created_at.isoformat(),
-        }
-        for m in comp.messages
-    ]
+    limit = min(max(limit, 1), 200)
+
+    q = db.query(ChatMessage).filter(ChatMessage.company_id == company_id)
+    cursor_id = after_id if after_id is not None else before_id
+    if cursor_id is not None:
+        # Курсор по (created_at, id) — идёт по индексу ix_chat_messages_company_created
+        cursor = db.query(ChatMessage.created_at).filter(
+            ChatMessage.id == cursor_id, ChatMessage.company_id == company_id,
+        ).first()
+        if not cursor:
+            raise HTTPException(status_code=400, detail="Неизвестный курсор сообщения")
+        if after_id is not None:
+            q = q.filter(or_(
+                ChatMessage.created_at > cursor.created_at,
+                and_(ChatMessage.created_at == cursor.created_at, ChatMessage.id > cursor_id),
+            ))
+        else:
+            q = q.filter(or_(
+                ChatMessage.created_at < cursor.created_at,
+                and_(ChatMessage.created_at == cursor.created_at, ChatMessage.id < cursor_id),
+            ))
+
+    if after_id is not None:
+        rows = q.order_by(ChatMessage.created_at, ChatMessage.id).limit(limit + 1).all()
+        has_more = len(rows) > limit
+        rows = rows[:limit][::-1]
+    else:
+        rows = q.order_by(ChatMessage.created_at.desc(), ChatMessage.id.desc()).limit(limit + 1).all()
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+
+    next_before_id = rows[-1].id if has_more and after_id is None else None
+    # Тексты писем на странице — одним запросом и только для этой страницы
+    bodies = body_store.get_many(db, (m.body_hash for m in rows))
+    return {
+        "messages": [events.message_dict(m, bodies.get(m.body_hash, "")) for m in rows],
+        "has_more": has_more,
+        "next_before_id": next_before_id,
+    }
 
 
 @app.post("/company/{company_id}/messages")
@@ -365,13 +962,10 @@ def send_message(
         comp.replied_at = datetime.utcnow()
     db.commit()
     db.refresh(msg)
-    return {
-        "id": msg.id,
-        "direction": msg.direction,
-        "author": msg.author,
-        "text": msg.text,
-        "created_at": msg.created_at.isoformat(),
-    }
+    message = events.message_dict(msg)
+    events.company_changed(current_user.id, comp.id, status=comp.status)
+    events.message_appended(current_user.id, comp.id, message)
+    return message
 
 
 @app.post("/simulate-reply/{company_id}")
@@ -397,4 +991,42 @@ async def simulate_reply(
     )
     db.add(msg)
     db.commit()
+    events.company_changed(current_user.id, comp.id, status=comp.status, reply_text=reply_text)
+    events.message_appended(current_user.id, comp.id, events.message_dict(msg))
     return {"message": "Ответ получен!", "reply": reply_text}
+
+# ─────────────────────────────────────────────
+# Профили медленных запросов (для администратора, заголовок X-Profile-Token)
+# ─────────────────────────────────────────────
+
+def require_profiler_token(x_profile_token: str = Header(None)):
+    if not profiler.enabled:
+        raise HTTPException(status_code=404, detail="Профилировщик выключен (PROFILER_TOKEN не задан)")
+    if not profiler.check_token(x_profile_token):
+        raise HTTPException(status_code=403, detail="Неверный токен профилировщика")
+
+
+@app.get("/debug/profiles", dependencies=[Depends(require_profiler_token)])
+async def list_profiles():
+    """Последние профили этого процесса, новые первыми."""
+    return {"threshold_ms": await profiler.threshold(), "profiles": profiler.summaries()}
+
+
+@app.get("/debug/profiles/{profile_id}", dependencies=[Depends(require_profiler_token)])
+def download_profile(profile_id: int):
+    """Профиль в свёрнутом формате (speedscope, flamegraph.pl)."""
+    profile = profiler.get(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="Профиль не найден (вытеснен или снят другим воркером)")
+    return PlainTextResponse(
+        profiler.folded(profile),
+        headers={"Content-Disposition": f'attachment; filename="profile-{profile_id}.folded"'},
+    )
+
+
+@app.put("/debug/profiler", dependencies=[Depends(require_profiler_token)])
+async def update_profiler(req: ProfilerSettingsRequest):
+    """Порог автоматического профилирования меняется без перезапуска — во
+    всех воркерах, если у них общий бэкенд coordination."""
+    await profiler.set_threshold(max(req.threshold_ms, 0))
+    return {"threshold_ms": profiler.threshold_ms}
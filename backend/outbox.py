@@ -0,0 +1,197 @@
+import os
+import random
+import asyncio
+from datetime import datetime, timedelta
+from typing import List, Optional
+
+from sqlalchemy import or_
+
+from .database import SessionLocal, Company, ChatMessage, OutboxMessage, User
+from .email_sender import send_email, PermanentSendError
+from . import events, body_store
+
+# ─────────────────────────────────────────────
+# Очередь повторной отправки писем (outbox)
+#
+# Неудачная отправка не теряется: письмо сохраняется в таблицу outbox и
+# фоновый воркер повторяет его с экспоненциальной задержкой и джиттером.
+# Постоянные ошибки и исчерпанные попытки уходят в dead letter (state=dead),
+# откуда их можно вернуть в очередь вручную.
+# ─────────────────────────────────────────────
+
+MAX_ATTEMPTS = 6
+_BASE_DELAY = 30              # сек до первого повтора
+_MAX_DELAY = 6 * 3600         # потолок задержки
+_LEASE = 300                  # сколько письмо «держит» воркер, прежде чем его заберёт другой
+_POLL_INTERVAL = 15
+_BATCH_SIZE = 20
+_SEND_CONCURRENCY = 5
+WORKER_ENABLED = os.getenv("OUTBOX_WORKER", "true").lower() == "true"
+
+
+def backoff_delay(attempts: int) -> float:
+    """Задержка перед следующей попыткой: экспонента с «равным» джиттером,
+    чтобы повторы многих писем не били в SMTP одновременно."""
+    delay = min(_MAX_DELAY, _BASE_DELAY * 2 ** max(attempts - 1, 0))
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+def record_delivery(db, comp: Company, author: str, subject: str, body_hash: str) -> ChatMessage:
+    """Отмечает компанию как получившую письмо и пишет его в чат (тема — в
+    тексте сообщения, сам текст письма — ссылкой на body_store). Статус
+    двигается вперёд, только если он ещё new: пока письмо ждало в очереди,
+    пользователь мог сам перевести компанию дальше."""
+    if comp.status == "new":
+        comp.status = "email_sent"
+    comp.email_sent_at = datetime.utcnow()
+    msg = ChatMessage(
+        company_id=comp.id,
+        direction="outgoing",
+        author=author,
+        text=f"📧 **Тема:** {subject}",
+        body_hash=body_hash,
+    )
+    db.add(msg)
+    return msg
+
+
+def publish_delivery(owner_id: int, comp: Company, msg: ChatMessage, body: str):
+    """Push в UI после commit: статус компании и новое сообщение в чате."""
+    events.company_changed(
+        owner_id, comp.id,
+        status=comp.status,
+        email_sent_at=comp.email_sent_at.isoformat() if comp.email_sent_at else None,
+        email_subject=comp.email_subject,
+        has_email_body=bool(comp.email_body_hash),
+    )
+    events.message_appended(owner_id, comp.id, events.message_dict(msg, body))
+
+
+def enqueue(db, comp: Company, user: User, attachment_path: Optional[str], error: str,
+            permanent: bool = False) -> OutboxMessage:
+    """Ставит неотправленное письмо в очередь повторов (или сразу в dead letter)."""
+    msg = OutboxMessage(
+        owner_id=user.id,
+        company_id=comp.id,
+        to_email=(comp.email or "").strip(),
+        from_email=user.send_email,
+        author=user.name,
+        subject=comp.email_subject,
+        body_hash=comp.email_body_hash,
+        attachment_path=attachment_path or "",
+        state="dead" if permanent else "pending",
+        attempts=1,
+        next_attempt_at=datetime.utcnow() + timedelta(seconds=backoff_delay(1)),
+        last_error=error[:500],
+    )
+    db.add(msg)
+    return msg
+
+
+def queued_company_ids(db, owner_id: int, states=("pending", "sending")) -> set:
+    """Компании, письмо которым уже ждёт повтора, — их не рассылаем заново."""
+    rows = db.query(OutboxMessage.company_id).filter(
+        OutboxMessage.owner_id == owner_id,
+        OutboxMessage.state.in_(states),
+    )
+    return {company_id for (company_id,) in rows}
+
+
+def _claim_due(db, limit: int) -> List[int]:
+    """Забирает готовые к отправке письма. UPDATE ... WHERE state=... атомарен,
+    поэтому одно письмо не возьмут два воркера (или два процесса)."""
+    now = datetime.utcnow()
+    due = db.query(OutboxMessage.id).filter(
+        or_(OutboxMessage.state == "pending", OutboxMessage.state == "sending"),
+        OutboxMessage.next_attempt_at <= now,
+    ).order_by(OutboxMessage.next_attempt_at).limit(limit).all()
+    claimed = []
+    for (msg_id,) in due:
+        updated = db.query(OutboxMessage).filter(
+            OutboxMessage.id == msg_id,
+            OutboxMessage.state.in_(("pending", "sending")),
+            OutboxMessage.next_attempt_at <= now,
+        ).update({
+            OutboxMessage.state: "sending",
+            OutboxMessage.next_attempt_at: now + timedelta(seconds=_LEASE),
+        }, synchronize_session=False)
+        if updated:
+            claimed.append(msg_id)
+    db.commit()
+    return claimed
+
+
+async def _deliver(msg_id: int, semaphore: asyncio.Semaphore):
+    async with semaphore:
+        db = SessionLocal()
+        try:
+            msg = db.get(OutboxMessage, msg_id)
+            if msg is None or msg.state != "sending":
+                return
+            error = ""
+            permanent = False
+            body = body_store.get(db, msg.body_hash)
+            try:
+                success = await send_email(
+                    msg.to_email, msg.subject, body, msg.attachment_path or None,
+                    from_email=msg.from_email, owner_id=msg.owner_id,
+                )
+                if not success:
+                    error = "send_email вернул False"
+            except PermanentSendError as e:
+                success, permanent, error = False, True, str(e) or "permanent"
+            except Exception as e:
+                success, error = False, f"{type(e).__name__}: {e}"
+
+            msg.attempts += 1
+            delivered = None
+            if success:
+                msg.state = "sent"
+                msg.sent_at = datetime.utcnow()
+                msg.last_error = ""
+                comp = db.get(Company, msg.company_id)
+                if comp is not None:
+                    delivered = (comp, record_delivery(db, comp, msg.author, msg.subject, msg.body_hash))
+                print(f"[Outbox] #{msg.id} отправлено с попытки {msg.attempts}")
+            elif permanent or msg.attempts >= MAX_ATTEMPTS:
+                msg.state = "dead"
+                msg.last_error = error[:500]
+                print(f"[Outbox] #{msg.id} в dead letter: {error}")
+            else:
+                msg.state = "pending"
+                msg.last_error = error[:500]
+                msg.next_attempt_at = datetime.utcnow() + timedelta(seconds=backoff_delay(msg.attempts))
+            db.commit()
+            if delivered is not None:
+                publish_delivery(msg.owner_id, *delivered, body)
+        finally:
+            db.close()
+
+
+async def process_due(limit: int = _BATCH_SIZE) -> int:
+    """Одна итерация воркера: отправить всё, что пора. Возвращает число писем."""
+    db = SessionLocal()
+    try:
+        claimed = _claim_due(db, limit)
+    finally:
+        db.close()
+    if claimed:
+        semaphore = asyncio.Semaphore(_SEND_CONCURRENCY)
+        await asyncio.gather(*(_deliver(msg_id, semaphore) for msg_id in claimed))
+    return len(claimed)
+
+
+async def run_worker():
+    """Фоновый цикл (запускается из lifespan приложения)."""
+    print("[Outbox] Воркер повторной отправки запущен")
+    while True:
+        try:
+            processed = await process_due()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"[Outbox] Ошибка воркера: {e}")
+            processed = 0
+        # Если пачка была полной — сразу берём следующую
+        if processed < _BATCH_SIZE:
+            await asyncio.sleep(_POLL_INTERVAL)
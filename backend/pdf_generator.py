@@ -1,10 +1,11 @@
 import os
-from reportlab.lib.pagesizes import A4
-from reportlab.pdfgen import canvas
-from reportlab.lib import colors
 
 PDF_DIR = "static/pdfs"
-os.makedirs(PDF_DIR, exist_ok=True)
+
+
+def init_storage():
+    """Создаёт каталог для PDF (вызывается из lifespan приложения)."""
+    os.makedirs(PDF_DIR, exist_ok=True)
 
 def generate_catalog_pdf() -> str:
     """Генерация тестового PDF каталога Сибирского кедра"""
@@ -13,7 +14,14 @@ def generate_catalog_pdf() -> str:
     # Если файл уже есть, не пересоздаем
     if os.path.exists(filepath):
         return filepath
-        
+
+    # reportlab нужен только для первой генерации — не грузим его при старте
+    from reportlab.lib.pagesizes import A4
+    from reportlab.pdfgen import canvas
+    from reportlab.lib import colors
+
+    init_storage()
+
     c = canvas.Canvas(filepath, pagesize=A4)
     width, height = A4
     
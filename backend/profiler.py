@@ -0,0 +1,267 @@
+import os
+import sys
+import hmac
+import time
+import asyncio
+import threading
+from collections import Counter, deque
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from . import coordination
+
+# ─────────────────────────────────────────────
+# Сэмплирующий профилировщик медленных запросов
+#
+# Включается заданием PROFILER_TOKEN. Профиль снимается:
+#   — с любого запроса дольше порога (PROFILER_THRESHOLD_MS, 0 — выключено;
+#     порог меняется на лету через PUT /debug/profiler и хранится в
+#     coordination, так что с бэкендом sqlite действует на все воркеры);
+#   — по запросу администратора: заголовок X-Profile: <PROFILER_TOKEN>.
+# Фоновый поток раз в interval снимает стек каждого идущего запроса:
+# настоящий стек, если задача запроса сейчас выполняется в event loop, иначе
+# цепочку await (где запрос ждёт — Tavily, SMTP, БД). Отдельно пишутся
+# занятые потоки threadpool (синхронные эндпоинты): чей поток — не видно,
+# поэтому при нескольких идущих запросах такие сэмплы помечаются [shared].
+# Стеки хранятся в «свёрнутом» формате (folded: кадры через «;»
+# и число сэмплов) — его открывают speedscope и flamegraph.pl.
+# Последние PROFILER_KEEP профилей живут в памяти процесса: у каждого
+# воркера uvicorn — свои.
+# ─────────────────────────────────────────────
+
+TOKEN = os.getenv("PROFILER_TOKEN", "")
+_KEEP = int(os.getenv("PROFILER_KEEP", "20"))
+_INTERVAL = int(os.getenv("PROFILER_INTERVAL_MS", "10")) / 1000
+_MAX_DEPTH = 64
+_THRESHOLD_KEY = "profiler:threshold_ms"
+_THRESHOLD_TTL = 10 * 365 * 86400   # сек: порог, заданный через API, живёт до смены
+_THRESHOLD_REFRESH = 5.0            # сек: как часто воркер перечитывает общий порог
+# Кадры простаивающих потоков (ждут задачу в очереди) — не сэмплы
+_IDLE_FILES = ("threading.py", "queue.py", "selectors.py", os.path.join("concurrent", "futures", "thread.py"))
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})"
+
+
+def _thread_stack(frame) -> List:
+    """Кадры потока от корня к листу."""
+    frames = []
+    while frame is not None and len(frames) < _MAX_DEPTH:
+        frames.append(frame)
+        frame = frame.f_back
+    frames.reverse()
+    return frames
+
+
+def _await_chain(coro) -> List:
+    """Цепочка await приостановленной корутины: от корня к месту ожидания."""
+    frames = []
+    while coro is not None and len(frames) < _MAX_DEPTH:
+        frame = getattr(coro, "cr_frame", None) or getattr(coro, "gi_frame", None)
+        if frame is None:
+            break
+        frames.append(frame)
+        coro = getattr(coro, "cr_await", None) or getattr(coro, "gi_yieldfrom", None)
+    return frames
+
+
+class _Request:
+    __slots__ = ("task", "samples")
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.samples: Counter = Counter()
+
+
+class SamplingProfiler:
+    def __init__(self, keep: int = _KEEP, interval: float = _INTERVAL):
+        self.threshold_ms = int(os.getenv("PROFILER_THRESHOLD_MS", "0"))
+        self._threshold_checked = float("-inf")
+        self.interval = interval
+        self.profiles: deque = deque(maxlen=keep)
+        self._active: Dict[int, _Request] = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread = 0
+        self._next_id = 1
+
+    @property
+    def enabled(self) -> bool:
+        return bool(TOKEN)
+
+    async def threshold(self) -> int:
+        """Порог в мс: общий для воркеров, перечитывается не чаще раза в
+        _THRESHOLD_REFRESH сек. Пока его не меняли — PROFILER_THRESHOLD_MS."""
+        now = time.monotonic()
+        if now - self._threshold_checked >= _THRESHOLD_REFRESH:
+            self._threshold_checked = now
+            try:
+                value = await coordination.get_backend().get(_THRESHOLD_KEY)
+            except Exception as e:
+                print(f"[Profiler] Порог недоступен: {e}")
+                value = None
+            if value is not None:
+                self.threshold_ms = int(value)
+        return self.threshold_ms
+
+    async def set_threshold(self, value: int):
+        await coordination.get_backend().set(_THRESHOLD_KEY, value, _THRESHOLD_TTL)
+        self.threshold_ms = value
+        self._threshold_checked = time.monotonic()
+
+    def begin(self) -> int:
+        """Начать сэмплирование текущего запроса. Возвращает id профиля."""
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread = threading.get_ident()
+        request = _Request(asyncio.current_task())
+        with self._lock:
+            profile_id = self._next_id
+            self._next_id += 1
+            self._active[profile_id] = request
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+                self._thread.start()
+        self._wake.set()
+        return profile_id
+
+    def end(self, profile_id: int) -> Counter:
+        with self._lock:
+            request = self._active.pop(profile_id)
+            if not self._active:
+                self._wake.clear()
+            return request.samples
+
+    def store(self, profile_id: int, meta: dict, samples: Counter):
+        self.profiles.append({
+            "id": profile_id,
+            "pid": os.getpid(),
+            "samples": sum(samples.values()),
+            "interval_ms": round(self.interval * 1000, 2),
+            **meta,
+            "stacks": samples,
+        })
+
+    def get(self, profile_id: int) -> Optional[dict]:
+        return next((p for p in self.profiles if p["id"] == profile_id), None)
+
+    def check_token(self, value: Optional[str]) -> bool:
+        return self.enabled and bool(value) and hmac.compare_digest(value.encode(), TOKEN.encode())
+
+    @staticmethod
+    def folded(profile: dict) -> str:
+        """Профиль в свёрнутом формате: «кадр;кадр;... число» на строку."""
+        return "".join(f"{stack} {count}\n" for stack, count in profile["stacks"].most_common())
+
+    def summaries(self) -> List[dict]:
+        """Метаданные профилей, новые первыми (без самих стеков)."""
+        return [{k: v for k, v in p.items() if k != "stacks"} for p in reversed(self.profiles)]
+
+    # ── Фоновый поток ──
+
+    def _run(self):
+        while True:
+            self._wake.wait()
+            try:
+                self._sample()
+            except Exception as e:
+                print(f"[Profiler] Ошибка сэмплирования: {e}")
+            time.sleep(self.interval)
+
+    def _sample(self):
+        with self._lock:
+            requests = list(self._active.values())
+        if not requests:
+            return
+        frames = sys._current_frames()
+        running = asyncio.current_task(self._loop) if self._loop is not None else None
+        names = {t.ident: t.name for t in threading.enumerate()}
+        me = threading.get_ident()
+
+        threads = []
+        for ident, frame in frames.items():
+            if ident in (me, self._loop_thread):
+                continue
+            if frame.f_code.co_filename.endswith(_IDLE_FILES):
+                continue
+            labels = [f"[thread {names.get(ident, ident)}]"] + [_frame_label(f) for f in _thread_stack(frame)]
+            threads.append(";".join(labels))
+
+        for request in requests:
+            if request.task is running:
+                stack = _thread_stack(frames.get(self._loop_thread))
+            else:
+                stack = _await_chain(request.task.get_coro())
+            stack = _below_middleware(stack)
+            key = ";".join(_frame_label(f) for f in stack) or "[idle]"
+            if request.task is not running:
+                key += ";[await]"
+            with self._lock:
+                request.samples[key] += 1
+                for thread_key in threads:
+                    # Поток threadpool нельзя привязать к запросу: единственному
+                    # идущему отдаём его как есть, иначе — с пометкой
+                    request.samples[thread_key if len(requests) == 1 else "[shared];" + thread_key] += 1
+
+
+profiler = SamplingProfiler()
+
+
+def _below_middleware(stack: List) -> List:
+    # Кадры uvicorn/starlette над middleware одинаковы у всех запросов — отрезаем
+    for i in range(len(stack) - 1, -1, -1):
+        if stack[i].f_code is ProfilerMiddleware.__call__.__code__:
+            return stack[i + 1:]
+    return stack
+
+
+class ProfilerMiddleware:
+    """ASGI middleware: снимает профиль медленных запросов и запросов
+    с заголовком X-Profile. Без PROFILER_TOKEN ничего не делает."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not profiler.enabled or scope["path"].startswith(("/debug/", "/static/")):
+            return await self.app(scope, receive, send)
+        headers = dict(scope.get("headers") or [])
+        forced = profiler.check_token(headers.get(b"x-profile", b"").decode("latin-1"))
+        threshold_ms = await profiler.threshold()
+        if not forced and threshold_ms <= 0:
+            return await self.app(scope, receive, send)
+
+        profile_id = profiler.begin()
+        status = 0
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if forced:
+                    message.setdefault("headers", [])
+                    message["headers"] = list(message["headers"]) + [(b"x-profile-id", str(profile_id).encode())]
+            await send(message)
+
+        started_at = datetime.utcnow()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            duration_ms = (time.perf_counter() - started) * 1000
+            samples = profiler.end(profile_id)
+            if forced or duration_ms >= threshold_ms:
+                profiler.store(profile_id, {
+                    "method": scope["method"],
+                    "path": scope["path"],
+                    "query": scope.get("query_string", b"").decode("latin-1"),
+                    "status": status,
+                    "duration_ms": round(duration_ms, 1),
+                    "started_at": started_at.isoformat(),
+                    "trigger": "header" if forced else "threshold",
+                }, samples)
+                print(f"[Profiler] #{profile_id} {scope['method']} {scope['path']}: "
+                      f"{duration_ms:.0f} мс, {sum(samples.values())} сэмплов")
@@ -0,0 +1,189 @@
+import time
+import threading
+from collections import OrderedDict, deque
+from typing import Dict, Optional
+
+# ─────────────────────────────────────────────
+# Circuit breaker + адаптивные таймауты для внешних зависимостей
+# (Tavily, OpenAI) и для каждого парсимого хоста
+# ─────────────────────────────────────────────
+
+_LATENCY_WINDOW = 50          # Сколько последних замеров держим для перцентилей
+_MIN_SAMPLES = 5              # До этого числа замеров используем таймаут по умолчанию
+_TIMEOUT_MULTIPLIER = 3.0     # Таймаут = p95 * множитель
+_MAX_HOSTS = 2000             # Сколько хостов помним (LRU)
+
+
+class CircuitOpenError(Exception):
+    """Зависимость признана недоступной — запрос отклонён без сетевого вызова."""
+
+    def __init__(self, name: str, retry_in: float):
+        super().__init__(f"{name}: circuit open, повтор через {retry_in:.0f} сек")
+        self.name = name
+        self.retry_in = retry_in
+
+
+class CircuitBreaker:
+    """Классический автомат closed → open → half-open.
+
+    closed    — запросы идут, считаем подряд идущие ошибки;
+    open      — после failure_threshold ошибок запросы отклоняются сразу;
+    half-open — через recovery_time пропускаем ОДИН пробный запрос:
+                успех закрывает цепь, ошибка снова открывает её.
+    """
+
+    def __init__(self, name: str, failure_threshold: int = 3, recovery_time: float = 30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_time = recovery_time
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probe_in_flight = False
+        self._probe_started = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open" and time.monotonic() - self.opened_at >= self.recovery_time:
+                self.state = "half_open"
+                self._probe_in_flight = False
+            # Пробный запрос мог потеряться (отмена задачи) — не ждём его вечно
+            probe_stale = time.monotonic() - self._probe_started >= self.recovery_time
+            if self.state == "half_open" and (not self._probe_in_flight or probe_stale):
+                self._probe_in_flight = True
+                self._probe_started = time.monotonic()
+                return True
+            return False
+
+    def check(self):
+        """Как allow(), но бросает CircuitOpenError."""
+        if not self.allow():
+            raise CircuitOpenError(self.name, self.retry_in())
+
+    def retry_in(self) -> float:
+        return max(self.recovery_time - (time.monotonic() - self.opened_at), 0.0)
+
+    def record_success(self):
+        with self._lock:
+            if self.state != "closed":
+                print(f"[Circuit] {self.name}: восстановлен")
+            self.state = "closed"
+            self.failures = 0
+            self._probe_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._probe_in_flight = False
+            if self.state == "half_open" or self.failures >= self.failure_threshold:
+                if self.state != "open":
+                    print(f"[Circuit] {self.name}: открыт после {self.failures} ошибок")
+                self.state = "open"
+                self.opened_at = time.monotonic()
+
+
+class AdaptiveTimeout:
+    """Таймаут по наблюдаемым задержкам: p95 * множитель в пределах [min, max]."""
+
+    def __init__(self, default: float, minimum: float = 2.0, maximum: Optional[float] = None):
+        self.default = default
+        self.minimum = minimum
+        self.maximum = maximum if maximum is not None else default
+        self._samples = deque(maxlen=_LATENCY_WINDOW)
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, q: float) -> Optional[float]:
+        with self._lock:
+            if not self._samples:
+                return None
+            ordered = sorted(self._samples)
+        index = min(int(round(q * (len(ordered) - 1))), len(ordered) - 1)
+        return ordered[index]
+
+    @property
+    def samples(self) -> int:
+        return len(self._samples)
+
+    def timeout(self, fallback: Optional[float] = None) -> float:
+        """fallback — таймаут, пока своих замеров мало (например, общий по всем хостам)."""
+        if self.samples < _MIN_SAMPLES:
+            return fallback if fallback is not None else self.default
+        p95 = self.percentile(0.95)
+        return min(max(p95 * _TIMEOUT_MULTIPLIER, self.minimum), self.maximum)
+
+
+class Dependency:
+    """Circuit breaker и адаптивный таймаут одной зависимости."""
+
+    def __init__(self, name: str, default_timeout: float, failure_threshold: int = 3,
+                 recovery_time: float = 30.0, min_timeout: float = 2.0):
+        self.name = name
+        self.breaker = CircuitBreaker(name, failure_threshold, recovery_time)
+        self.latency = AdaptiveTimeout(default_timeout, minimum=min_timeout)
+
+    def timeout(self, fallback: Optional[float] = None) -> float:
+        return self.latency.timeout(fallback)
+
+    def record_success(self, started: float):
+        self.latency.observe(time.monotonic() - started)
+        self.breaker.record_success()
+
+    def record_failure(self):
+        self.breaker.record_failure()
+
+    def snapshot(self) -> dict:
+        p50 = self.latency.percentile(0.5)
+        p95 = self.latency.percentile(0.95)
+        return {
+            "state": self.breaker.state,
+            "failures": self.breaker.failures,
+            "timeout": round(self.timeout(), 2),
+            "p50": round(p50, 3) if p50 is not None else None,
+            "p95": round(p95, 3) if p95 is not None else None,
+        }
+
+
+_dependencies: Dict[str, Dependency] = {}
+_hosts: "OrderedDict[str, Dependency]" = OrderedDict()
+_registry_lock = threading.Lock()
+
+
+def dependency(name: str, default_timeout: float, **kwargs) -> Dependency:
+    """Зарегистрированная зависимость по имени (создаётся при первом обращении)."""
+    with _registry_lock:
+        dep = _dependencies.get(name)
+        if dep is None:
+            dep = _dependencies[name] = Dependency(name, default_timeout, **kwargs)
+        return dep
+
+
+def host_dependency(host: str, default_timeout: float) -> Dependency:
+    """Зависимость для парсимого хоста. Один таймаут — и хост считается мёртвым
+    на 10 минут, после чего пробуем его одним запросом."""
+    with _registry_lock:
+        dep = _hosts.get(host)
+        if dep is None:
+            dep = _hosts[host] = Dependency(
+                f"host:{host}", default_timeout, failure_threshold=1, recovery_time=600.0,
+            )
+            if len(_hosts) > _MAX_HOSTS:
+                _hosts.popitem(last=False)
+        else:
+            _hosts.move_to_end(host)
+        return dep
+
+
+def snapshot() -> dict:
+    """Состояние всех зависимостей и число «мёртвых» хостов — для /health."""
+    with _registry_lock:
+        deps = {name: dep.snapshot() for name, dep in _dependencies.items()}
+        open_hosts = sum(1 for dep in _hosts.values() if dep.breaker.state != "closed")
+        tracked_hosts = len(_hosts)
+    return {"dependencies": deps, "hosts": {"tracked": tracked_hosts, "open": open_hosts}}
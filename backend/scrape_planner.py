@@ -0,0 +1,161 @@
+import asyncio
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
+from typing import Dict, List
+
+from sqlalchemy import case, update
+from sqlalchemy.exc import IntegrityError
+
+from .contact_discovery import MAX_CONTACT_PAGES
+from .database import SessionLocal, HostProfile
+
+# ─────────────────────────────────────────────
+# План парсинга сайта по истории прошлых обходов
+#
+# Для каждого хоста помним задержку, путь страницы, где нашёлся email, и
+# сколько визитов подряд прошли впустую. Перед обходом строим план:
+# тупиковые хосты пропускаем, известную страницу с email грузим первой,
+# медленным хостам урезаем число страниц. Статистика живёт в таблице
+# host_profiles, горячие записи — в памяти. Итог визита прибавляется к
+# сохранённой строке одним UPDATE: у каждого воркера свой кэш, и запись
+# кэшированного объекта целиком затирала бы визиты соседей. После записи
+# кэш заменяется свежей строкой из базы.
+# ─────────────────────────────────────────────
+
+_DEAD_END_STREAK = 3              # визитов подряд без email — хост считаем тупиком
+_DEAD_END_TTL = timedelta(days=14)  # после этого тупик снова пробуем один раз
+_SLOW_HOST = 4.0                  # сек на страницу: медленный хост, грузим минимум
+_LATENCY_ALPHA = 0.3              # вес нового замера в скользящем среднем
+_CACHE_SIZE = 5000
+
+
+class ScrapePlan:
+    def __init__(self, skip: bool = False, first_path: str = "",
+                 contact_pages: int = MAX_CONTACT_PAGES, use_sitemap: bool = True):
+        self.skip = skip
+        self.first_path = first_path          # сначала грузим эту страницу
+        self.contact_pages = contact_pages    # сколько кандидатов в контакты проверять
+        self.use_sitemap = use_sitemap
+
+
+def _new_profile(host: str) -> HostProfile:
+    return HostProfile(
+        host=host, visits=0, productive_visits=0, empty_streak=0, emails_found=0,
+        pages_fetched=0, email_path="", avg_latency=0.0, last_visit_at=None,
+    )
+
+
+def _load(host: str) -> HostProfile:
+    db = SessionLocal()
+    try:
+        row = db.get(HostProfile, host)
+        if row is None:
+            return _new_profile(host)
+        db.expunge(row)
+        return row
+    finally:
+        db.close()
+
+
+def _save_visit(host: str, pages: int, latency: float, email_path: str, emails: int) -> HostProfile:
+    values = {
+        "visits": HostProfile.visits + 1,
+        "pages_fetched": HostProfile.pages_fetched + pages,
+        "last_visit_at": datetime.utcnow(),
+    }
+    if pages:
+        values["avg_latency"] = case(
+            (HostProfile.avg_latency == 0, latency),
+            else_=_LATENCY_ALPHA * latency + (1 - _LATENCY_ALPHA) * HostProfile.avg_latency,
+        )
+    if emails:
+        values.update(
+            productive_visits=HostProfile.productive_visits + 1,
+            emails_found=HostProfile.emails_found + emails,
+            empty_streak=0,
+            email_path=email_path,
+        )
+    else:
+        values.update(empty_streak=HostProfile.empty_streak + 1, email_path="")
+
+    db = SessionLocal()
+    try:
+        if db.get(HostProfile, host) is None:
+            db.add(_new_profile(host))
+            try:
+                db.commit()
+            except IntegrityError:
+                db.rollback()     # строку успел создать соседний воркер
+        db.execute(update(HostProfile).where(HostProfile.host == host).values(values))
+        db.commit()
+        row = db.get(HostProfile, host, populate_existing=True)
+        db.expunge(row)
+        return row
+    finally:
+        db.close()
+
+
+class ScrapePlanner:
+    def __init__(self, cache_size: int = _CACHE_SIZE):
+        self._cache: "OrderedDict[str, HostProfile]" = OrderedDict()
+        self._cache_size = cache_size
+        self._locks: Dict[str, List] = {}     # хост → [asyncio.Lock, сколько ждут]
+
+    @asynccontextmanager
+    async def _host_lock(self, host: str):
+        entry = self._locks.setdefault(host, [asyncio.Lock(), 0])
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                yield
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self._locks[host]
+
+    async def _profile(self, host: str) -> HostProfile:
+        profile = self._cache.get(host)
+        if profile is None:
+            profile = await asyncio.to_thread(_load, host)
+            self._cache[host] = profile
+            while len(self._cache) > self._cache_size:
+                self._cache.popitem(last=False)
+        else:
+            self._cache.move_to_end(host)
+        return profile
+
+    async def plan(self, host: str) -> ScrapePlan:
+        try:
+            p = await self._profile(host)
+        except Exception as e:
+            print(f"[Scraper] История хоста {host} недоступна: {e}")
+            return ScrapePlan()
+        if not p.visits:
+            return ScrapePlan()
+        recent = p.last_visit_at is not None and datetime.utcnow() - p.last_visit_at < _DEAD_END_TTL
+        if p.empty_streak >= _DEAD_END_STREAK and recent:
+            return ScrapePlan(skip=True)
+        if p.avg_latency >= _SLOW_HOST:
+            return ScrapePlan(first_path=p.email_path, contact_pages=1, use_sitemap=False)
+        return ScrapePlan(first_path=p.email_path)
+
+    async def record(self, host: str, pages: int, latency: float, email_path: str, emails: int):
+        """Итог обхода: pages страниц, latency — средняя задержка на страницу,
+        email_path — где нашёлся email ("" — не нашёлся)."""
+        async with self._host_lock(host):
+            await self._record(host, pages, latency, email_path, emails)
+
+    async def _record(self, host: str, pages: int, latency: float, email_path: str, emails: int):
+        try:
+            p = await asyncio.to_thread(_save_visit, host, pages, latency, email_path, emails)
+        except Exception as e:
+            print(f"[Scraper] Не удалось сохранить историю {host}: {e}")
+            return
+        self._cache[host] = p
+        self._cache.move_to_end(host)
+        while len(self._cache) > self._cache_size:
+            self._cache.popitem(last=False)
+
+
+planner = ScrapePlanner()
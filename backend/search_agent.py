@@ -1,10 +1,19 @@
 import os
 import json
 import re
+import time
 import asyncio
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, AsyncIterator, Tuple
+from urllib.parse import urlsplit
 from dotenv import load_dotenv
 
+from . import coordination
+from .contact_discovery import (
+    MAX_CONTACT_PAGES, extract_links, rank_contact_pages, parse_sitemap, extract_phones, extract_address,
+)
+from .resilience import CircuitOpenError, dependency, host_dependency
+from .scrape_planner import planner
+
 # Абсолютный путь к Credentials.env — работает независимо от CWD запуска
 _BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 load_dotenv(os.path.join(_BASE_DIR, "Credentials.env"))
@@ -12,11 +21,43 @@ load_dotenv(os.path.join(_BASE_DIR, "Credentials.env"))
 TAVILY_API_KEY = os.getenv("TAVILY_API_KEY", "")
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY", "")
 
-print(f"[search_agent] TAVILY_API_KEY present: {bool(TAVILY_API_KEY)}, OPENAI_API_KEY present: {bool(OPENAI_API_KEY)}")
+
+def log_key_status():
+    """Диагностика ключей при старте приложения (не при импорте модуля)."""
+    print(f"[search_agent] TAVILY_API_KEY present: {bool(TAVILY_API_KEY)}, OPENAI_API_KEY present: {bool(OPENAI_API_KEY)}")
 
 # Настройки парсинга
 _SCRAPE_TIMEOUT = 8          # Таймаут на загрузку страницы (сек)
 _MAX_SCRAPE_PAGES = 8        # Максимум сайтов для параллельного парсинга
+_SCRAPE_CONCURRENCY = 16     # Общий лимит одновременно парсящихся сайтов (на все воркеры)
+_SCRAPE_CACHE_TTL = 6 * 3600  # Сколько помним найденные на сайте email (сек)
+_USE_SITEMAP = os.getenv("SCRAPE_USE_SITEMAP", "true").lower() == "true"  # sitemap.xml, если ссылок нет
+_TAVILY_TIMEOUT = 30         # Таймаут запроса к Tavily (сек), пока нет замеров задержки
+_OPENAI_TIMEOUT = 60         # То же для OpenAI
+_TAVILY_CONCURRENCY = 4      # Одновременных запросов к Tavily (на все воркеры)
+_TAVILY_CACHE_TTL = 3 * 3600  # Одинаковый запрос к Tavily повторно не платим (сек)
+
+# Настройки массового сбора (harvest)
+_HARVEST_MAX_QUERIES = 12    # Бюджет запросов к Tavily на один сбор
+_HARVEST_PER_QUERY = 20      # Результатов на один запрос
+# Варианты формулировок: один и тот же запрос Tavily возвращает одни и те же
+# сайты, поэтому для сбора расширяем нишу/город разными хвостами
+_HARVEST_QUERY_TEMPLATES = [
+    "{category} компания контакты сайт официальный",
+    "{category} официальный сайт email",
+    "{category} ООО контакты телефон",
+    "{category} список компаний",
+    "{category} каталог организаций",
+    "{category} услуги цены заказать",
+    "{category} адрес телефон почта",
+    "{category} лучшие компании рейтинг",
+    "{category} отзывы клиентов",
+    "{category} для бизнеса корпоративным клиентам",
+    "{category} производитель поставщик",
+    "{category} ИП контакты",
+    "{category} прайс-лист",
+    "{category} реквизиты организации",
+]
 _EMAIL_REGEX = re.compile(r"[a-zA-Z0-9._%+\-]+@[a-zA-Z0-9.\-]+\.[a-zA-Z]{2,}")
 # Мусорные email-домены, которые нужно исключить
 _JUNK_EMAIL_DOMAINS = {
@@ -76,6 +117,14 @@ def _clean_url(url: str) -> str:
     return match.group(1).rstrip("/") if match else url
 
 
+def _normalize_host(url: str) -> str:
+    """Нормализованный хост для дедупликации: без схемы, www., порта и пути."""
+    host = re.sub(r"^[a-zA-Z][a-zA-Z0-9+.\-]*://", "", (url or "").strip())
+    host = host.split("/", 1)[0].split("?", 1)[0].split("#", 1)[0]
+    host = host.rsplit("@", 1)[-1].split(":", 1)[0].lower().rstrip(".")
+    return host[4:] if host.startswith("www.") else host
+
+
 def _filter_emails(raw_emails: List[str]) -> List[str]:
     """Фильтрует технические / мусорные email-адреса."""
     result = []
@@ -98,62 +147,237 @@ def _filter_emails(raw_emails: List[str]) -> List[str]:
     return result
 
 
+_SCRAPE_HEADERS = {
+    "User-Agent": (
+        "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
+        "AppleWebKit/537.36 (KHTML, like Gecko) "
+        "Chrome/121.0.0.0 Safari/537.36"
+    ),
+    "Accept-Language": "ru-RU,ru;q=0.9",
+}
+
+
+def _host_timeout(host_dep) -> float:
+    """Таймаут для хоста: по его задержкам, а пока замеров мало — по всем сайтам."""
+    scrape = dependency("scrape", _SCRAPE_TIMEOUT)
+    return host_dep.timeout(fallback=scrape.timeout())
+
+
+class _FetchStats:
+    """Сколько страниц обхода действительно запрошено и сколько это заняло.
+    Пропущенные открытым breaker запросы не считаются: в историю хоста они
+    попали бы пустыми визитами без единого обращения к сайту."""
+
+    def __init__(self):
+        self.pages = 0
+        self.fetch_time = 0.0
+
+
+async def _fetch_page(client, page_url: str, stats: Optional[_FetchStats] = None) -> Optional[Tuple[str, str]]:
+    """GET страницы: (html, итоговый URL после редиректов) или None.
+
+    Хост с открытым circuit breaker не запрашивается вовсе: один сетевой сбой
+    (таймаут, отказ в соединении) отключает его на время восстановления.
+    Состоявшийся запрос учитывается в stats.
+    """
+    import httpx
+
+    host_dep = host_dependency(urlsplit(page_url).netloc.lower(), _SCRAPE_TIMEOUT)
+    if not host_dep.breaker.allow():
+        return None
+    started = time.monotonic()
+    try:
+        resp = await client.get(page_url, headers=_SCRAPE_HEADERS, timeout=_host_timeout(host_dep))
+    except httpx.TransportError:
+        host_dep.record_failure()
+        return None
+    except Exception:
+        host_dep.breaker.record_success()  # Хост ответил, но ответ не разобрался
+        return None
+    finally:
+        if stats is not None:
+            stats.pages += 1
+            stats.fetch_time += time.monotonic() - started
+    # Любой HTTP-ответ, даже 404, значит что хост жив
+    host_dep.record_success(started)
+    dependency("scrape", _SCRAPE_TIMEOUT).latency.observe(time.monotonic() - started)
+    if resp.status_code == 200:
+        return resp.text, str(resp.url)
+    return None
+
+
+async def _discover_contact_pages(client, html: Optional[str], page_url: str, base: str,
+                                  limit: int = MAX_CONTACT_PAGES, use_sitemap: bool = _USE_SITEMAP) -> List[str]:
+    """Кандидаты на страницу контактов: ссылки с уже загруженной страницы,
+    при их отсутствии — sitemap.xml, в крайнем случае — /contacts."""
+    if html:
+        candidates = rank_contact_pages(extract_links(html, page_url), exclude=page_url, limit=limit)
+        if candidates:
+            return candidates
+
+    if use_sitemap:
+        sitemap = await _fetch_page(client, f"{base}/sitemap.xml")
+        if sitemap:
+            locs = parse_sitemap(sitemap[0])
+            # Индекс sitemap: заглядываем в один дочерний файл (обычно страницы сайта)
+            if locs and all(loc.lower().endswith(".xml") for loc in locs[:5]):
+                child = next((loc for loc in locs if "page" in loc.lower()), locs[0])
+                nested = await _fetch_page(client, child)
+                locs = parse_sitemap(nested[0]) if nested else []
+            candidates = rank_contact_pages([(loc, "") for loc in locs], exclude=page_url, limit=limit)
+            if candidates:
+                return candidates
+
+    return [f"{base}/contacts"]
+
+
+def _page_path(page_url: str) -> str:
+    parts = urlsplit(page_url)
+    return (parts.path or "/") + (f"?{parts.query}" if parts.query else "")
+
+
 async def _scrape_emails_from_url(url: str) -> List[str]:
     """
     Загружает страницу и ищет email-адреса в HTML.
-    Пробует главную страницу, потом /contacts или /contact.
+    Затем находит страницу контактов по ссылкам с этой страницы
+    (текст ссылки + токены URL) и загружает только лучших кандидатов.
+
+    Обход планируется по истории хоста (scrape_planner): тупики пропускаются,
+    страница, где email нашёлся в прошлый раз, загружается первой.
     """
     try:
         import httpx
     except ImportError:
         return []
 
+    host = urlsplit(url).netloc.lower().removeprefix("www.")
+    plan = await planner.plan(host)
+    if plan.skip:
+        print(f"[Scraper] [skip] {host}: email здесь не находился, пропускаем")
+        return []
+
     base = _clean_url(url)
-    pages_to_try = [url, f"{base}/contacts", f"{base}/contact", f"{base}/о-компании"]
     found: List[str] = []
-
-    headers = {
-        "User-Agent": (
-            "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
-            "AppleWebKit/537.36 (KHTML, like Gecko) "
-            "Chrome/121.0.0.0 Safari/537.36"
-        ),
-        "Accept-Language": "ru-RU,ru;q=0.9",
-    }
+    email_path = ""
+    stats = _FetchStats()
 
     async with httpx.AsyncClient(
         timeout=_SCRAPE_TIMEOUT,
         follow_redirects=True,
         verify=False,          # Некоторые сайты используют самоподписанные сертификаты
     ) as client:
-        for page_url in pages_to_try:
-            try:
-                resp = await client.get(page_url, headers=headers)
-                if resp.status_code == 200:
-                    text = resp.text
-                    emails = _EMAIL_REGEX.findall(text)
-                    filtered = _filter_emails(emails)
-                    found.extend(filtered)
-                    # Если нашли что-то на главной — контакты дополнительно проверим
-                    if filtered and page_url == url:
-                        continue
-                    elif filtered:
-                        break
-            except Exception:
-                pass  # Страница недоступна = пропускаем молча
 
-    return _filter_emails(found)  # финальная дедупликация
+        async def fetch(page_url: str) -> Optional[Tuple[str, str]]:
+            return await _fetch_page(client, page_url, stats)
+
+        def collect(page: Tuple[str, str]) -> bool:
+            nonlocal email_path
+            emails = _filter_emails(_EMAIL_REGEX.findall(page[0]))
+            if emails and not email_path:
+                email_path = _page_path(page[1])
+            found.extend(emails)
+            return bool(emails)
+
+        page = None
+        if plan.first_path:
+            # Известная страница с email: чаще всего одного запроса и хватает
+            known = await fetch(base + plan.first_path)
+            if known and collect(known):
+                return await _finish_scrape(host, found, email_path, stats)
+            if plan.first_path == _page_path(url):
+                page = known
+
+        if page is None:
+            page = await fetch(url)
+        html, page_url = page if page else (None, url)
+        if html:
+            # Даже если нашли что-то на главной — контакты дополнительно проверим
+            collect(page)
+            base = _clean_url(page_url)
+
+        candidates = await _discover_contact_pages(
+            client, html, page_url, base, limit=plan.contact_pages, use_sitemap=plan.use_sitemap and _USE_SITEMAP,
+        )
+        for contact_url in candidates:
+            contact = await fetch(contact_url)
+            if contact and collect(contact):
+                break
+
+    return await _finish_scrape(host, found, email_path, stats)
+
+
+async def _finish_scrape(host: str, found: List[str], email_path: str, stats: _FetchStats) -> List[str]:
+    emails = _filter_emails(found)  # финальная дедупликация
+    # Все запросы отсёк breaker — сайт не посещали, историю не трогаем
+    if stats.pages:
+        await planner.record(host, pages=stats.pages, latency=stats.fetch_time / stats.pages,
+                             email_path=email_path, emails=len(emails))
+    return emails
+
+
+async def _scrape_limited(url: str) -> List[str]:
+    """Парсинг сайта под общим лимитом параллельности (важно для harvest).
+    Недавний результат по тому же URL берём из кэша, в том числе чужого воркера."""
+    async def scrape() -> List[str]:
+        async with coordination.semaphore("scrape", _SCRAPE_CONCURRENCY):
+            return await _scrape_emails_from_url(url)
 
+    return await coordination.cached(f"scrape:{url}", _SCRAPE_CACHE_TTL, scrape)
 
-async def _enrich_results_with_emails(results: list) -> list:
+
+async def scrape_contacts(url: str, max_pages: int = 6) -> Dict:
+    """Глубокий обход сайта для фонового дообогащения: главная и до max_pages
+    кандидатов в контакты (включая sitemap), без остановки на первом email.
+    История хоста не мешает обходу, но пополняется его итогом.
+    Возвращает {"emails": [...], "phones": [...], "address": str}."""
+    import httpx
+
+    host = urlsplit(url).netloc.lower().removeprefix("www.")
+    found: List[str] = []
+    phones: List[str] = []
+    address = ""
+    email_path = ""
+    stats = _FetchStats()
+
+    async with httpx.AsyncClient(timeout=_SCRAPE_TIMEOUT, follow_redirects=True, verify=False) as client:
+
+        def collect(page: Tuple[str, str]):
+            nonlocal address, email_path
+            html = page[0]
+            emails = _filter_emails(_EMAIL_REGEX.findall(html))
+            if emails and not email_path:
+                email_path = _page_path(page[1])
+            found.extend(emails)
+            phones.extend(p for p in extract_phones(html) if p not in phones)
+            address = address or extract_address(html)
+
+        page = await _fetch_page(client, url, stats)
+        html, page_url = page if page else (None, url)
+        if page:
+            collect(page)
+        base = _clean_url(page_url)
+
+        candidates = await _discover_contact_pages(client, html, page_url, base, limit=max_pages, use_sitemap=True)
+        for contact_url in candidates:
+            if found and phones and address:
+                break
+            contact = await _fetch_page(client, contact_url, stats)
+            if contact:
+                collect(contact)
+
+    emails = await _finish_scrape(host, found, email_path, stats)
+    return {"emails": emails, "phones": phones, "address": address}
+
+
+async def _enrich_results_with_emails(results: list, limit: int = _MAX_SCRAPE_PAGES) -> list:
     """
     Параллельно парсит сайты из результатов Tavily и добавляет найденные email
     в каждый результат под ключом '_scraped_emails'.
     """
-    urls = [r.get("url", "") for r in results[:_MAX_SCRAPE_PAGES]]
+    urls = [r.get("url", "") for r in results[:limit]]
     print(f"[Scraper] Параллельный парсинг {len(urls)} сайтов...")
 
-    tasks = [_scrape_emails_from_url(u) for u in urls]
+    tasks = [_scrape_limited(u) for u in urls]
     email_lists = await asyncio.gather(*tasks, return_exceptions=True)
 
     enriched = []
@@ -182,6 +406,9 @@ async def search_companies(category: str, max_results: int = 10) -> List[Dict]:
     if TAVILY_API_KEY:
         try:
             return await _search_via_tavily(category, max_results)
+        except CircuitOpenError as e:
+            print(f"[WARN] {e}, используем мок-данные")
+            return MOCK_COMPANIES[:max_results]
         except Exception as e:
             print(f"[ERROR] Tavily недоступен, переключаемся на мок-данные: {e}")
             return MOCK_COMPANIES[:max_results]
@@ -190,11 +417,25 @@ async def search_companies(category: str, max_results: int = 10) -> List[Dict]:
         return MOCK_COMPANIES[:max_results]
 
 
-async def _search_via_tavily(category: str, max_results: int) -> List[Dict]:
-    """Реальный поиск через Tavily REST API (httpx, без SDK) + парсинг email."""
+async def _tavily_search(query: str, max_results: int) -> List[Dict]:
+    """Один запрос к Tavily REST API (httpx, без SDK). Возвращает сырые результаты.
+
+    Ответы кэшируются общим для воркеров кэшем; одновременно к Tavily идёт не
+    больше _TAVILY_CONCURRENCY запросов. Пока Tavily недоступен (circuit open),
+    сразу бросает CircuitOpenError.
+    """
+    async def request() -> List[Dict]:
+        async with coordination.semaphore("tavily", _TAVILY_CONCURRENCY):
+            return await _tavily_request(query, max_results)
+
+    return await coordination.cached(f"tavily:{max_results}:{query}", _TAVILY_CACHE_TTL, request)
+
+
+async def _tavily_request(query: str, max_results: int) -> List[Dict]:
     import httpx
 
-    query = f"{category} компания контакты сайт официальный"
+    tavily = dependency("tavily", _TAVILY_TIMEOUT)
+    tavily.breaker.check()
     print(f"[Tavily] Поиск: {query}")
 
     payload = {
@@ -206,17 +447,30 @@ async def _search_via_tavily(category: str, max_results: int) -> List[Dict]:
         "include_raw_content": False,
     }
 
-    async with httpx.AsyncClient(timeout=30, verify=False) as client:
-        resp = await client.post(
-            "https://api.tavily.com/search",
-            json=payload,
-            headers={"Content-Type": "application/json"},
-        )
-        resp.raise_for_status()
-        data = resp.json()
+    started = time.monotonic()
+    try:
+        async with httpx.AsyncClient(timeout=tavily.timeout(), verify=False) as client:
+            resp = await client.post(
+                "https://api.tavily.com/search",
+                json=payload,
+                headers={"Content-Type": "application/json"},
+            )
+            resp.raise_for_status()
+            data = resp.json()
+    except Exception:
+        tavily.record_failure()
+        raise
+    tavily.record_success(started)
 
     results = data.get("results", [])
     print(f"[Tavily] Получено результатов: {len(results)}")
+    return results
+
+
+async def _search_via_tavily(category: str, max_results: int) -> List[Dict]:
+    """Реальный поиск через Tavily REST API (httpx, без SDK) + парсинг email."""
+    query = f"{category} компания контакты сайт официальный"
+    results = await _tavily_search(query, max_results)
 
     if not results:
         print("[WARN] Tavily вернул 0 результатов, используем мок-данные")
@@ -226,10 +480,19 @@ async def _search_via_tavily(category: str, max_results: int) -> List[Dict]:
     enriched_results = await _enrich_results_with_emails(results)
 
     # ── Шаг 3: структурируем данные через OpenAI (или без него) ──
+    companies = await _structure_results(enriched_results, category, max_results)
+
+    return companies if companies else MOCK_COMPANIES[:max_results]
+
+
+async def _structure_results(enriched_results: list, category: str, max_results: int) -> List[Dict]:
+    """Превращает результаты поиска с '_scraped_emails' в карточки компаний."""
     companies: List[Dict] = []
     if OPENAI_API_KEY and enriched_results:
-        companies = await _extract_companies_with_ai(enriched_results, category)
-    else:
+        limit = max(max_results, _MAX_SCRAPE_PAGES)
+        companies = await _extract_companies_with_ai(enriched_results, category, limit)
+    if not companies:
+        # Без ключа OpenAI или пока он недоступен — берём данные поиска как есть
         for r in enriched_results[:max_results]:
             scraped = r.get("_scraped_emails", [])
             companies.append({
@@ -240,22 +503,91 @@ async def _search_via_tavily(category: str, max_results: int) -> List[Dict]:
                 "address": "",
                 "description": r.get("content", "")[:300],
             })
+    return companies
+
+
+# ─────────────────────────────────────────────
+# Массовый сбор: много вариантов запроса параллельно
+# ─────────────────────────────────────────────
+
+def _build_query_variants(category: str, max_queries: int) -> List[str]:
+    """Разворачивает нишу/город в список различающихся запросов к Tavily."""
+    category = " ".join(category.split())
+    variants: List[str] = []
+    for template in _HARVEST_QUERY_TEMPLATES[:max_queries]:
+        query = template.format(category=category)
+        if query not in variants:
+            variants.append(query)
+    return variants
+
+
+async def harvest_companies(
+    category: str,
+    max_queries: int = _HARVEST_MAX_QUERIES,
+    per_query: int = _HARVEST_PER_QUERY,
+) -> AsyncIterator[List[Dict]]:
+    """Массовый сбор компаний: запускает до max_queries вариантов запроса
+    параллельно и отдаёт компании пачками по мере готовности.
+
+    Результаты каждого запроса дедуплицируются по нормализованному хосту
+    ДО парсинга, поэтому один сайт парсится и структурируется один раз.
+    """
+    if not TAVILY_API_KEY:
+        print("[WARN] TAVILY_API_KEY не задан, используются мок-данные")
+        yield list(MOCK_COMPANIES)
+        return
 
-    return companies if companies else MOCK_COMPANIES[:max_results]
+    queries = _build_query_variants(category, max(1, max_queries))
+    print(f"[Harvest] {len(queries)} вариантов запроса для «{category}»")
+    seen_hosts: set = set()
 
+    async def run_query(query: str) -> List[Dict]:
+        try:
+            return await _tavily_search(query, per_query)
+        except Exception as e:
+            print(f"[Harvest] Запрос «{query}» не удался: {e}")
+            return []
 
-async def _extract_companies_with_ai(results: list, category: str) -> List[Dict]:
+    async def process(query: str) -> List[Dict]:
+        results = await run_query(query)
+        fresh = []
+        for r in results:
+            host = _normalize_host(r.get("url", ""))
+            if host and host not in seen_hosts:
+                seen_hosts.add(host)
+                fresh.append(r)
+        if not fresh:
+            return []
+        enriched = await _enrich_results_with_emails(fresh, limit=len(fresh))
+        return await _structure_results(enriched, category, len(fresh))
+
+    tasks = [asyncio.create_task(process(q)) for q in queries]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            companies = await next_done
+            if companies:
+                yield companies
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+async def _extract_companies_with_ai(results: list, category: str, limit: int = _MAX_SCRAPE_PAGES) -> List[Dict]:
     """Извлечение структурированных данных о компаниях через OpenAI.
     В отличие от предыдущей версии, здесь результаты содержат '_scraped_emails'
     — реальные email-адреса, найденные непосредственно на сайтах компаний.
     """
     from openai import OpenAI
 
-    oai = OpenAI(api_key=OPENAI_API_KEY)
+    openai_dep = dependency("openai:extract", _OPENAI_TIMEOUT)
+    if not openai_dep.breaker.allow():
+        print("[WARN] OpenAI недоступен (circuit open), структурируем без AI")
+        return []
+    oai = OpenAI(api_key=OPENAI_API_KEY, timeout=openai_dep.timeout(), max_retries=0)
 
     # Формируем сниппеты с учётом найденных email
     snippet_parts = []
-    for i, r in enumerate(results[:_MAX_SCRAPE_PAGES]):
+    for i, r in enumerate(results[:limit]):
         scraped_emails = r.get("_scraped_emails", [])
         email_line = (
             f"Email-адреса найденные на сайте: {', '.join(scraped_emails[:5])}"
@@ -296,12 +628,20 @@ async def _extract_companies_with_ai(results: list, category: str) -> List[Dict]
 """
 
     try:
-        resp = oai.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0.1,
-            max_tokens=3000,
-        )
+        # Синхронный клиент — уводим в поток, чтобы параллельные пачки harvest не ждали друг друга
+        started = time.monotonic()
+        try:
+            resp = await asyncio.to_thread(
+                oai.chat.completions.create,
+                model="gpt-4o-mini",
+                messages=[{"role": "user", "content": prompt}],
+                temperature=0.1,
+                max_tokens=3000,
+            )
+        except Exception:
+            openai_dep.record_failure()
+            raise
+        openai_dep.record_success(started)
         text = resp.choices[0].message.content.strip()
         # Убираем возможные ```json блоки
         text = re.sub(r"```json\s*", "", text)
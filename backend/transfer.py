@@ -0,0 +1,357 @@
+import csv
+import io
+import re
+import zipfile
+from typing import BinaryIO, Dict, Iterable, Iterator, List, Optional
+from xml.etree.ElementTree import iterparse
+from xml.sax.saxutils import escape
+
+from sqlalchemy import text
+
+from .deliverability import normalize_email
+from .funnel import STATUS_EVENTS
+
+# ─────────────────────────────────────────────
+# Выгрузка и загрузка лидов пачками
+#
+# Экспорт читает компании страницами по _BATCH_SIZE строк (по id, каждая
+# страница — своя короткая транзакция) и сразу отдаёт их в ответ (CSV или
+# XLSX): память не зависит от размера CRM, а медленный клиент не держит
+# блокировку чтения, пока скачивает файл.
+# Импорт разбирает CSV/XLSX построчно и отдаёт строки пачками — дальше они
+# идут через ту же дедупликацию, что и результаты поиска.
+# ─────────────────────────────────────────────
+
+_BATCH_SIZE = 1000
+
+# (ключ, заголовок в файле)
+EXPORT_COLUMNS = [
+    ("id", "ID"),
+    ("name", "Название"),
+    ("category", "Категория"),
+    ("status", "Статус"),
+    ("email", "Email"),
+    ("email_verdict", "Проверка email"),
+    ("phone", "Телефон"),
+    ("website", "Сайт"),
+    ("address", "Адрес"),
+    ("description", "Описание"),
+    ("created_at", "Добавлена"),
+    ("email_sent_at", "Письмо отправлено"),
+    ("replied_at", "Ответ получен"),
+    ("status_history", "История статусов"),
+]
+
+# История статусов — коррелированным подзапросом по индексу (company_id, id),
+# поэтому шаги идут в порядке переходов.
+_EXPORT_SQL = f"""
+    SELECT c.id, c.name, c.category, c.status, c.email, c.email_verdict, c.phone, c.website,
+           c.address, c.description, c.created_at, c.email_sent_at, c.replied_at,
+           (SELECT group_concat(e.status || ' ' || substr(e.changed_at, 1, 16), '; ')
+            FROM {STATUS_EVENTS} e WHERE e.company_id = c.id) AS status_history
+    FROM companies c
+    WHERE c.owner_id = :owner_id AND c.id > :after_id {{filters}}
+    ORDER BY c.id
+    LIMIT :limit
+"""
+
+_CONTENT_TYPES = {
+    "csv": "text/csv; charset=utf-8",
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+}
+
+
+class ImportFormatError(ValueError):
+    """Файл не удалось разобрать как таблицу лидов."""
+
+
+# ── Экспорт ──
+
+def export_batches(db, owner_id: int, status: Optional[str] = None,
+                   category: Optional[str] = None) -> Iterator[List[tuple]]:
+    """Компании пользователя пачками по _BATCH_SIZE строк. Пачки читаются
+    разными транзакциями: компании, изменённые во время выгрузки, попадут
+    в файл в том виде, в каком были на момент чтения своей пачки."""
+    filters, params = "", {"owner_id": owner_id}
+    if status:
+        filters += " AND c.status = :status"
+        params["status"] = status
+    if category:
+        filters += " AND c.category = :category"
+        params["category"] = category
+    query = text(_EXPORT_SQL.format(filters=filters))
+    after_id = 0
+    while True:
+        rows = db.execute(query, {**params, "after_id": after_id, "limit": _BATCH_SIZE}).all()
+        # Транзакция закрывается до отдачи пачки клиенту
+        db.rollback()
+        if rows:
+            yield [tuple(row) for row in rows]
+        if len(rows) < _BATCH_SIZE:
+            return
+        after_id = rows[-1][0]
+
+
+# Excel и LibreOffice считают такие ячейки формулами (CSV/formula injection)
+_FORMULA_PREFIXES = ("=", "+", "-", "@", "\t", "\r")
+
+
+def _cell(value) -> str:
+    if value is None:
+        return ""
+    if hasattr(value, "isoformat"):
+        return value.isoformat(sep=" ", timespec="seconds")
+    if isinstance(value, (int, float)):
+        return str(value)
+    value = str(value)
+    if value.startswith(_FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+def export_csv(batches: Iterable[List[tuple]]) -> Iterator[str]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    # BOM — чтобы Excel открыл UTF-8 с кириллицей без мастера импорта
+    buffer.write("\ufeff")
+    writer.writerow([title for _, title in EXPORT_COLUMNS])
+    for batch in batches:
+        writer.writerows([_cell(v) for v in row] for row in batch)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
+
+
+class _ChunkSink:
+    """Файл для zipfile, который копит байты до следующей отдачи в ответ.
+    tell() нет — zipfile пишет архив потоково, без перемотки."""
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def take(self) -> bytes:
+        data, self._chunks = b"".join(self._chunks), []
+        return data
+
+
+_XLSX_STATIC = {
+    "[Content_Types].xml": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '</Types>'
+    ),
+    "_rels/.rels": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Target="xl/workbook.xml" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument"/>'
+        '</Relationships>'
+    ),
+    "xl/workbook.xml": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+        'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+        '<sheets><sheet name="Лиды" sheetId="1" r:id="rId1"/></sheets></workbook>'
+    ),
+    "xl/_rels/workbook.xml.rels": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Target="worksheets/sheet1.xml" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet"/>'
+        '</Relationships>'
+    ),
+}
+
+# Управляющие символы недопустимы в XML 1.0 — Excel не откроет такой файл
+_XML_ILLEGAL = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f]")
+
+
+def _xlsx_row(values: Iterable[str]) -> str:
+    cells = "".join(
+        f'<c t="inlineStr"><is><t xml:space="preserve">{escape(_XML_ILLEGAL.sub("", v))}</t></is></c>'
+        if v else "<c/>"
+        for v in values
+    )
+    return f"<row>{cells}</row>"
+
+
+def export_xlsx(batches: Iterable[List[tuple]]) -> Iterator[bytes]:
+    """XLSX без сторонних библиотек: zip из нескольких XML-частей, лист
+    пишется строками inlineStr по мере чтения из БД."""
+    sink = _ChunkSink()
+    with zipfile.ZipFile(sink, "w", zipfile.ZIP_DEFLATED) as zf:
+        for name, content in _XLSX_STATIC.items():
+            zf.writestr(name, content)
+        with zf.open("xl/worksheets/sheet1.xml", "w", force_zip64=True) as sheet:
+            sheet.write((
+                '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+                + _xlsx_row(title for _, title in EXPORT_COLUMNS)
+            ).encode("utf-8"))
+            for batch in batches:
+                sheet.write("".join(_xlsx_row(_cell(v) for v in row) for row in batch).encode("utf-8"))
+                yield sink.take()
+            sheet.write(b"</sheetData></worksheet>")
+    yield sink.take()
+
+
+def content_type(fmt: str) -> str:
+    return _CONTENT_TYPES[fmt]
+
+
+# ── Импорт ──
+
+# Поле Company → варианты заголовка колонки (в нижнем регистре)
+_FIELD_ALIASES = {
+    "name": ("name", "company", "название", "компания", "организация"),
+    "email": ("email", "e-mail", "почта", "электронная почта"),
+    "phone": ("phone", "телефон", "тел"),
+    "website": ("website", "site", "url", "сайт"),
+    "address": ("address", "адрес"),
+    "description": ("description", "описание", "комментарий"),
+    "category": ("category", "категория", "ниша"),
+}
+_HEADER_TO_FIELD = {alias: field for field, aliases in _FIELD_ALIASES.items() for alias in aliases}
+
+
+def _map_header(header: List[str]) -> Dict[int, str]:
+    mapping = {}
+    for idx, title in enumerate(header):
+        field = _HEADER_TO_FIELD.get((title or "").strip().lower())
+        if field and field not in mapping.values():
+            mapping[idx] = field
+    if "name" not in mapping.values():
+        raise ImportFormatError("В файле нет колонки с названием компании (name / Название)")
+    return mapping
+
+
+def _uncell(value: str) -> str:
+    """Обратное к _cell экранирование формул: файл, выгруженный отсюда же,
+    загружается с исходными значениями."""
+    if value.startswith("'") and value[1:].startswith(_FORMULA_PREFIXES):
+        return value[1:]
+    return value
+
+
+def _normalize(values: List[str], mapping: Dict[int, str]) -> Optional[dict]:
+    row = {}
+    for idx, field in mapping.items():
+        value = _uncell(values[idx].strip()) if idx < len(values) and values[idx] else ""
+        if value:
+            row[field] = value
+    if not row:
+        return None
+    if "email" in row:
+        row["email"] = normalize_email(row["email"])
+    return row
+
+
+def _read_csv(fileobj: BinaryIO) -> Iterator[dict]:
+    stream = io.TextIOWrapper(fileobj, encoding="utf-8-sig", newline="", errors="replace")
+    sample = stream.read(4096)
+    stream.seek(0)
+    try:
+        dialect = csv.Sniffer().sniff(sample, delimiters=",;\t")
+    except csv.Error:
+        dialect = csv.excel
+    reader = csv.reader(stream, dialect)
+    header = next(reader, None)
+    if header is None:
+        return
+    mapping = _map_header(header)
+    for values in reader:
+        row = _normalize(values, mapping)
+        if row:
+            yield row
+
+
+_NS = "{http://schemas.openxmlformats.org/spreadsheetml/2006/main}"
+
+
+def _column_index(ref: str) -> int:
+    idx = 0
+    for ch in ref:
+        if not ch.isalpha():
+            break
+        idx = idx * 26 + ord(ch.upper()) - 64
+    return idx - 1
+
+
+def _read_xlsx(fileobj: BinaryIO) -> Iterator[dict]:
+    try:
+        zf = zipfile.ZipFile(fileobj)
+    except zipfile.BadZipFile:
+        raise ImportFormatError("Файл XLSX повреждён")
+    with zf:
+        names = zf.namelist()
+        sheets = sorted(n for n in names if n.startswith("xl/worksheets/") and n.endswith(".xml"))
+        if not sheets:
+            raise ImportFormatError("В файле XLSX нет листов")
+        shared: List[str] = []
+        if "xl/sharedStrings.xml" in names:
+            with zf.open("xl/sharedStrings.xml") as f:
+                for _, elem in iterparse(f):
+                    if elem.tag == f"{_NS}si":
+                        shared.append("".join(t.text or "" for t in elem.iter(f"{_NS}t")))
+                        elem.clear()
+        mapping = None
+        with zf.open(sheets[0]) as f:
+            for _, elem in iterparse(f):
+                if elem.tag != f"{_NS}row":
+                    continue
+                values: List[str] = []
+                for cell in elem.iter(f"{_NS}c"):
+                    ref = cell.get("r")
+                    idx = _column_index(ref) if ref else len(values)
+                    kind = cell.get("t")
+                    if kind == "inlineStr":
+                        value = "".join(t.text or "" for t in cell.iter(f"{_NS}t"))
+                    else:
+                        v = cell.find(f"{_NS}v")
+                        value = (v.text or "") if v is not None else ""
+                        if kind == "s" and value:
+                            value = shared[int(value)]
+                    values.extend([""] * (idx + 1 - len(values)))
+                    values[idx] = value
+                elem.clear()
+                if mapping is None:
+                    mapping = _map_header(values)
+                    continue
+                row = _normalize(values, mapping)
+                if row:
+                    yield row
+
+
+def read_rows(fileobj: BinaryIO, filename: str = "") -> Iterator[dict]:
+    """Строки загруженного файла как словари полей Company. Формат — по
+    расширению, а без него по сигнатуре zip (XLSX) либо CSV."""
+    head = fileobj.read(4)
+    fileobj.seek(0)
+    if filename.lower().endswith(".xlsx") or head == b"PK\x03\x04":
+        return _read_xlsx(fileobj)
+    return _read_csv(fileobj)
+
+
+def batched(rows: Iterable[dict], size: int = _BATCH_SIZE) -> Iterator[List[dict]]:
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
@@ -0,0 +1,97 @@
+"""Бенчмарк холодного старта: сколько стоит `import backend.main`.
+
+Запускает импорт в отдельном процессе с `python -X importtime`, печатает
+самые дорогие модули и проверяет, что тяжёлые SDK не грузятся при старте.
+
+    python bench_startup.py                 # отчёт
+    python bench_startup.py --runs 5 --budget-ms 900
+Код возврата 1 — регрессия (тяжёлый модуль при импорте или превышен бюджет).
+"""
+import argparse
+import os
+import re
+import subprocess
+import sys
+
+# Эти пакеты должны загружаться лениво, при первом использовании
+LAZY_MODULES = ("openai", "reportlab", "jose", "bcrypt")
+_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \| (\s*)(\S+)")
+
+
+def profile_import(module: str = "backend.main") -> list:
+    """Один холодный импорт: [(модуль, self_us, cumulative_us, глубина)]."""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        capture_output=True,
+        text=True,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"import {module} упал:\n{proc.stderr[-2000:]}")
+    rows = []
+    for line in proc.stderr.splitlines():
+        m = _LINE.match(line)
+        if m:
+            rows.append((m.group(4), int(m.group(1)), int(m.group(2)), len(m.group(3)) // 2))
+    return rows
+
+
+def _direct_children(rows: list, module: str) -> list:
+    """Прямые зависимости модуля: в выводе importtime они идут строками
+    с глубиной 1 непосредственно перед строкой самого модуля."""
+    end = next((i for i, r in enumerate(rows) if r[0] == module and r[3] == 0), None)
+    if end is None:
+        return []
+    start = end
+    while start > 0 and rows[start - 1][3] > 0:
+        start -= 1
+    return [r for r in rows[start:end] if r[3] == 1]
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--module", default="backend.main")
+    parser.add_argument("--runs", type=int, default=3, help="сколько холодных импортов замерить")
+    parser.add_argument("--top", type=int, default=15, help="сколько модулей показать")
+    parser.add_argument("--budget-ms", type=float, default=float(os.getenv("STARTUP_BUDGET_MS", "0")),
+                        help="порог времени импорта (медиана), 0 — не проверять")
+    args = parser.parse_args()
+
+    totals = []
+    rows = []
+    for _ in range(max(args.runs, 1)):
+        rows = profile_import(args.module)
+        total = next((cum for name, _, cum, _ in rows if name == args.module), 0)
+        totals.append(total / 1000)
+    totals.sort()
+    median = totals[len(totals) // 2]
+
+    print(f"[bench] import {args.module}: медиана {median:.1f} ms "
+          f"(min {totals[0]:.1f}, max {totals[-1]:.1f}, запусков {len(totals)})")
+    print(f"[bench] модулей загружено: {len(rows)}")
+
+    print(f"\n[bench] Топ-{args.top} по накопленному времени (пакеты верхнего уровня):")
+    top_level = _direct_children(rows, args.module)
+    for name, self_us, cum_us, _ in sorted(top_level, key=lambda r: -r[2])[:args.top]:
+        print(f"  {cum_us / 1000:8.1f} ms  {name}")
+
+    print(f"\n[bench] Топ-{args.top} по собственному времени:")
+    for name, self_us, cum_us, _ in sorted(rows, key=lambda r: -r[1])[:args.top]:
+        print(f"  {self_us / 1000:8.1f} ms  {name}")
+
+    failed = False
+    loaded = {name.split(".")[0] for name, _, _, _ in rows}
+    eager = [m for m in LAZY_MODULES if m in loaded]
+    if eager:
+        failed = True
+        print(f"\n[bench] РЕГРЕССИЯ: при импорте загружены тяжёлые модули: {', '.join(eager)}")
+    if args.budget_ms and median > args.budget_ms:
+        failed = True
+        print(f"\n[bench] РЕГРЕССИЯ: {median:.1f} ms > бюджета {args.budget_ms:.1f} ms")
+    if not failed:
+        print("\n[bench] OK")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
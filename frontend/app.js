@@ -7,6 +7,13 @@ let currentUser = null;
 let companiesData = [];
 let currentFilter = null;   // null = all, or status string
 let currentModalTab = 'letter';
+let selectedIds = new Set();   // компании, выбранные для массовой операции
+let chatMessages = [];      // сообщения открытого чата (старые первыми)
+let chatCompanyId = null;
+let chatHasOlder = false;
+const CHAT_PAGE_SIZE = 50;
+let eventSocket = null;     // WebSocket с push-событиями
+let wsRetry = 0;
 
 // ─────────────────────────────────────────────────────────
 // UTILS
@@ -87,6 +94,7 @@ function loginSuccess(user) {
     document.getElementById("sidebarSendEmail").innerText = user.send_email;
     document.getElementById("sidebarAvatar").innerText = user.name.charAt(0).toUpperCase();
     loadCompanies();
+    connectEvents();
 }
 
 function switchAuthTab(tab) {
@@ -160,9 +168,77 @@ function doLogout() {
     localStorage.removeItem("keitering_token");
     currentUser = null;
     companiesData = [];
+    selectedIds.clear();
+    disconnectEvents();
     showAuth();
 }
 
+// ─────────────────────────────────────────────────────────
+// PUSH EVENTS (WebSocket)
+// ─────────────────────────────────────────────────────────
+// Сервер шлёт дельты (новая компания, изменённые поля, новое сообщение),
+// и мы патчим companiesData вместо перезагрузки всего списка.
+// Шина событий живёт внутри одного процесса: при нескольких воркерах
+// изменение, обработанное соседним воркером, сюда не придёт. Поэтому
+// после собственных действий список всё равно перечитывается из /companies.
+function connectEvents() {
+    const token = localStorage.getItem("keitering_token");
+    if (!token || eventSocket) return;
+    const proto = location.protocol === "https:" ? "wss" : "ws";
+    const base = API_URL ? API_URL.replace(/^http/, "ws") : `${proto}://${location.host}`;
+    const ws = new WebSocket(`${base}/ws?token=${encodeURIComponent(token)}`);
+    eventSocket = ws;
+    ws.onopen = () => {
+        // После переподключения события за время обрыва потеряны — сверяемся
+        if (wsRetry > 0) loadCompanies();
+        wsRetry = 0;
+    };
+    ws.onmessage = (e) => applyEvent(JSON.parse(e.data));
+    ws.onclose = () => {
+        if (eventSocket !== ws) return;   // закрыли сами (logout)
+        eventSocket = null;
+        if (!currentUser) return;
+        const delay = Math.min(30000, 1000 * 2 ** wsRetry++);
+        setTimeout(connectEvents, delay);
+    };
+}
+
+function disconnectEvents() {
+    const ws = eventSocket;
+    eventSocket = null;
+    wsRetry = 0;
+    if (ws) ws.close();
+}
+
+function applyEvent(event) {
+    if (event.type === "resync") {
+        loadCompanies();
+        if (chatCompanyId !== null) loadNewerMessages(chatCompanyId);
+    } else if (event.type === "company_created") {
+        upsertCompanies([event.company]);
+    } else if (event.type === "company_changed") {
+        const comp = companiesData.find(c => c.id === event.company_id);
+        if (!comp) return;
+        Object.assign(comp, event.changes);
+        // Письмо сменилось — закэшированный текст больше не актуален
+        if ("has_email_body" in event.changes && !("email_body" in event.changes)) delete comp.email_body;
+        if (event.changes.status && isCompanyOpen(comp.id)) {
+            document.getElementById("mStatusSelect").value = comp.status;
+        }
+        refreshCompanies();
+    } else if (event.type === "message_appended") {
+        const comp = companiesData.find(c => c.id === event.company_id);
+        if (comp) comp.messages_count = (comp.messages_count || 0) + 1;
+        appendChatMessage(event.company_id, event.message);
+        refreshCompanies();
+    }
+}
+
+function isCompanyOpen(id) {
+    return document.getElementById("companyModal").classList.contains("open")
+        && parseInt(document.getElementById("modalCompanyId").value) === id;
+}
+
 // ─────────────────────────────────────────────────────────
 // COMPANIES
 // ─────────────────────────────────────────────────────────
@@ -178,6 +254,20 @@ async function loadCompanies() {
     }
 }
 
+function upsertCompanies(list) {
+    const known = new Set(companiesData.map(c => c.id));
+    const fresh = list.filter(c => !known.has(c.id));
+    if (fresh.length === 0) return 0;
+    companiesData = fresh.concat(companiesData);
+    refreshCompanies();
+    return fresh.length;
+}
+
+function refreshCompanies() {
+    updateSidebarCounts();
+    renderCards();
+}
+
 function setStatusFilter(status) {
     currentFilter = status;
     // Highlight nav item
@@ -189,13 +279,25 @@ function setStatusFilter(status) {
     renderCards();
 }
 
+// Счётчики воронки считает сервер (/stats); частые вызовы склеиваем в один запрос
+let statsTimer;
 function updateSidebarCounts() {
-    const counts = {};
-    companiesData.forEach(c => { counts[c.status] = (counts[c.status] || 0) + 1; });
-    document.getElementById("cnt-all").innerText = companiesData.length;
-    ["new", "email_sent", "replied", "in_progress", "interested", "rejected", "closed"].forEach(s => {
-        document.getElementById(`cnt-${s}`).innerText = counts[s] || 0;
-    });
+    clearTimeout(statsTimer);
+    statsTimer = setTimeout(loadStats, 200);
+}
+
+async function loadStats() {
+    try {
+        const r = await fetch(`${API_URL}/stats`, { headers: authHeaders() });
+        if (!r.ok) return;
+        const stats = await r.json();
+        document.getElementById("cnt-all").innerText = stats.total;
+        ["new", "email_sent", "replied", "in_progress", "interested", "rejected", "closed"].forEach(s => {
+            document.getElementById(`cnt-${s}`).innerText = stats.by_status[s] || 0;
+        });
+    } catch (e) {
+        console.error("loadStats error", e);
+    }
 }
 
 const badgeIcons = {
@@ -224,7 +326,7 @@ function renderCards() {
 
     list.forEach((c, idx) => {
         const card = document.createElement("div");
-        card.className = "company-card";
+        card.className = "company-card" + (selectedIds.has(c.id) ? " selected" : "");
         card.onclick = () => openCompany(c.id);
         card.innerHTML = `
             <div class="card-num">#${idx + 1}</div>
@@ -241,13 +343,82 @@ function renderCards() {
                     <i class="bi ${badgeIcons[c.status]}"></i>
                     ${statusLabels[c.status]}
                 </span>
-                ${c.messages_count > 0
-                ? `<span class="chat-bubble-icon"><i class="bi bi-chat-dots"></i>${c.messages_count}</span>`
-                : ""}
+                <span class="card-actions">
+                    ${c.messages_count > 0
+                    ? `<span class="chat-bubble-icon"><i class="bi bi-chat-dots"></i>${c.messages_count}</span>`
+                    : ""}
+                    <input type="checkbox" class="card-select" title="Выбрать" ${selectedIds.has(c.id) ? "checked" : ""}>
+                </span>
             </div>
         `;
+        const checkbox = card.querySelector(".card-select");
+        checkbox.onclick = (e) => {
+            e.stopPropagation();
+            toggleSelected(c.id, checkbox.checked);
+        };
         grid.appendChild(card);
     });
+    updateBulkBar();
+}
+
+// ─────────────────────────────────────────────────────────
+// BULK ACTIONS
+// ─────────────────────────────────────────────────────────
+function toggleSelected(id, checked) {
+    if (checked) selectedIds.add(id); else selectedIds.delete(id);
+    renderCards();
+}
+
+function clearSelection() {
+    selectedIds.clear();
+    renderCards();
+}
+
+function updateBulkBar() {
+    document.getElementById("bulkBar").classList.toggle("hidden", selectedIds.size === 0);
+    document.getElementById("bulkCount").innerText = `Выбрано: ${selectedIds.size}`;
+}
+
+async function runBulk(body) {
+    const r = await fetch(`${API_URL}/companies/bulk`, {
+        method: "POST",
+        headers: authHeaders(),
+        body: JSON.stringify({ ids: [...selectedIds], ...body }),
+    });
+    const d = await r.json();
+    if (!r.ok) throw new Error(d.detail);
+    return d;
+}
+
+async function bulkSetStatus() {
+    const status = document.getElementById("bulkStatus").value;
+    try {
+        const d = await runBulk({ operation: "status", status });
+        const missing = new Set(d.not_found);
+        companiesData.forEach(c => {
+            if (selectedIds.has(c.id) && !missing.has(c.id)) c.status = status;
+        });
+        selectedIds.clear();
+        refreshCompanies();
+        showToast(d.message);
+    } catch (e) {
+        showToast("Ошибка: " + e.message);
+    }
+}
+
+async function bulkSend() {
+    if (!confirm(`Отправить письма выбранным компаниям (${selectedIds.size})?`)) return;
+    showLoader("Генерация и отправка писем...");
+    try {
+        const d = await runBulk({ operation: "send" });
+        selectedIds.clear();
+        showToast(d.message);
+        await loadCompanies();
+    } catch (e) {
+        showToast("Ошибка рассылки: " + e.message);
+    } finally {
+        hideLoader();
+    }
 }
 
 // ─────────────────────────────────────────────────────────
@@ -274,6 +445,48 @@ async function searchCompanies() {
     }
 }
 
+async function harvestCompanies() {
+    const query = document.getElementById("categoryInput").value.trim();
+    if (!query) return showToast("Введите категорию для поиска");
+    showLoader(`Массовый сбор «${query}»...`);
+    let added = 0;
+    try {
+        const r = await fetch(`${API_URL}/search/harvest`, {
+            method: "POST",
+            headers: authHeaders(),
+            body: JSON.stringify({ category: query }),
+        });
+        if (!r.ok) { const e = await r.json(); throw new Error(e.detail); }
+        // Ответ — NDJSON: новые компании приходят пачками по мере нахождения
+        const reader = r.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = "";
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) break;
+            buffer += decoder.decode(value, { stream: true });
+            const lines = buffer.split("\n");
+            buffer = lines.pop();
+            for (const line of lines) {
+                if (!line.trim()) continue;
+                const event = JSON.parse(line);
+                if (event.type === "companies") {
+                    // Те же компании могли уже прийти по WebSocket
+                    upsertCompanies(event.companies);
+                    added += event.companies.length;
+                    document.getElementById("loaderText").innerText = `Массовый сбор «${query}»: найдено ${added}...`;
+                } else if (event.type === "done") {
+                    showToast(event.message);
+                }
+            }
+        }
+    } catch (e) {
+        showToast("Ошибка сбора: " + e.message);
+    } finally {
+        hideLoader();
+    }
+}
+
 async function sendToAllNew() {
     if (!confirm("Сгенерировать и отправить письма ВСЕМ новым компаниям?")) return;
     showLoader("Массовая генерация и отправка писем...");
@@ -290,6 +503,55 @@ async function sendToAllNew() {
     }
 }
 
+// ─────────────────────────────────────────────────────────
+// EXPORT / IMPORT
+// ─────────────────────────────────────────────────────────
+async function exportCompanies(format) {
+    const params = new URLSearchParams({ format });
+    if (currentFilter) params.set("status", currentFilter);
+    showLoader("Готовим выгрузку...");
+    try {
+        const r = await fetch(`${API_URL}/companies/export?${params}`, { headers: authHeaders() });
+        if (!r.ok) { const e = await r.json(); throw new Error(e.detail); }
+        const blob = await r.blob();
+        const name = (r.headers.get("Content-Disposition") || "").match(/filename="(.+)"/);
+        const link = document.createElement("a");
+        link.href = URL.createObjectURL(blob);
+        link.download = name ? name[1] : `leads.${format}`;
+        link.click();
+        URL.revokeObjectURL(link.href);
+    } catch (e) {
+        showToast("Ошибка выгрузки: " + e.message);
+    } finally {
+        hideLoader();
+    }
+}
+
+async function importCompanies(input) {
+    const file = input.files[0];
+    input.value = "";
+    if (!file) return;
+    const form = new FormData();
+    form.append("file", file);
+    showLoader(`Импорт «${file.name}»...`);
+    try {
+        const token = localStorage.getItem("keitering_token");
+        const r = await fetch(`${API_URL}/companies/import`, {
+            method: "POST",
+            headers: { "Authorization": `Bearer ${token}` },
+            body: form,
+        });
+        const d = await r.json();
+        if (!r.ok) throw new Error(d.detail);
+        showToast(d.message);
+        await loadCompanies();
+    } catch (e) {
+        showToast("Ошибка импорта: " + e.message);
+    } finally {
+        hideLoader();
+    }
+}
+
 // ─────────────────────────────────────────────────────────
 // MODAL
 // ─────────────────────────────────────────────────────────
@@ -325,11 +587,12 @@ function openCompany(id) {
     document.getElementById("mStatusSelect").value = comp.status;
 
     // Letter tab
-    if (comp.email_body) {
+    if (comp.has_email_body) {
         document.getElementById("letterPreview").classList.remove("hidden");
         document.getElementById("noLetterArea").classList.add("hidden");
         document.getElementById("mEmailSubject").innerText = comp.email_subject || "";
-        document.getElementById("mEmailBody").innerText = comp.email_body;
+        document.getElementById("mEmailBody").innerText = comp.email_body || "Загрузка...";
+        if (comp.email_body === undefined) loadLetter(comp);
         document.getElementById("btnGenerate").classList.add("hidden");
         if (comp.status === "new") {
             document.getElementById("btnSend").classList.remove("hidden");
@@ -355,6 +618,19 @@ function openCompany(id) {
 // ─────────────────────────────────────────────────────────
 // LETTER ACTIONS
 // ─────────────────────────────────────────────────────────
+// В списке компаний текста письма нет — грузим при открытии карточки
+async function loadLetter(comp) {
+    try {
+        const r = await fetch(`${API_URL}/company/${comp.id}/letter`, { headers: authHeaders() });
+        if (!r.ok) throw new Error(`HTTP ${r.status}`);
+        const d = await r.json();
+        comp.email_body = d.body;
+        if (isCompanyOpen(comp.id)) document.getElementById("mEmailBody").innerText = d.body;
+    } catch (e) {
+        showToast("Не удалось загрузить письмо: " + e.message);
+    }
+}
+
 async function generateAndPreview() {
     const id = parseInt(document.getElementById("modalCompanyId").value);
     const btn = document.getElementById("btnGenerate");
@@ -365,7 +641,7 @@ async function generateAndPreview() {
         if (!r.ok) { const e = await r.json(); throw new Error(e.detail || `HTTP ${r.status}`); }
         const d = await r.json();
         const comp = companiesData.find(c => c.id === id);
-        if (comp) { comp.email_subject = d.subject; comp.email_body = d.body; }
+        if (comp) { comp.email_subject = d.subject; comp.email_body = d.body; comp.has_email_body = true; }
         openCompany(id);
     } catch (e) {
         showToast("Ошибка генерации: " + e.message);
@@ -408,8 +684,7 @@ async function updateStatus() {
         if (!r.ok) { const e = await r.json(); throw new Error(e.detail); }
         const comp = companiesData.find(c => c.id === id);
         if (comp) comp.status = status;
-        updateSidebarCounts();
-        renderCards();
+        refreshCompanies();
         showToast("Статус обновлён");
     } catch (e) {
         showToast("Ошибка: " + e.message);
@@ -419,20 +694,64 @@ async function updateStatus() {
 // ─────────────────────────────────────────────────────────
 // CHAT
 // ─────────────────────────────────────────────────────────
+// Сервер отдаёт переписку страницами, новые первыми; в chatMessages храним
+// в хронологическом порядке. Сначала грузим последнюю страницу, ранние —
+// по кнопке, догрузка после обрыва связи — по after_id.
+async function fetchMessages(companyId, params) {
+    const query = new URLSearchParams({ limit: CHAT_PAGE_SIZE, ...params });
+    const r = await fetch(`${API_URL}/company/${companyId}/messages?${query}`, { headers: authHeaders() });
+    if (!r.ok) throw new Error(`HTTP ${r.status}`);
+    return r.json();
+}
+
 async function loadChat(companyId) {
+    chatCompanyId = companyId;
+    chatMessages = [];
+    chatHasOlder = false;
     try {
-        const r = await fetch(`${API_URL}/company/${companyId}/messages`, { headers: authHeaders() });
-        if (!r.ok) return;
-        const msgs = await r.json();
-        renderChat(msgs);
+        const d = await fetchMessages(companyId, {});
+        if (chatCompanyId !== companyId) return;
+        chatMessages = d.messages.reverse();
+        chatHasOlder = d.has_more;
+        renderChat(chatMessages);
     } catch (e) {
         console.error("loadChat error", e);
     }
 }
 
-function renderChat(messages) {
+async function loadOlderMessages() {
+    const companyId = chatCompanyId;
+    if (companyId === null || chatMessages.length === 0) return;
+    try {
+        const d = await fetchMessages(companyId, { before_id: chatMessages[0].id });
+        if (chatCompanyId !== companyId) return;
+        chatMessages = d.messages.reverse().concat(chatMessages);
+        chatHasOlder = d.has_more;
+        renderChat(chatMessages, true);
+    } catch (e) {
+        showToast("Ошибка загрузки переписки: " + e.message);
+    }
+}
+
+async function loadNewerMessages(companyId) {
+    if (chatMessages.length === 0) return loadChat(companyId);
+    try {
+        let hasMore = true;
+        while (hasMore && chatCompanyId === companyId) {
+            const d = await fetchMessages(companyId, { after_id: chatMessages[chatMessages.length - 1].id });
+            if (chatCompanyId !== companyId) return;
+            d.messages.reverse().forEach(m => appendChatMessage(companyId, m));
+            hasMore = d.has_more && d.messages.length > 0;
+        }
+    } catch (e) {
+        console.error("loadNewerMessages error", e);
+    }
+}
+
+function renderChat(messages, keepScroll = false) {
     const container = document.getElementById("chatContainer");
     const empty = document.getElementById("chatEmpty");
+    const fromBottom = container.scrollHeight - container.scrollTop;
     container.innerHTML = "";
 
     if (messages.length === 0) {
@@ -441,6 +760,14 @@ function renderChat(messages) {
         return;
     }
 
+    if (chatHasOlder) {
+        const more = document.createElement("button");
+        more.className = "chat-more";
+        more.innerText = "Показать ранние сообщения";
+        more.onclick = loadOlderMessages;
+        container.appendChild(more);
+    }
+
     messages.forEach(m => {
         const wrap = document.createElement("div");
         wrap.className = `chat-msg ${m.direction}`;
@@ -451,8 +778,15 @@ function renderChat(messages) {
         container.appendChild(wrap);
     });
 
-    // scroll to bottom
-    container.scrollTop = container.scrollHeight;
+    // scroll to bottom (или остаёмся на месте, если догрузили ранние)
+    container.scrollTop = keepScroll ? container.scrollHeight - fromBottom : container.scrollHeight;
+}
+
+function appendChatMessage(companyId, message) {
+    // Сообщение может прийти дважды: ответом на POST и событием по WebSocket
+    if (companyId !== chatCompanyId || chatMessages.some(m => m.id === message.id)) return;
+    chatMessages.push(message);
+    renderChat(chatMessages);
 }
 
 function escapeHtml(text) {
@@ -477,8 +811,7 @@ async function sendChatMessage() {
             body: JSON.stringify({ text, direction: "outgoing" }),
         });
         if (!r.ok) { const e = await r.json(); throw new Error(e.detail); }
-        // reload chat and companies (message count changed)
-        await loadChat(id);
+        appendChatMessage(id, await r.json());
         await loadCompanies();
     } catch (e) {
         showToast("Ошибка отправки: " + e.message);
@@ -501,8 +834,7 @@ async function simulateReply() {
         const d = await r.json();
         showToast(d.message);
         await loadCompanies();
-        await loadChat(id);
-        openCompany(id);
+        openCompany(id);          // заново загрузит чат
         switchModalTab("chat");
     } catch (e) {
         showToast("Ошибка: " + e.message);
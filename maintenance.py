@@ -0,0 +1,36 @@
+"""Обслуживание keitering.db — запускать вручную, лучше вне рабочего времени:
+операции идут под блокировкой записи на всю БД.
+
+    python maintenance.py gc-bodies             # удалить тексты писем без ссылок
+    python maintenance.py gc-bodies --vacuum    # и вернуть освободившееся место
+"""
+import argparse
+import sys
+
+
+def gc_bodies(vacuum: bool) -> int:
+    from backend.database import engine
+    from backend.body_store import collect_orphans
+
+    removed = collect_orphans(engine)
+    print(f"Текстов без ссылок удалено: {removed}")
+    if vacuum:
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            conn.exec_driver_sql("VACUUM")
+        print("VACUUM выполнен")
+    return 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+    gc = commands.add_parser("gc-bodies", help="удалить тексты писем, на которые никто не ссылается")
+    gc.add_argument("--vacuum", action="store_true", help="после удаления сжать файл БД")
+    args = parser.parse_args()
+    if args.command == "gc-bodies":
+        return gc_bodies(args.vacuum)
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,108 @@
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+import pytest
+
+# Окружение — до импорта backend: модули читают его при импорте
+_ROOT = Path(__file__).resolve().parent.parent
+_TMP = Path(tempfile.mkdtemp(prefix="leadhunter-tests-"))
+sys.path.insert(0, str(_ROOT))
+os.environ.update({
+    "DATABASE_PATH": str(_TMP / "keitering.db"),
+    "COORDINATION_BACKEND": "memory",
+    "OUTBOX_WORKER": "false",
+    "ENRICH_WORKER": "false",
+    "DEMO_MODE": "true",
+    "TAVILY_API_KEY": "",
+    "OPENAI_API_KEY": "",
+    "PROFILER_TOKEN": "",
+})
+
+from sqlalchemy import text  # noqa: E402
+
+from backend import body_store, coordination, database, deliverability, resilience  # noqa: E402
+from backend.auth import create_access_token, hash_password  # noqa: E402
+from backend.database import Base, Company, SessionLocal, User  # noqa: E402
+from backend.funnel import STATUS_EVENTS  # noqa: E402
+from backend.mail_log import mail_log  # noqa: E402
+from backend.scrape_planner import planner  # noqa: E402
+
+database.create_tables()
+
+
+def _reset_mail_log():
+    # Event loop теста уже закрыт — close() не дождаться, сбрасываем состояние
+    if mail_log._conn is not None:
+        mail_log._conn.close()
+    mail_log._conn = mail_log._task = mail_log._loop = mail_log._queue = None
+
+
+@pytest.fixture(autouse=True)
+def _isolated(tmp_path, monkeypatch):
+    """Каждый тест — с пустой БД, свежим бэкендом координации и своим журналом писем."""
+    coordination.set_backend(coordination.MemoryBackend())
+    monkeypatch.setattr(mail_log, "path", tmp_path / "sent_log.sqlite3")
+    yield
+    _reset_mail_log()
+    with database.engine.begin() as conn:
+        for table in reversed(Base.metadata.sorted_tables):
+            conn.execute(table.delete())
+        conn.execute(text(f"DELETE FROM {STATUS_EVENTS}"))
+        conn.execute(text("DELETE FROM company_stats"))
+    body_store._cache.clear()
+    planner._cache.clear()
+    resilience._dependencies.clear()
+    resilience._hosts.clear()
+    deliverability._resolver = None
+
+
+@pytest.fixture
+def db():
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+@pytest.fixture
+def make_user(db):
+    def make(email: str = "owner@test.ru", send_email: str = "sales@test.ru", name: str = "Менеджер") -> User:
+        user = User(name=name, email=email, send_email=send_email, password_hash=hash_password("secret"))
+        db.add(user)
+        db.commit()
+        return user
+    return make
+
+
+@pytest.fixture
+def make_company(db):
+    def make(owner: User, **fields) -> Company:
+        fields.setdefault("name", f"Компания {db.query(Company).count() + 1}")
+        fields.setdefault("category", "Кейтеринг Томск")
+        fields.setdefault("website", "")
+        fields.setdefault("email", "")
+        fields.setdefault("status", "new")
+        comp = Company(owner_id=owner.id, **fields)
+        db.add(comp)
+        db.commit()
+        return comp
+    return make
+
+
+@pytest.fixture
+def auth():
+    def headers(user: User) -> dict:
+        return {"Authorization": f"Bearer {create_access_token(user.id, user.email)}"}
+    return headers
+
+
+@pytest.fixture
+def client():
+    from fastapi.testclient import TestClient
+    from backend.main import app
+
+    with TestClient(app) as test_client:
+        yield test_client
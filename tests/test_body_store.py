@@ -0,0 +1,67 @@
+from sqlalchemy import create_engine, text
+
+from backend import body_store
+from backend.database import Base, LetterBody
+
+LETTER = "Добрый день, компания «Кейтеринг», к вам обращается компания «Сибирский кедр»."
+
+
+def test_compressed_round_trip_is_small():
+    data = body_store.compress(LETTER)
+    assert body_store.decompress(data) == LETTER
+    assert len(data) < len(LETTER.encode("utf-8")) / 2
+
+
+def test_put_stores_each_text_once(db):
+    first = body_store.put(db, LETTER)
+    assert body_store.put(db, LETTER) == first and body_store.put(db, "") == ""
+    db.commit()
+    assert db.query(LetterBody).count() == 1
+    assert body_store.get_many(db, [first, "", "missing"]) == {first: LETTER}
+
+
+def _legacy_engine(tmp_path):
+    """БД старой версии: тексты прямо в companies.email_body и в сообщении чата."""
+    engine = create_engine(f"sqlite:///{tmp_path / 'legacy.db'}")
+    Base.metadata.create_all(engine)
+    with engine.begin() as conn:
+        conn.execute(text("ALTER TABLE companies ADD COLUMN email_body TEXT"))
+        conn.execute(text("INSERT INTO companies (id, owner_id, name, category, email_body) VALUES (1, 1, 'A', 'Кейтеринг', :body)"),
+                     {"body": LETTER})
+        conn.execute(text(
+            "INSERT INTO chat_messages (company_id, direction, author, text) VALUES (1, 'outgoing', 'me', :t)"
+        ), {"t": body_store._LETTER_PREFIX + "Тема\n\n" + LETTER})
+    return engine
+
+
+def test_migration_moves_legacy_texts_once(tmp_path):
+    engine = _legacy_engine(tmp_path)
+
+    assert body_store.migrate_legacy_bodies(engine) == 2
+    with engine.begin() as conn:
+        row = conn.execute(text("SELECT email_body, email_body_hash FROM companies")).one()
+        message = conn.execute(text("SELECT text, body_hash FROM chat_messages")).one()
+        # Сообщение, похожее на старое, после переноса уже не трогаем
+        conn.execute(text(
+            "INSERT INTO chat_messages (company_id, direction, author, text) VALUES (1, 'outgoing', 'me', :t)"
+        ), {"t": body_store._LETTER_PREFIX + "Тема\n\nтекст"})
+    assert row == (None, body_store.body_hash(LETTER))
+    assert message == (body_store._LETTER_PREFIX + "Тема", row[1])
+
+    assert body_store.migrate_legacy_bodies(engine) == 0
+    with engine.connect() as conn:
+        assert conn.execute(text("SELECT COUNT(*) FROM chat_messages WHERE body_hash IS NULL")).scalar() == 1
+
+
+def test_orphans_are_collected_only_on_request(tmp_path):
+    engine = _legacy_engine(tmp_path)
+    with engine.begin() as conn:
+        body_store.put(conn, "Никому не нужный текст")
+
+    body_store.migrate_legacy_bodies(engine)
+    with engine.connect() as conn:
+        assert conn.execute(text("SELECT COUNT(*) FROM letter_bodies")).scalar() == 2
+
+    assert body_store.collect_orphans(engine) == 1
+    with engine.connect() as conn:
+        assert conn.execute(text("SELECT hash FROM letter_bodies")).scalars().all() == [body_store.body_hash(LETTER)]
@@ -0,0 +1,188 @@
+import asyncio
+
+import pytest
+from sqlalchemy import text
+
+from backend import coordination, deliverability, main
+from backend.database import ChatMessage, Company, OutboxMessage, SessionLocal
+
+
+@pytest.fixture
+def sender(monkeypatch):
+    """Подменяет генерацию, PDF и отправку; возвращает список адресатов."""
+    sent = []
+
+    async def generate_email(name, category):
+        if name.startswith("Сломанная"):
+            raise RuntimeError("генерация упала")
+        return {"subject": f"КП для {name}", "body": "Текст"}
+
+    async def send_email(to_email, subject, body, attachment_path=None, from_email="", owner_id=0):
+        sent.append(to_email)
+        return True
+
+    monkeypatch.setattr(main, "generate_email", generate_email)
+    monkeypatch.setattr(main, "send_email", send_email)
+    monkeypatch.setattr(main, "generate_catalog_pdf", lambda: None)
+    return sent
+
+
+def _company(make_company, user, name, status="new"):
+    return make_company(user, name=name, status=status, email=f"{name.split()[-1]}@cater.ru",
+                        email_verdict=deliverability.DELIVERABLE)
+
+
+def _bulk(client, auth, user, ids, **fields):
+    resp = client.post("/companies/bulk", headers=auth(user), json={"ids": ids, "operation": "send", **fields})
+    assert resp.status_code == 200, resp.text
+    return resp.json()
+
+
+def test_failed_letter_does_not_lose_other_deliveries(client, db, make_user, make_company, auth, sender):
+    user = make_user()
+    good = [_company(make_company, user, f"Компания c{i}") for i in range(3)]
+    broken = _company(make_company, user, "Сломанная b1")
+
+    result = _bulk(client, auth, user, [c.id for c in good] + [broken.id])
+
+    assert result["sent"] == 3 and result["failed"] == 1
+    db.expire_all()
+    assert {db.get(Company, c.id).status for c in good} == {"email_sent"}
+    assert db.query(ChatMessage).count() == 3
+    assert db.get(Company, broken.id).status == "new" and not db.query(OutboxMessage).count()
+
+
+def test_bulk_send_skips_companies_past_new_unless_resend(client, db, make_user, make_company, auth, sender):
+    user = make_user()
+    fresh = _company(make_company, user, "Компания fresh")
+    replied = _company(make_company, user, "Компания replied", status="replied")
+
+    result = _bulk(client, auth, user, [fresh.id, replied.id])
+    assert result["sent"] == 1 and result["skipped"] == [replied.id]
+    assert sender == ["fresh@cater.ru"]
+
+    result = _bulk(client, auth, user, [replied.id], resend=True)
+    assert result["sent"] == 1 and result["skipped"] == []
+    db.expire_all()
+    assert db.get(Company, replied.id).status == "replied"
+
+
+def test_cancelled_batch_keeps_finished_deliveries(db, make_user, make_company, sender, monkeypatch):
+    user = make_user()
+    done = [_company(make_company, user, f"Компания d{i}") for i in range(2)]
+    slow = _company(make_company, user, "Компания slow")
+    fast_send = main.send_email
+
+    async def send_email(to_email, *args, **kwargs):
+        if to_email.startswith("slow"):
+            await asyncio.Event().wait()
+        return await fast_send(to_email, *args, **kwargs)
+
+    monkeypatch.setattr(main, "send_email", send_email)
+
+    async def scenario():
+        task = asyncio.create_task(main._send_each(db, user, done + [slow], {"sent": 0}))
+        while len(sender) < 2:
+            await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(scenario())
+    db.expire_all()
+    assert [db.get(Company, c.id).status for c in done + [slow]] == ["email_sent", "email_sent", "new"]
+
+
+def test_stale_batch_does_not_resend_after_lock_is_released(db, make_user, make_company, sender):
+    user = make_user()
+    comps = [_company(make_company, user, f"Компания r{i}") for i in range(2)]
+    other = SessionLocal()
+    try:
+        # Второй запрос выбрал компании, пока первый ещё не разослал письма
+        stale_user = other.get(type(user), user.id)
+        stale = other.query(Company).filter(Company.id.in_([c.id for c in comps])).all()
+
+        first = asyncio.run(main._send_batch(db, user, comps))
+        second = asyncio.run(main._send_batch(other, stale_user, stale))
+    finally:
+        other.close()
+
+    assert first["sent"] == 2
+    assert second["sent"] == 0 and second["already_sent"] == 2
+    assert len(sender) == 2
+
+
+def test_concurrent_batches_send_each_letter_once(db, make_user, make_company, sender):
+    user = make_user()
+    ids = [_company(make_company, user, f"Компания p{i}").id for i in range(4)]
+
+    async def batch():
+        session = SessionLocal()
+        try:
+            owner = session.get(type(user), user.id)
+            return await main._send_batch(session, owner, session.query(Company).filter(Company.id.in_(ids)).all())
+        finally:
+            session.close()
+
+    async def both():
+        return await asyncio.gather(batch(), batch())
+
+    results = asyncio.run(both())
+    assert sorted(sender) == sorted(f"p{i}@cater.ru" for i in range(4))
+    assert sum(r["sent"] for r in results) == 4
+
+
+def test_send_lock_is_held_only_for_its_own_letter(db, make_user, make_company, sender, monkeypatch):
+    user = make_user()
+    comps = [_company(make_company, user, f"Компания l{i}") for i in range(3)]
+    held = []
+    fast_send = main.send_email
+
+    async def send_email(to_email, *args, **kwargs):
+        backend = coordination.get_backend()
+        locked = []
+        for comp in comps:
+            token = await backend.try_lock(f"send:{comp.id}", 1)
+            if token is None:
+                locked.append(comp.email)
+            else:
+                await backend.unlock(f"send:{comp.id}", token)
+        held.append((to_email, locked))
+        return await fast_send(to_email, *args, **kwargs)
+
+    monkeypatch.setattr(main, "send_email", send_email)
+    monkeypatch.setattr(main, "_SEND_CONCURRENCY", 1)
+
+    counts = asyncio.run(main._send_batch(db, user, comps))
+
+    # Аренда берётся на одно письмо, а не на всю рассылку сразу
+    assert counts["sent"] == 3
+    assert held == [(c.email, [c.email]) for c in comps]
+
+
+def test_generated_letter_does_not_block_concurrent_writes(db, make_user, make_company, sender, monkeypatch):
+    user = make_user()
+    comps = [_company(make_company, user, f"Компания w{i}") for i in range(2)]
+    bystander = _company(make_company, user, "Компания bystander")
+    writes = []
+    fast_send = main.send_email
+
+    async def send_email(to_email, *args, **kwargs):
+        # Пока письмо уходит, другой запрос пишет в соседнюю компанию
+        other = SessionLocal()
+        try:
+            other.execute(text("PRAGMA busy_timeout = 200"))
+            other.get(Company, bystander.id).reply_text = to_email
+            other.commit()
+            writes.append("ok")
+        except Exception as e:
+            writes.append(type(e).__name__)
+        finally:
+            other.close()
+        return await fast_send(to_email, *args, **kwargs)
+
+    monkeypatch.setattr(main, "send_email", send_email)
+
+    counts = asyncio.run(main._send_batch(db, user, comps))
+
+    assert counts["sent"] == 2 and writes == ["ok", "ok"]
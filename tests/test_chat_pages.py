@@ -0,0 +1,72 @@
+from datetime import datetime, timedelta
+
+from backend import body_store
+from backend.database import ChatMessage
+
+
+def _messages(db, comp, count, same_time_from=None):
+    """count сообщений по возрастанию времени; начиная с same_time_from —
+    с одинаковым created_at, чтобы курсор опирался на id."""
+    start = datetime(2024, 1, 1)
+    rows = []
+    for i in range(count):
+        at = start + timedelta(minutes=min(i, same_time_from) if same_time_from is not None else i)
+        rows.append(ChatMessage(company_id=comp.id, direction="incoming", author=comp.name,
+                                text=f"m{i}", created_at=at))
+    db.add_all(rows)
+    db.commit()
+    return [m.id for m in rows]
+
+
+def _page(client, headers, comp, **params):
+    resp = client.get(f"/company/{comp.id}/messages", params=params, headers=headers)
+    assert resp.status_code == 200, resp.text
+    return resp.json()
+
+
+def test_before_cursor_walks_all_messages_once(client, db, make_user, make_company, auth):
+    user = make_user()
+    comp = make_company(user)
+    _messages(db, comp, 7, same_time_from=3)
+
+    seen, cursor = [], None
+    while True:
+        page = _page(client, auth(user), comp, limit=3, **({"before_id": cursor} if cursor else {}))
+        seen += [m["text"] for m in page["messages"]]
+        cursor = page["next_before_id"]
+        if cursor is None:
+            assert not page["has_more"]
+            break
+    assert seen == [f"m{i}" for i in reversed(range(7))]
+
+
+def test_after_cursor_returns_only_newer_messages(client, db, make_user, make_company, auth):
+    user = make_user()
+    comp = make_company(user)
+    ids = _messages(db, comp, 6, same_time_from=2)
+
+    page = _page(client, auth(user), comp, after_id=ids[2], limit=2)
+    assert [m["text"] for m in page["messages"]] == ["m4", "m3"]
+    assert page["has_more"] and page["next_before_id"] is None
+    page = _page(client, auth(user), comp, after_id=ids[4], limit=2)
+    assert [m["text"] for m in page["messages"]] == ["m5"] and not page["has_more"]
+
+
+def test_letter_body_is_joined_to_subject(client, db, make_user, make_company, auth):
+    user = make_user()
+    comp = make_company(user)
+    db.add(ChatMessage(company_id=comp.id, direction="outgoing", author=user.name, text="Тема",
+                       body_hash=body_store.put(db, "Текст письма")))
+    db.commit()
+    assert _page(client, auth(user), comp)["messages"][0]["text"] == "Тема\n\nТекст письма"
+
+
+def test_foreign_cursor_and_company_are_rejected(client, db, make_user, make_company, auth):
+    user = make_user()
+    other = make_user(email="other@test.ru")
+    comp, foreign = make_company(user), make_company(other)
+    foreign_id = _messages(db, foreign, 1)[0]
+
+    resp = client.get(f"/company/{comp.id}/messages", params={"before_id": foreign_id}, headers=auth(user))
+    assert resp.status_code == 400
+    assert client.get(f"/company/{foreign.id}/messages", headers=auth(user)).status_code == 404
@@ -0,0 +1,95 @@
+import asyncio
+
+import pytest
+
+from backend import contact_discovery as cd
+from backend import search_agent
+
+
+class _Response:
+    def __init__(self, status_code: int, text: str, url: str):
+        self.status_code = status_code
+        self.text = text
+        self.url = url
+
+
+class FakeClient:
+    """Вместо httpx.AsyncClient: страницы из словаря, остальное — 404."""
+
+    def __init__(self, pages: dict):
+        self.pages = pages
+        self.requested = []
+
+    async def get(self, url, headers=None, timeout=None):
+        self.requested.append(url)
+        if url in self.pages:
+            return _Response(200, self.pages[url], url)
+        return _Response(404, "", url)
+
+
+HOME = """
+<a href="/news/1">Новости</a>
+<a href="/o-kompanii/">О компании</a>
+<a href="https://cater.ru/kontakty" title="Связаться">Контакты</a>
+<a href="https://other.ru/contacts">Партнёр</a>
+<a href="mailto:info@cater.ru">почта</a>
+<a href="/price.pdf">Контакты (PDF)</a>
+"""
+
+
+def test_extract_links_keeps_same_site_pages_only():
+    links = cd.extract_links(HOME, "https://www.cater.ru/")
+    urls = [url for url, _ in links]
+    assert "https://cater.ru/kontakty" in urls
+    assert "https://www.cater.ru/o-kompanii/" in urls
+    assert not any("other.ru" in u or u.startswith("mailto") for u in urls)
+
+
+def test_rank_prefers_contact_page_over_about_and_skips_files():
+    ranked = cd.rank_contact_pages(cd.extract_links(HOME, "https://cater.ru/"), limit=3)
+    assert ranked[0] == "https://cater.ru/kontakty"
+    assert "https://cater.ru/o-kompanii/" in ranked
+    assert not any(u.endswith(".pdf") or "/news/" in u for u in ranked)
+
+
+def test_score_zero_for_home_and_unrelated_pages():
+    assert cd.score_candidate("https://cater.ru/") == 0
+    assert cd.score_candidate("https://cater.ru/menu", "Меню") == 0
+    assert cd.score_candidate("https://cater.ru/contacts") > cd.score_candidate("https://cater.ru/a/b/contacts")
+
+
+def test_discover_falls_back_to_sitemap_index():
+    client = FakeClient({
+        "https://cater.ru/sitemap.xml": "<sitemapindex><loc>https://cater.ru/sitemap-pages.xml</loc></sitemapindex>",
+        "https://cater.ru/sitemap-pages.xml": "<urlset><loc>https://cater.ru/menu</loc>"
+                                              "<loc>https://cater.ru/contacts/</loc></urlset>",
+    })
+    found = asyncio.run(search_agent._discover_contact_pages(
+        client, "<p>без ссылок</p>", "https://cater.ru/", "https://cater.ru", use_sitemap=True,
+    ))
+    assert found == ["https://cater.ru/contacts/"]
+
+
+def test_discover_guesses_contacts_without_links_or_sitemap():
+    found = asyncio.run(search_agent._discover_contact_pages(
+        FakeClient({}), None, "https://cater.ru/", "https://cater.ru", use_sitemap=True,
+    ))
+    assert found == ["https://cater.ru/contacts"]
+
+
+@pytest.mark.parametrize("html, phone", [
+    ("Звоните: 84951234567", "+7 (495) 123-45-67"),
+    ("Звоните: +74951234567", "+7 (495) 123-45-67"),
+    ("Тел. 8 (495) 123-45-67", "+7 (495) 123-45-67"),
+    ("Тел. +7 3822 12 34 56", "+7 (3822) 12-34-56"),
+    ("Тел. 8(38245)2-12-34", "+7 (38245) 2-12-34"),
+    ('<a href="tel:+7 (3822) 12-34-56">позвонить</a>', "+7 (3822) 12-34-56"),
+    ('<a href="tel:+74951234567">позвонить</a>', "+7 (495) 123-45-67"),
+])
+def test_extract_phones_takes_code_length_only_when_visible(html, phone):
+    assert cd.extract_phones(html) == [phone]
+
+
+def test_extract_phones_deduplicates_link_and_text():
+    html = '<a href="tel:+7-3822-12-34-56">+7 (3822) 12-34-56</a> или 8 (3822) 12-34-56, ИНН 7017123456'
+    assert cd.extract_phones(html) == ["+7 (3822) 12-34-56"]
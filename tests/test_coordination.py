@@ -0,0 +1,108 @@
+import asyncio
+
+import pytest
+
+from backend import coordination
+from backend.coordination import MemoryBackend, SQLiteBackend
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def backend(request, tmp_path):
+    backend = MemoryBackend() if request.param == "memory" else SQLiteBackend(tmp_path / "coordination.sqlite3")
+    coordination.set_backend(backend)
+    return backend
+
+
+def test_lock_without_wait_reports_busy(backend):
+    async def main():
+        async with coordination.lock("send:1", wait=False) as first:
+            async with coordination.lock("send:1", wait=False) as second:
+                pass
+        async with coordination.lock("send:1", wait=False) as again:
+            return first, second, again
+    assert asyncio.run(main()) == (True, False, True)
+
+
+def test_waiting_lock_gets_it_after_release(backend):
+    order = []
+
+    async def holder():
+        async with coordination.lock("job"):
+            order.append("held")
+            await asyncio.sleep(0.1)
+            order.append("released")
+
+    async def waiter():
+        await asyncio.sleep(0.01)
+        async with coordination.lock("job"):
+            order.append("acquired")
+
+    async def main():
+        await asyncio.gather(holder(), waiter())
+    asyncio.run(main())
+    assert order == ["held", "released", "acquired"]
+
+
+def test_sqlite_waiter_polls_without_write_transactions(tmp_path):
+    backend = SQLiteBackend(tmp_path / "coordination.sqlite3")
+    coordination.set_backend(backend)
+
+    async def waiter():
+        async with coordination.lock("job"):
+            pass
+
+    async def main():
+        async with coordination.lock("job"):
+            before = backend._writes
+            task = asyncio.create_task(waiter())
+            await asyncio.sleep(0.5)
+            writes = backend._writes - before
+        await asyncio.wait_for(task, 2)
+        return writes
+    # Одна неудачная попытка взять; дальше ожидание только читает
+    assert asyncio.run(main()) == 1
+
+
+def test_expired_lock_can_be_taken(backend):
+    async def main():
+        assert await backend.try_lock("stale", ttl=-1)        # владелец «упал»
+        return await backend.try_lock("stale", ttl=60)
+    assert asyncio.run(main())
+
+
+def test_semaphore_limits_concurrency(backend):
+    active, peak = [0], [0]
+
+    async def job():
+        async with coordination.semaphore("scrape", 2):
+            active[0] += 1
+            peak[0] = max(peak[0], active[0])
+            await asyncio.sleep(0.02)
+            active[0] -= 1
+
+    async def main():
+        await asyncio.gather(*(job() for _ in range(6)))
+    asyncio.run(main())
+    assert peak[0] == 2
+
+
+def test_concurrent_misses_load_once(backend):
+    calls = []
+
+    async def loader():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return {"emails": ["info@cater.ru"]}
+
+    async def main():
+        return await asyncio.gather(*(coordination.cached("scrape:cater.ru", 60, loader) for _ in range(5)))
+    results = asyncio.run(main())
+    assert len(calls) == 1 and all(r == {"emails": ["info@cater.ru"]} for r in results)
+
+
+def test_counter_resets_after_ttl(backend):
+    async def main():
+        first = [await backend.incr("rate:x", ttl=60) for _ in range(3)]
+        expired = await backend.incr("rate:y", ttl=-1), await backend.incr("rate:y", ttl=-1)
+        return first, expired
+    assert asyncio.run(main()) == ([1, 2, 3], (1, 1))
@@ -0,0 +1,186 @@
+import asyncio
+import socket
+import struct
+import time
+
+import pytest
+
+from backend import deliverability as dv
+
+
+def _name(host: str) -> bytes:
+    return b"".join(bytes([len(p)]) + p.encode() for p in host.split(".") if p) + b"\0"
+
+
+def _rr(rtype: int, ttl: int, rdata: bytes) -> bytes:
+    return b"\xc0\x0c" + struct.pack("!HHIH", rtype, 1, ttl, len(rdata)) + rdata
+
+
+def mx(host: str, ttl: int = 3600, preference: int = 10) -> bytes:
+    return _rr(dv.QTYPE_MX, ttl, struct.pack("!H", preference) + _name(host))
+
+
+def a(ip: str, ttl: int = 3600) -> bytes:
+    return _rr(dv.QTYPE_A, ttl, socket.inet_aton(ip))
+
+
+def soa(ttl: int, minimum: int) -> bytes:
+    return _rr(dv.QTYPE_SOA, ttl, _name("ns.zone") + _name("admin.zone") + struct.pack("!IIIII", 1, 2, 3, 4, minimum))
+
+
+class StubDns(asyncio.DatagramProtocol):
+    """DNS-сервер для тестов: zone[(имя, тип)] → (rcode, ответы, authority).
+    Чего нет в zone — NXDOMAIN без SOA; имя в silent — без ответа."""
+
+    def __init__(self, zone: dict, silent=()):
+        self.zone = zone
+        self.silent = set(silent)
+        self.queries = []
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        qid = struct.unpack("!H", data[:2])[0]
+        name, offset = dv._read_name(data, 12)
+        qtype = struct.unpack("!H", data[offset:offset + 2])[0]
+        self.queries.append((name, qtype))
+        if name in self.silent:
+            return
+        rcode, answers, authority = self.zone.get((name, qtype), (dv.RCODE_NXDOMAIN, [], []))
+        header = struct.pack("!HHHHHH", qid, 0x8180 | rcode, 1, len(answers), len(authority), 0)
+        self.transport.sendto(header + data[12:offset + 4] + b"".join(answers) + b"".join(authority), addr)
+
+
+def run_with_stub(zone, scenario, host="127.0.0.1", silent=()):
+    async def main():
+        loop = asyncio.get_running_loop()
+        transport, stub = await loop.create_datagram_endpoint(lambda: StubDns(zone, silent), local_addr=(host, 0))
+        try:
+            resolver = dv.Resolver(transport.get_extra_info("sockname")[:2], timeout=0.2)
+            return await scenario(resolver, stub)
+        finally:
+            transport.close()
+    return asyncio.run(main())
+
+
+ZONE = {
+    ("cater.ru", dv.QTYPE_MX): (dv.RCODE_NOERROR, [mx("mx2.cater.ru", preference=20), mx("mx1.cater.ru", 300)], []),
+    ("nomx.ru", dv.QTYPE_MX): (dv.RCODE_NOERROR, [], [soa(600, 120)]),
+    ("nomx.ru", dv.QTYPE_A): (dv.RCODE_NOERROR, [a("10.0.0.1")], []),
+    ("nomail.ru", dv.QTYPE_MX): (dv.RCODE_NOERROR, [mx("")], []),
+    ("broken.ru", dv.QTYPE_MX): (dv.RCODE_SERVFAIL, [], []),
+    ("gone.ru", dv.QTYPE_MX): (dv.RCODE_NXDOMAIN, [], [soa(7200, 5)]),
+    ("bad.ru", dv.QTYPE_MX): (dv.RCODE_NOERROR, [b"\xc0"], []),     # обрезанная запись
+}
+
+
+@pytest.mark.parametrize("value, expected", [
+    ("1.2.3.4", ("1.2.3.4", 53)),
+    ("1.2.3.4:5353", ("1.2.3.4", 5353)),
+    ("::1", ("::1", 53)),
+    ("2001:db8::53", ("2001:db8::53", 53)),
+    ("[2001:db8::53]:5353", ("2001:db8::53", 5353)),
+    ("[::1]", ("::1", 53)),
+    ("fe80::1%eth0", ("fe80::1%eth0", 53)),
+])
+def test_parse_nameserver(value, expected):
+    assert dv.parse_nameserver(value) == expected
+
+
+def test_resolv_conf_ipv6_nameserver(tmp_path, monkeypatch):
+    conf = tmp_path / "resolv.conf"
+    conf.write_text("# comment\nsearch local\nnameserver fe80::1%eth0\nnameserver 1.1.1.1\n")
+    monkeypatch.setattr(dv, "_RESOLV_CONF", str(conf))
+    monkeypatch.delenv("DNS_RESOLVER", raising=False)
+    assert dv._default_nameserver() == ("fe80::1%eth0", 53)
+
+
+@pytest.mark.parametrize("email, verdict", [
+    ("sales@cater.ru", (dv.DELIVERABLE, "mx")),
+    ("sales@nomx.ru", (dv.DELIVERABLE, "implicit_mx")),
+    ("sales@nomail.ru", (dv.UNDELIVERABLE, "null_mx")),
+    ("sales@gone.ru", (dv.UNDELIVERABLE, "nxdomain")),
+    ("sales@broken.ru", (dv.UNKNOWN, "dns_rcode_2")),
+    ("not-an-email", (dv.UNDELIVERABLE, "syntax")),
+])
+def test_verdicts(email, verdict):
+    async def scenario(resolver, stub):
+        return await dv.verify_email(email, resolver, smtp_probe=False)
+    assert run_with_stub(ZONE, scenario) == verdict
+
+
+def test_timeout_is_unknown():
+    async def scenario(resolver, stub):
+        return await dv.verify_email("a@slow.ru", resolver, smtp_probe=False), len(stub.queries)
+    verdict, queries = run_with_stub(ZONE, scenario, silent={"slow.ru"})
+    assert verdict == (dv.UNKNOWN, "dns_timeout")
+    assert queries == dv._DNS_ATTEMPTS
+
+
+def test_answers_are_cached_by_ttl():
+    async def scenario(resolver, stub):
+        first = await resolver.lookup("Cater.RU.", dv.QTYPE_MX)
+        second = await resolver.lookup("cater.ru", dv.QTYPE_MX)
+        expires = resolver._cache[("cater.ru", dv.QTYPE_MX)][0]
+        return first, second, expires - time.monotonic(), len(stub.queries)
+    first, second, left, queries = run_with_stub(ZONE, scenario)
+    assert second is first and queries == 1
+    assert sorted(first.records) == [(10, "mx1.cater.ru"), (20, "mx2.cater.ru")]
+    assert first.ttl == 300 and 299 < left <= 300       # минимальный TTL набора записей
+
+
+def test_negative_answers_use_soa_ttl_and_servfail_is_not_cached():
+    async def scenario(resolver, stub):
+        gone = await resolver.lookup("gone.ru", dv.QTYPE_MX)
+        nomx = await resolver.lookup("nomx.ru", dv.QTYPE_MX)
+        await resolver.lookup("gone.ru", dv.QTYPE_MX)
+        await resolver.lookup("broken.ru", dv.QTYPE_MX)
+        await resolver.lookup("broken.ru", dv.QTYPE_MX)
+        return gone.ttl, nomx.ttl, stub.queries
+    gone_ttl, nomx_ttl, queries = run_with_stub(ZONE, scenario)
+    assert gone_ttl == dv._MIN_TTL           # min(7200, 5) → не меньше _MIN_TTL
+    assert nomx_ttl == 120                   # min(TTL SOA, MINIMUM) — RFC 2308
+    assert queries.count(("gone.ru", dv.QTYPE_MX)) == 1
+    assert queries.count(("broken.ru", dv.QTYPE_MX)) == 2
+
+
+def test_concurrent_lookups_share_one_query():
+    async def scenario(resolver, stub):
+        await asyncio.gather(*(resolver.lookup("cater.ru", dv.QTYPE_MX) for _ in range(10)))
+        return stub.queries
+    assert run_with_stub(ZONE, scenario) == [("cater.ru", dv.QTYPE_MX)]
+
+
+def test_verify_many_deduplicates_addresses():
+    async def scenario(resolver, stub):
+        result = await dv.verify_many([" a@cater.ru", "a@cater.ru", "b@gone.ru", ""], resolver)
+        return result, stub.queries
+    result, queries = run_with_stub(ZONE, scenario)
+    assert result == {"a@cater.ru": (dv.DELIVERABLE, "mx"), "b@gone.ru": (dv.UNDELIVERABLE, "nxdomain")}
+    assert len(queries) == 2
+
+
+def _ipv6_loopback() -> bool:
+    try:
+        with socket.socket(socket.AF_INET6, socket.SOCK_DGRAM) as s:
+            s.bind(("::1", 0))
+        return True
+    except OSError:
+        return False
+
+
+@pytest.mark.skipif(not _ipv6_loopback(), reason="нет IPv6 loopback")
+def test_resolver_over_ipv6():
+    async def scenario(resolver, stub):
+        return await dv.verify_email("sales@cater.ru", resolver, smtp_probe=False)
+    assert run_with_stub(ZONE, scenario, host="::1") == (dv.DELIVERABLE, "mx")
+
+
+def test_malformed_reply_is_unknown_and_does_not_break_batch():
+    async def scenario(resolver, stub):
+        return await dv.verify_many(["a@bad.ru", "b@cater.ru"], resolver)
+    assert run_with_stub(ZONE, scenario) == {
+        "a@bad.ru": (dv.UNKNOWN, "dns_error"),
+        "b@cater.ru": (dv.DELIVERABLE, "mx"),
+    }
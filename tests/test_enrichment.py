@@ -0,0 +1,78 @@
+import asyncio
+
+from backend import enrichment, outbox
+from backend.database import Company
+
+FOUND = {"emails": ["sales@cater.ru"], "phones": ["+7 (3822) 12-34-56"], "address": "Томск, ул. Ленина, 1"}
+
+
+def _stub(make_company, user, **fields):
+    return make_company(user, website="cater.ru", email="info@cater.ru", **fields)
+
+
+def test_apply_replaces_stub_email_and_fills_contacts(db, make_user, make_company):
+    comp = _stub(make_company, make_user())
+
+    owner_id, changes = enrichment._apply(comp.id, FOUND)
+
+    db.expire_all()
+    saved = db.get(Company, comp.id)
+    assert saved.email == "sales@cater.ru" and saved.phone == "+7 (3822) 12-34-56"
+    assert set(changes) == {"email", "email_verdict", "phone", "address"}
+
+
+def test_fallback_email_uses_bare_host():
+    assert enrichment.fallback_email("http://cater.ru") == "info@cater.ru"
+    assert enrichment.fallback_email("https://www.Cater.ru/contacts") == "info@cater.ru"
+    assert enrichment.fallback_email("cater.ru/menu") == "info@cater.ru"
+    assert enrichment.fallback_email(None) == "info@unknown.com"
+
+
+def test_apply_keeps_email_of_company_queued_in_outbox(db, make_user, make_company):
+    user = make_user()
+    comp = _stub(make_company, user, email_subject="Тема")
+    outbox.enqueue(db, comp, user, None, "timeout")
+    db.commit()
+
+    _, changes = enrichment._apply(comp.id, FOUND)
+
+    db.expire_all()
+    assert db.get(Company, comp.id).email == "info@cater.ru"
+    assert "email" not in changes and changes["phone"] == "+7 (3822) 12-34-56"
+
+
+def test_apply_keeps_email_once_company_left_new(db, make_user, make_company):
+    comp = _stub(make_company, make_user(), status="email_sent")
+    _, changes = enrichment._apply(comp.id, FOUND)
+    assert "email" not in changes
+
+
+def test_claim_skips_real_info_address_with_complete_contacts(db, make_user, make_company):
+    user = make_user()
+    full = {"phone": "+7 (3822) 12-34-56", "address": "Томск"}
+    stubs = [
+        make_company(user, website="https://www.cater.ru/about", email="info@cater.ru", **full),
+        make_company(user, website="http://kitchen.ru", email="info@kitchen.ru", **full),
+    ]
+    make_company(user, website="https://food.ru", email="info@food-delivery.ru", **full)
+
+    assert sorted(enrichment._claim(db, 10)) == sorted(c.id for c in stubs)
+
+
+def test_worker_claims_each_company_once(db, make_user, make_company, monkeypatch):
+    comp = _stub(make_company, make_user())
+    calls = []
+
+    async def scrape_contacts(url, max_pages):
+        calls.append(url)
+        return FOUND
+
+    monkeypatch.setattr(enrichment, "scrape_contacts", scrape_contacts)
+
+    async def two_workers():
+        return await asyncio.gather(enrichment.process_batch(), enrichment.process_batch())
+
+    assert sorted(asyncio.run(two_workers())) == [0, 1]
+    assert calls == ["https://cater.ru"]
+    db.expire_all()
+    assert db.get(Company, comp.id).enrich_attempts == 1
@@ -0,0 +1,73 @@
+import asyncio
+import threading
+
+import pytest
+from starlette.websockets import WebSocketDisconnect
+
+from backend import events
+from backend.auth import create_access_token
+from backend.events import EventBus
+
+
+def test_publish_reaches_only_subscribers_of_that_user():
+    async def main():
+        bus = EventBus()
+        mine, other = bus.subscribe(1), bus.subscribe(2)
+        bus.publish(1, {"type": "resync"})
+        bus.publish(3, {"type": "resync"})        # без подписчиков — просто ничего
+        return mine.get_nowait(), other.empty()
+    assert asyncio.run(main()) == ({"type": "resync"}, True)
+
+
+def test_publish_from_worker_thread_is_delivered_on_loop():
+    async def main():
+        bus = EventBus()
+        queue = bus.subscribe(1)
+        thread = threading.Thread(target=bus.publish, args=(1, {"type": "company_changed"}))
+        thread.start()
+        thread.join()
+        return await asyncio.wait_for(queue.get(), 1)
+    assert asyncio.run(main()) == {"type": "company_changed"}
+
+
+def test_lagging_client_gets_single_resync(monkeypatch):
+    monkeypatch.setattr(events, "_QUEUE_SIZE", 3)
+
+    async def main():
+        bus = EventBus()
+        queue = bus.subscribe(1)
+        for i in range(4):
+            bus.publish(1, {"type": "company_changed", "company_id": i})
+        return [queue.get_nowait() for _ in range(queue.qsize())]
+    assert asyncio.run(main()) == [{"type": "resync"}]
+
+
+def test_unsubscribe_stops_delivery():
+    async def main():
+        bus = EventBus()
+        queue = bus.subscribe(1)
+        bus.unsubscribe(1, queue)
+        bus.publish(1, {"type": "resync"})
+        return queue.empty(), bus._subscribers
+    assert asyncio.run(main()) == (True, {})
+
+
+def test_socket_rejects_bad_token(client):
+    with pytest.raises(WebSocketDisconnect) as info:
+        with client.websocket_connect("/ws?token=garbage") as ws:
+            ws.receive_json()
+    assert info.value.code == 4401
+
+
+def test_socket_pushes_status_change_and_new_message(client, make_user, make_company, auth):
+    user = make_user()
+    comp = make_company(user, status="email_sent")
+    token = create_access_token(user.id, user.email)
+
+    with client.websocket_connect(f"/ws?token={token}") as ws:
+        client.post(f"/company/{comp.id}/messages", headers=auth(user),
+                    json={"direction": "incoming", "text": "Интересно, пришлите прайс"})
+        changed, appended = ws.receive_json(), ws.receive_json()
+
+    assert changed == {"type": "company_changed", "company_id": comp.id, "changes": {"status": "replied"}}
+    assert appended["type"] == "message_appended" and appended["message"]["text"] == "Интересно, пришлите прайс"
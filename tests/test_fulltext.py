@@ -0,0 +1,82 @@
+from sqlalchemy import create_engine, text
+
+from backend import fulltext
+from backend.database import Base, ChatMessage
+
+
+def _message(db, comp, body):
+    db.add(ChatMessage(company_id=comp.id, direction="incoming", author=comp.name, text=body))
+    db.commit()
+
+
+def test_match_query_quotes_tokens_and_drops_operators():
+    assert fulltext.build_match_query('кейтер* OR "томск" NEAR(') == '"кейтер"* "or"* "томск"* "near"*'
+    assert fulltext.build_match_query("  -- ") == ""
+
+
+def test_search_finds_companies_and_messages_by_prefix(db, make_user, make_company):
+    user = make_user()
+    comp = make_company(user, name="Кейтеринг Сибирь", description="фуршеты в Томске")
+    _message(db, comp, "Пришлите прайс на фуршет")
+
+    results, has_more = fulltext.search(db, user.id, "фурш")
+    assert {(r["kind"], r["company_id"]) for r in results} == {("company", comp.id), ("message", comp.id)}
+    assert not has_more
+
+
+def test_search_is_limited_to_owner(db, make_user, make_company):
+    mine = make_user()
+    other = make_user(email="other@test.ru")
+    make_company(other, name="Чужой кейтеринг")
+    assert fulltext.search(db, mine.id, "кейтеринг") == ([], False)
+
+
+def test_scores_are_normalized_per_source(db, make_user, make_company):
+    user = make_user()
+    # Слово редкое среди компаний и частое в переписке: сырые bm25 двух
+    # индексов сильно отличаются, а лучший результат каждого источника — 1.0
+    best = make_company(user, name="Орехи кедровые")
+    make_company(user, name="Мёд", description="и орехи тоже")
+    for i in range(5):
+        _message(db, best, f"орехи {i} " + "слово " * i)
+
+    results, _ = fulltext.search(db, user.id, "орехи", limit=50)
+    by_kind = {}
+    for r in results:
+        by_kind.setdefault(r["kind"], []).append(r["score"])
+    assert max(by_kind["company"]) == 1.0 and max(by_kind["message"]) == 1.0
+    assert all(0 < s <= 1 for scores in by_kind.values() for s in scores)
+    assert [r["score"] for r in results] == sorted((r["score"] for r in results), reverse=True)
+
+
+def test_pages_do_not_overlap(db, make_user, make_company):
+    user = make_user()
+    for i in range(7):
+        make_company(user, name=f"Банкет {i}")
+    first, more = fulltext.search(db, user.id, "банкет", limit=4)
+    second, more_after = fulltext.search(db, user.id, "банкет", limit=4, offset=4)
+    assert more and not more_after
+    assert len({r["id"] for r in first + second}) == 7
+
+
+def test_endpoint_clamps_offset(client, make_user, make_company, auth):
+    user = make_user()
+    make_company(user, name="Банкет")
+    resp = client.get("/search-local", params={"q": "банкет", "offset": -5}, headers=auth(user))
+    assert resp.json()["offset"] == 0 and len(resp.json()["results"]) == 1
+    resp = client.get("/search-local", params={"q": "банкет", "offset": 10 ** 9}, headers=auth(user))
+    assert resp.json()["offset"] == 1000
+
+
+def test_failed_ddl_leaves_no_partial_index(tmp_path, monkeypatch):
+    engine = create_engine(f"sqlite:///{tmp_path / 'fts.db'}")
+    Base.metadata.create_all(engine)
+    monkeypatch.setattr(fulltext, "_INDEXES", fulltext._INDEXES + [("broken_fts", "no_such_table", ["x"])])
+
+    fulltext.create_fulltext_index(engine)
+
+    assert not fulltext.fts_available
+    with engine.connect() as conn:
+        names = {n for (n,) in conn.execute(text("SELECT name FROM sqlite_master"))}
+    assert not {"companies_fts", "chat_messages_fts", "companies_fts_ai"} & names
+    fulltext.fts_available = True
@@ -0,0 +1,79 @@
+from sqlalchemy import create_engine, text
+
+from backend import funnel
+from backend.database import Base, Company
+
+
+def _recount(db, owner_id):
+    """Эталон: та же воронка, посчитанная по самим компаниям."""
+    rows = db.execute(
+        text("SELECT status, category, COUNT(*) FROM companies WHERE owner_id = :o GROUP BY 1, 2"),
+        {"o": owner_id},
+    ).all()
+    return {(status, category): count for status, category, count in rows}
+
+
+def _counters(db, owner_id):
+    stats = funnel.stats(db, owner_id)
+    return {
+        (status, entry["category"]): count
+        for entry in stats["by_category"] for status, count in entry["by_status"].items()
+    }
+
+
+def test_counters_follow_every_write_path(db, make_user, make_company):
+    user = make_user()
+    comps = [make_company(user, category="Кейтеринг" if i % 2 else "Банкеты") for i in range(6)]
+
+    comps[0].status = "email_sent"                                     # одиночная смена
+    db.commit()
+    db.query(Company).filter(Company.id.in_([c.id for c in comps[1:4]])).update(
+        {Company.status: "replied"}, synchronize_session=False,
+    )                                                                  # массовый UPDATE
+    comps[4].category = "Фуршеты"                                      # смена категории
+    db.delete(comps[5])
+    db.commit()
+
+    assert _counters(db, user.id) == _recount(db, user.id)
+    stats = funnel.stats(db, user.id)
+    assert stats["total"] == 5
+    assert stats["by_status"] == {"new": 1, "email_sent": 1, "replied": 3}
+
+
+def test_status_history_records_transitions_only(db, make_user, make_company):
+    user = make_user()
+    comp = make_company(user)
+    for status in ("email_sent", "email_sent", "replied"):
+        comp.status = status
+        db.commit()
+    history = db.execute(
+        text(f"SELECT status FROM {funnel.STATUS_EVENTS} WHERE company_id = :id ORDER BY id"), {"id": comp.id},
+    ).scalars().all()
+    assert history == ["new", "email_sent", "replied"]
+
+
+def test_tables_are_backfilled_for_existing_companies(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'old.db'}")
+    Base.metadata.create_all(engine)
+    with engine.begin() as conn:
+        conn.execute(text(
+            "INSERT INTO companies (owner_id, name, category, status, email_sent_at) VALUES "
+            "(1, 'A', 'Кейтеринг', 'new', NULL), (1, 'B', 'Кейтеринг', 'email_sent', '2024-01-02')"
+        ))
+
+    funnel.create_funnel_tables(engine)
+    funnel.create_funnel_tables(engine)   # повторный старт не задваивает
+
+    with engine.connect() as conn:
+        assert funnel.stats(conn, 1)["by_status"] == {"new": 1, "email_sent": 1}
+        events = conn.execute(text(f"SELECT COUNT(*) FROM {funnel.STATUS_EVENTS}")).scalar()
+    assert events == 3
+
+
+def test_stats_endpoint_is_per_user(client, make_user, make_company, auth):
+    user = make_user()
+    other = make_user(email="other@test.ru")
+    make_company(user)
+    make_company(other)
+    make_company(other)
+    assert client.get("/stats", headers=auth(user)).json()["total"] == 1
@@ -0,0 +1,92 @@
+import asyncio
+import json
+
+from backend import main, search_agent
+from backend.database import Company
+
+
+def _collect(agen):
+    async def run():
+        return [batch async for batch in agen]
+    return asyncio.run(run())
+
+
+def test_query_variants_are_distinct_and_normalized():
+    queries = search_agent._build_query_variants("  Кейтеринг   Томск ", 5)
+    assert len(queries) == 5
+    assert len(set(queries)) == 5
+    assert all(q.startswith("Кейтеринг Томск ") for q in queries)
+
+
+def test_normalize_host_ignores_scheme_www_port_and_path():
+    for url in ("https://www.Cater.ru/contacts", "http://cater.ru:8080", "cater.ru/?q=1", "www.cater.ru."):
+        assert search_agent._normalize_host(url) == "cater.ru"
+
+
+def test_harvest_scrapes_each_host_once(monkeypatch):
+    pages = {
+        "q0": [{"url": "https://a.ru", "title": "A"}, {"url": "https://b.ru/about", "title": "B"}],
+        "q1": [{"url": "https://www.a.ru/contacts", "title": "A2"}, {"url": "https://c.ru", "title": "C"}],
+        "q2": [{"url": "http://b.ru", "title": "B2"}],
+    }
+    scraped = []
+
+    async def tavily(query, max_results):
+        return pages[query]
+
+    async def enrich(results, limit):
+        scraped.extend(r["url"] for r in results)
+        return [dict(r, _scraped_emails=[]) for r in results]
+
+    monkeypatch.setattr(search_agent, "TAVILY_API_KEY", "key")
+    monkeypatch.setattr(search_agent, "_build_query_variants", lambda category, n: list(pages))
+    monkeypatch.setattr(search_agent, "_tavily_search", tavily)
+    monkeypatch.setattr(search_agent, "_enrich_results_with_emails", enrich)
+
+    batches = _collect(search_agent.harvest_companies("Кейтеринг", max_queries=3))
+
+    hosts = [search_agent._normalize_host(u) for u in scraped]
+    assert sorted(hosts) == ["a.ru", "b.ru", "c.ru"]
+    assert sum(len(b) for b in batches) == 3
+
+
+def test_harvest_survives_failed_query(monkeypatch):
+    async def tavily(query, max_results):
+        if query == "bad":
+            raise RuntimeError("429")
+        return [{"url": "https://ok.ru", "title": "OK"}]
+
+    async def enrich(results, limit):
+        return [dict(r, _scraped_emails=["info@ok.ru"]) for r in results]
+
+    monkeypatch.setattr(search_agent, "TAVILY_API_KEY", "key")
+    monkeypatch.setattr(search_agent, "_build_query_variants", lambda category, n: ["bad", "good"])
+    monkeypatch.setattr(search_agent, "_tavily_search", tavily)
+    monkeypatch.setattr(search_agent, "_enrich_results_with_emails", enrich)
+
+    batches = _collect(search_agent.harvest_companies("Кейтеринг"))
+    assert [[c["email"] for c in b] for b in batches] == [["info@ok.ru"]]
+
+
+def test_harvest_without_key_returns_mock_data():
+    batches = _collect(search_agent.harvest_companies("Кейтеринг"))
+    assert batches == [search_agent.MOCK_COMPANIES]
+
+
+def test_harvest_endpoint_streams_only_new_companies(client, db, make_user, make_company, auth, monkeypatch):
+    user = make_user()
+    make_company(user, name="Уже есть", email="old@a.ru")
+
+    async def harvest(category, max_queries):
+        yield [{"name": "Уже есть", "website": "a.ru"}, {"name": "Новая", "email": "new@b.ru", "website": "b.ru"}]
+        yield [{"name": "Другая", "email": "new@b.ru", "website": "b2.ru"}, {"name": "Третья", "website": "c.ru"}]
+
+    monkeypatch.setattr(main, "harvest_companies", harvest)
+    resp = client.post("/search/harvest", json={"category": "Кейтеринг"}, headers=auth(user))
+    lines = [json.loads(line) for line in resp.text.splitlines()]
+
+    assert [line["type"] for line in lines] == ["companies", "companies", "done"]
+    assert [c["name"] for c in lines[0]["companies"]] == ["Новая"]
+    assert [c["name"] for c in lines[1]["companies"]] == ["Третья"]
+    assert lines[-1]["added"] == 2 and lines[-1]["total_found"] == 4
+    assert db.query(Company).filter(Company.owner_id == user.id).count() == 3
@@ -0,0 +1,65 @@
+import asyncio
+import sqlite3
+
+from backend import mail_log as mail_log_module
+from backend.mail_log import mail_log
+
+
+def _write(*entries):
+    async def main():
+        for owner_id, to_email in entries:
+            mail_log.append(to_email, "Тема", f"Текст для {to_email}", from_email="sales@test.ru",
+                            owner_id=owner_id)
+        await mail_log.close()
+    asyncio.run(main())
+
+
+def test_batched_entries_are_read_back_newest_first():
+    _write(*[(1, f"buyer{i}@cater.ru") for i in range(5)])
+
+    entries = asyncio.run(mail_log.read(owner_id=1, limit=3))
+    assert [e["to_email"] for e in entries] == ["buyer4@cater.ru", "buyer3@cater.ru", "buyer2@cater.ru"]
+    assert entries[0]["body"] == "Текст для buyer4@cater.ru"
+    older = asyncio.run(mail_log.read(owner_id=1, before_id=entries[-1]["id"]))
+    assert [e["to_email"] for e in older] == ["buyer1@cater.ru", "buyer0@cater.ru"]
+
+
+def test_log_is_split_by_owner_not_by_sender_address():
+    _write((1, "a@cater.ru"), (2, "b@cater.ru"))
+    assert [e["to_email"] for e in asyncio.run(mail_log.read(owner_id=2))] == ["b@cater.ru"]
+    assert asyncio.run(mail_log.read(owner_id=3)) == []
+
+
+def test_old_log_without_owner_column_is_migrated_on_read(tmp_path, monkeypatch):
+    path = tmp_path / "old.sqlite3"
+    conn = sqlite3.connect(path)
+    conn.execute(mail_log_module._SCHEMA[0])
+    conn.execute("INSERT INTO sent_mail (sent_at, from_email, to_email) VALUES ('2024-01-01', 'sales@test.ru', 'x@y.ru')")
+    conn.commit()
+    conn.close()
+    monkeypatch.setattr(mail_log, "path", path)
+
+    # Записи до разделения ничьи: владельцу по from_email они не достаются
+    assert asyncio.run(mail_log.read(owner_id=1)) == []
+    assert len(asyncio.run(mail_log.read())) == 1
+
+
+def test_sent_log_endpoint_hides_letters_of_user_with_same_send_email(client, make_user, auth):
+    owner = make_user()
+    other = make_user(email="other@test.ru", send_email="sales@test.ru")
+    _write((owner.id, "buyer@cater.ru"))
+
+    assert client.get("/sent-log", headers=auth(other)).json()["entries"] == []
+    entries = client.get("/sent-log", headers=auth(owner)).json()["entries"]
+    assert [e["to_email"] for e in entries] == ["buyer@cater.ru"]
+
+
+def test_reads_do_not_redo_schema_setup(monkeypatch):
+    _write((1, "a@cater.ru"))
+    connects = []
+    real_connect = type(mail_log)._connect
+    monkeypatch.setattr(type(mail_log), "_connect", lambda self: connects.append(1) or real_connect(self))
+
+    for _ in range(3):
+        assert len(asyncio.run(mail_log.read(owner_id=1))) == 1
+    assert connects == []
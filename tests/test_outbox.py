@@ -0,0 +1,191 @@
+import asyncio
+import smtplib
+from datetime import datetime, timedelta
+
+import pytest
+
+from backend import body_store, email_sender, outbox
+from backend.database import ChatMessage, Company, OutboxMessage
+from backend.email_sender import PermanentSendError
+
+
+# ── email_sender: какие ошибки постоянные ──
+
+class FakeSMTP:
+    error = None
+    sent = []
+
+    def __init__(self, host, port, timeout):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def login(self, user, password):
+        pass
+
+    def send_message(self, msg, from_addr, to_addrs):
+        if FakeSMTP.error is not None:
+            raise FakeSMTP.error
+        FakeSMTP.sent.append((msg, from_addr, to_addrs))
+
+
+@pytest.fixture
+def smtp(monkeypatch):
+    monkeypatch.setattr(email_sender, "DEMO_MODE", False)
+    monkeypatch.setattr(email_sender, "GMAIL_USER", "robot@gmail.com")
+    monkeypatch.setattr(email_sender, "GMAIL_APP_PASSWORD", "app-password")
+    monkeypatch.setattr(email_sender.smtplib, "SMTP_SSL", FakeSMTP)
+    FakeSMTP.error, FakeSMTP.sent = None, []
+    return FakeSMTP
+
+
+def _send(to="buyer@cater.ru"):
+    return asyncio.run(email_sender.send_email(to, "Тема", "Текст", None, from_email="sales@test.ru"))
+
+
+def test_invalid_address_is_permanent_even_in_demo():
+    with pytest.raises(PermanentSendError):
+        _send("info@")
+
+
+def test_smtp_success_sends_from_authenticated_mailbox(smtp):
+    assert _send() is True
+    msg, from_addr, to_addrs = smtp.sent[0]
+    assert from_addr == "robot@gmail.com" and to_addrs == ["buyer@cater.ru"]
+    assert msg["Reply-To"] == "sales@test.ru"
+
+
+@pytest.mark.parametrize("error", [
+    smtplib.SMTPRecipientsRefused({"buyer@cater.ru": (550, b"5.1.1 No such user")}),
+    smtplib.SMTPDataError(554, b"5.7.1 Message rejected"),
+])
+def test_smtp_5xx_is_permanent(smtp, error):
+    smtp.error = error
+    with pytest.raises(PermanentSendError, match="SMTP 55"):
+        _send()
+
+
+@pytest.mark.parametrize("error", [
+    smtplib.SMTPRecipientsRefused({"buyer@cater.ru": (450, b"4.2.1 Mailbox busy")}),
+    smtplib.SMTPDataError(451, b"4.3.0 Try later"),
+    smtplib.SMTPServerDisconnected("connection lost"),
+])
+def test_smtp_transient_errors_are_not_permanent(smtp, error):
+    smtp.error = error
+    with pytest.raises(smtplib.SMTPException) as info:
+        _send()
+    assert not isinstance(info.value, PermanentSendError)
+
+
+# ── outbox: повторы, dead letter, статус компании ──
+
+def _queued(db, make_user, make_company, status="new", **fields):
+    user = make_user()
+    comp = make_company(user, email="buyer@cater.ru", status=status, email_subject="Тема",
+                        email_body_hash=body_store.put(db, "Текст письма"))
+    msg = outbox.enqueue(db, comp, user, None, "timeout")
+    msg.next_attempt_at = datetime.utcnow() - timedelta(seconds=1)
+    for key, value in fields.items():
+        setattr(msg, key, value)
+    db.commit()
+    return user, comp, msg
+
+
+def _fake_send(monkeypatch, result):
+    calls = []
+
+    async def send(to_email, subject, body, attachment_path=None, from_email="", owner_id=0):
+        calls.append((to_email, body))
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    monkeypatch.setattr(outbox, "send_email", send)
+    return calls
+
+
+def test_backoff_grows_and_is_capped():
+    for attempts in range(1, 12):
+        delay = outbox.backoff_delay(attempts)
+        full = min(outbox._MAX_DELAY, outbox._BASE_DELAY * 2 ** (attempts - 1))
+        assert full / 2 <= delay <= full
+
+
+def test_delivery_marks_company_and_writes_chat(db, make_user, make_company, monkeypatch):
+    user, comp, msg = _queued(db, make_user, make_company)
+    calls = _fake_send(monkeypatch, True)
+
+    assert asyncio.run(outbox.process_due()) == 1
+
+    db.expire_all()
+    assert calls == [("buyer@cater.ru", "Текст письма")]
+    assert db.get(OutboxMessage, msg.id).state == "sent"
+    assert db.get(Company, comp.id).status == "email_sent"
+    assert db.query(ChatMessage).filter_by(company_id=comp.id).one().body_hash == comp.email_body_hash
+
+
+def test_delivery_keeps_status_changed_while_queued(db, make_user, make_company, monkeypatch):
+    user, comp, msg = _queued(db, make_user, make_company, status="interested")
+    _fake_send(monkeypatch, True)
+
+    asyncio.run(outbox.process_due())
+
+    db.expire_all()
+    saved = db.get(Company, comp.id)
+    assert saved.status == "interested" and saved.email_sent_at is not None
+
+
+def test_permanent_error_goes_to_dead_letter_at_once(db, make_user, make_company, monkeypatch):
+    _, comp, msg = _queued(db, make_user, make_company)
+    _fake_send(monkeypatch, PermanentSendError("SMTP 550: no such user"))
+
+    asyncio.run(outbox.process_due())
+
+    db.expire_all()
+    saved = db.get(OutboxMessage, msg.id)
+    assert saved.state == "dead" and saved.attempts == 2 and "550" in saved.last_error
+    assert db.get(Company, comp.id).status == "new"
+
+
+def test_transient_error_is_retried_later_until_attempts_run_out(db, make_user, make_company, monkeypatch):
+    _, _, msg = _queued(db, make_user, make_company)
+    _fake_send(monkeypatch, ConnectionError("reset"))
+
+    asyncio.run(outbox.process_due())
+    db.expire_all()
+    saved = db.get(OutboxMessage, msg.id)
+    assert saved.state == "pending" and saved.next_attempt_at > datetime.utcnow()
+
+    saved.attempts = outbox.MAX_ATTEMPTS - 1
+    saved.next_attempt_at = datetime.utcnow() - timedelta(seconds=1)
+    db.commit()
+    asyncio.run(outbox.process_due())
+    db.expire_all()
+    assert db.get(OutboxMessage, msg.id).state == "dead"
+
+
+def test_claim_is_exclusive(db, make_user, make_company, monkeypatch):
+    _queued(db, make_user, make_company)
+    calls = _fake_send(monkeypatch, True)
+
+    async def two_workers():
+        return await asyncio.gather(outbox.process_due(), outbox.process_due())
+
+    assert sorted(asyncio.run(two_workers())) == [0, 1]
+    assert len(calls) == 1
+
+
+def test_send_endpoint_dead_letters_invalid_address(client, db, make_user, make_company, auth):
+    user = make_user()
+    comp = make_company(user, email="info@broken", email_subject="Тема",
+                        email_body_hash=body_store.put(db, "Текст"))
+    db.commit()
+
+    resp = client.post(f"/send-email/{comp.id}", headers=auth(user))
+
+    assert resp.status_code == 500 and resp.json()["detail"] == "Адрес отвергнут получателем"
+    assert db.query(OutboxMessage).filter_by(company_id=comp.id).one().state == "dead"
@@ -0,0 +1,78 @@
+import asyncio
+import threading
+
+from backend import profiler as profiler_module
+from backend.coordination import MemoryBackend, set_backend
+from backend.profiler import SamplingProfiler, _Request
+
+
+def _busy_worker(stop: list):
+    # Без вызовов из threading.py: такие кадры профилировщик считает простоем
+    while not stop:
+        sum(range(100))
+
+
+def _sample_with_busy_thread(tasks_count: int):
+    """Один сэмпл при tasks_count идущих запросах и одном занятом потоке."""
+    stop = []
+    worker = threading.Thread(target=_busy_worker, args=(stop,), name="worker-1")
+    worker.start()
+
+    async def main():
+        prof = SamplingProfiler()
+        prof._loop = asyncio.get_running_loop()
+        prof._loop_thread = threading.get_ident()
+        tasks = [asyncio.create_task(asyncio.sleep(10)) for _ in range(tasks_count)]
+        await asyncio.sleep(0)
+        prof._active = {i: _Request(task) for i, task in enumerate(tasks)}
+        prof._sample()
+        for task in tasks:
+            task.cancel()
+        return [request.samples for request in prof._active.values()]
+
+    try:
+        return asyncio.run(main())
+    finally:
+        stop.append(True)
+        worker.join()
+
+
+def _thread_keys(samples):
+    return [key for key in samples if "[thread worker-1]" in key]
+
+
+def test_thread_samples_belong_to_single_active_request():
+    (samples,) = _sample_with_busy_thread(1)
+    keys = _thread_keys(samples)
+    assert keys and all(key.startswith("[thread worker-1];") for key in keys)
+
+
+def test_thread_samples_are_tagged_shared_between_requests():
+    for samples in _sample_with_busy_thread(2):
+        keys = _thread_keys(samples)
+        assert keys and all(key.startswith("[shared];[thread worker-1];") for key in keys)
+
+
+def test_threshold_is_shared_between_workers(monkeypatch):
+    monkeypatch.setattr(profiler_module, "_THRESHOLD_REFRESH", 0)
+    set_backend(MemoryBackend())
+    first, second = SamplingProfiler(), SamplingProfiler()
+
+    async def main():
+        before = await second.threshold()
+        await first.set_threshold(1500)
+        return before, await second.threshold()
+
+    assert asyncio.run(main()) == (0, 1500)
+
+
+def test_threshold_endpoint(client, monkeypatch):
+    monkeypatch.setattr(profiler_module, "TOKEN", "secret-token")
+    monkeypatch.setattr(profiler_module.profiler, "threshold_ms", 0)
+    monkeypatch.setattr(profiler_module.profiler, "_threshold_checked", float("-inf"))
+    headers = {"X-Profile-Token": "secret-token"}
+
+    assert client.put("/debug/profiler", json={"threshold_ms": -5}, headers=headers).json() == {"threshold_ms": 0}
+    client.put("/debug/profiler", json={"threshold_ms": 2000}, headers=headers)
+    assert client.get("/debug/profiles", headers=headers).json()["threshold_ms"] == 2000
+    assert client.get("/debug/profiles", headers={"X-Profile-Token": "wrong"}).status_code == 403
@@ -0,0 +1,81 @@
+import asyncio
+import sys
+import types
+
+import pytest
+
+from backend import email_generator, resilience
+from backend.resilience import AdaptiveTimeout, CircuitBreaker, CircuitOpenError
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(resilience.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_breaker_opens_after_threshold_and_rejects(clock):
+    breaker = CircuitBreaker("tavily", failure_threshold=2, recovery_time=30)
+    breaker.record_failure()
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert not breaker.allow()
+    with pytest.raises(CircuitOpenError):
+        breaker.check()
+
+
+def test_half_open_lets_one_probe_through(clock):
+    breaker = CircuitBreaker("tavily", failure_threshold=1, recovery_time=30)
+    breaker.record_failure()
+    clock[0] += 31
+    assert breaker.allow()
+    assert not breaker.allow()          # второй запрос ждёт итога пробы
+    breaker.record_failure()
+    assert breaker.state == "open"
+    clock[0] += 31
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == "closed" and breaker.allow()
+
+
+def test_adaptive_timeout_follows_p95_within_bounds():
+    timeout = AdaptiveTimeout(default=30, minimum=2)
+    for _ in range(4):
+        timeout.observe(1.0)
+    assert timeout.timeout() == 30
+    assert timeout.timeout(fallback=8) == 8
+    timeout.observe(1.0)
+    assert timeout.timeout() == 3.0
+    for _ in range(50):
+        timeout.observe(20.0)
+    assert timeout.timeout() == 30
+
+
+def test_host_breaker_opens_on_first_failure():
+    dep = resilience.host_dependency("slow.ru", 8)
+    dep.record_failure()
+    assert not dep.breaker.allow()
+    assert resilience.snapshot()["hosts"] == {"tracked": 1, "open": 1}
+
+
+def test_letter_failures_do_not_open_extraction_breaker(monkeypatch):
+    class FailingCompletions:
+        def create(self, **kwargs):
+            raise TimeoutError("gpt-4o timeout")
+
+    class FakeOpenAI:
+        def __init__(self, **kwargs):
+            self.chat = types.SimpleNamespace(completions=FailingCompletions())
+
+    monkeypatch.setitem(sys.modules, "openai", types.SimpleNamespace(OpenAI=FakeOpenAI))
+    monkeypatch.setattr(email_generator, "OPENAI_API_KEY", "key")
+
+    for _ in range(3):
+        letter = asyncio.run(email_generator.generate_email("Вкус", "Кейтеринг"))
+        assert "Вкус" in letter["body"]          # запасной шаблон
+
+    deps = resilience.snapshot()["dependencies"]
+    assert deps["openai:letters"]["state"] == "open"
+    assert resilience.dependency("openai:extract", 60).breaker.allow()
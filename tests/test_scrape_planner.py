@@ -0,0 +1,59 @@
+import asyncio
+from types import SimpleNamespace
+
+from backend import search_agent
+from backend.database import HostProfile
+from backend.resilience import host_dependency
+from backend.scrape_planner import ScrapePlanner, planner
+
+
+class FakeClient:
+    async def get(self, url, headers=None, timeout=None):
+        return SimpleNamespace(status_code=200, text="<a href='mailto:info@cater.ru'>", url=url)
+
+
+def test_concurrent_records_of_one_host_are_not_lost(db):
+    fresh = ScrapePlanner()
+
+    async def main():
+        await asyncio.gather(*(
+            fresh.record("cater.ru", pages=2, latency=0.1, email_path="/contacts", emails=1) for _ in range(20)
+        ))
+    asyncio.run(main())
+
+    saved = db.get(HostProfile, "cater.ru")
+    assert saved.visits == 20 and saved.pages_fetched == 40 and saved.emails_found == 20
+    assert fresh._locks == {}
+
+
+def test_planners_of_different_workers_do_not_overwrite_each_other(db):
+    first, second = ScrapePlanner(), ScrapePlanner()     # кэши двух воркеров
+
+    async def main():
+        await first.plan("cater.ru")
+        await second.plan("cater.ru")
+        await first.record("cater.ru", pages=2, latency=1.0, email_path="/contacts", emails=1)
+        await second.record("cater.ru", pages=3, latency=2.0, email_path="", emails=0)
+    asyncio.run(main())
+
+    saved = db.get(HostProfile, "cater.ru")
+    assert saved.visits == 2 and saved.pages_fetched == 5 and saved.emails_found == 1
+    assert saved.empty_streak == 1 and abs(saved.avg_latency - 1.3) < 1e-9
+    assert second._cache["cater.ru"].visits == 2
+
+
+def test_real_fetch_is_counted():
+    stats = search_agent._FetchStats()
+    page = asyncio.run(search_agent._fetch_page(FakeClient(), "https://cater.ru/contacts", stats))
+    assert page[1] == "https://cater.ru/contacts" and stats.pages == 1
+
+
+def test_fetches_skipped_by_open_breaker_are_not_visits(db):
+    host_dependency("dead.ru", 10).record_failure()       # порог хоста — один сбой
+
+    stats = search_agent._FetchStats()
+    assert asyncio.run(search_agent._fetch_page(FakeClient(), "https://dead.ru/", stats)) is None
+    assert stats.pages == 0
+
+    assert asyncio.run(search_agent._scrape_emails_from_url("https://dead.ru/")) == []
+    assert db.get(HostProfile, "dead.ru") is None and planner._cache["dead.ru"].visits == 0
@@ -0,0 +1,30 @@
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+from bench_startup import LAZY_MODULES
+
+_ROOT = Path(__file__).resolve().parent.parent
+
+
+def _cold_import(tmp_path) -> set:
+    """Модули, загруженные чистым процессом после import backend.main."""
+    code = (
+        "import sys, backend.main; "
+        "print(' '.join(m for m in sys.modules if '.' not in m))"
+    )
+    env = dict(os.environ, DATABASE_PATH=str(tmp_path / "cold.db"))
+    out = subprocess.run([sys.executable, "-c", code], cwd=_ROOT, env=env,
+                         capture_output=True, text=True, check=True).stdout
+    return set(out.split())
+
+
+def test_import_does_not_load_heavy_sdks(tmp_path):
+    loaded = _cold_import(tmp_path)
+    assert not [m for m in LAZY_MODULES if m in loaded]
+
+
+def test_import_has_no_side_effects_on_disk(tmp_path):
+    _cold_import(tmp_path)
+    assert not (tmp_path / "cold.db").exists()
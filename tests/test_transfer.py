@@ -0,0 +1,54 @@
+import io
+
+from backend import main, transfer
+from backend.database import Company, SessionLocal
+
+
+def test_export_pages_by_id_without_holding_a_transaction(db, make_user, make_company, monkeypatch):
+    monkeypatch.setattr(transfer, "_BATCH_SIZE", 2)
+    user = make_user()
+    comps = [make_company(user) for _ in range(5)]
+    make_company(make_user(email="other@test.ru"))
+
+    sizes = []
+    for batch in transfer.export_batches(db, user.id):
+        sizes.append(len(batch))
+        assert not db.in_transaction()
+        # Пока клиент качает пачку, запись в БД не ждёт читателя
+        writer = SessionLocal()
+        writer.get(Company, comps[-1].id).status = "replied"
+        writer.commit()
+        writer.close()
+    assert sizes == [2, 2, 1]
+
+
+def test_export_escapes_formulas(db, make_user, make_company):
+    user = make_user()
+    make_company(user, name='=HYPERLINK("http://evil")', phone="+7 (495) 123-45-67", description="-5")
+
+    text = "".join(transfer.export_csv(transfer.export_batches(db, user.id)))
+    assert "'=HYPERLINK" in text and "'+7 (495) 123-45-67" in text and ",'-5," in text
+    assert transfer._cell(42) == "42" and transfer._cell("Обычный") == "Обычный"
+
+
+def test_exported_file_imports_with_original_values(db, make_user, make_company):
+    user = make_user()
+    make_company(user, name="@Кейтеринг", phone="+7 (495) 123-45-67", email="info@cater.ru")
+
+    data = "".join(transfer.export_csv(transfer.export_batches(db, user.id))).encode("utf-8")
+    rows = list(transfer.read_rows(io.BytesIO(data), "leads.csv"))
+    assert rows[0]["name"] == "@Кейтеринг" and rows[0]["phone"] == "+7 (495) 123-45-67"
+
+
+def test_search_results_and_import_normalize_email_alike(db, make_user, make_company):
+    user = make_user()
+    make_company(user, name="Старая", email="Sales@Cater.ru")       # сохранена до нормализации
+
+    added = main._save_new_companies(db, user.id, "Кейтеринг", [
+        {"name": "Дубль", "email": " SALES@cater.RU "},
+        {"name": "Новая", "email": "Info@New.RU"},
+    ])
+    assert [(c.name, c.email) for c in added] == [("Новая", "info@new.ru")]
+
+    csv_rows = list(transfer.read_rows(io.BytesIO("Название;Email\nИмпорт; Info@New.RU\n".encode()), "a.csv"))
+    assert csv_rows[0]["email"] == "info@new.ru"